@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+'''
+Benchmark the pipeline stages: time and peak memory of each stage on its own,
+and of the full pipeline, for several farm areas.  All runs are seeded and
+headless, so that two commits can be compared on identical work.  The stage
+inputs of each area are produced once, in a separate process, and stored in
+a `Checkpoint`.  Each measurement runs in a fresh process which loads the
+inputs of its stage from there, and then times the stage.  The peak RSS of
+the process is reset before the stage starts (linux only, see
+`hf.sim.instrument.reset_peak()`), so the reported peak is that of the stage,
+along with the RSS the stage started with (its inputs).
+
+The results are stored as json (`-o`); with `-b` the timings are compared to
+such a file from an earlier run.  The scaling exponent of a stage is the slope
+of its time over its number of input items in a log-log fit: around 1.0 means
+linear scaling, larger values point to super-linear stages.
+'''
+
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+
+import radical.utils as ru
+import hf.sim       as sim
+
+from hf.sim.cache      import code_version
+from hf.sim.checkpoint import STALKS, BAST, SPLICED, pack, unpack
+from hf.sim.instrument import maxrss, rss, peak_rss, reset_peak
+
+rep    = ru.LogReporter(name='hf')
+
+STAGES = ['grow', 'peel', 'cut', 'splice', 'sew', 'pipeline']
+
+# the prefix of the splice input in the stored SPLICED stage
+SPLICE_INPUT = 'splice_input'
+
+
+# ------------------------------------------------------------------------------
+#
+def prepare(args):
+    '''
+    produce the stage inputs for one area in this (fresh) process, and store
+    them in a checkpoint at `path`
+    '''
+
+    area, cfg, seed, path, quiet = args
+
+    if quiet:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    cfg  = area_cfg(cfg, area)
+    ctx  = sim.Context(plot=False, seed=seed)
+    ckpt = sim.Checkpoint(path)
+    ckpt.open(cfg, seed)
+
+    stalks = sim.grow_stalks(cfg, ctx)
+    ckpt.save(STALKS, stalks.to_arrays())
+
+    bast = sim.peel_stalks(cfg, ctx, stalks)
+    ckpt.save(BAST, bast.to_arrays())
+
+    # the stitcher drops the cut bast when splicing (and marks it spliced) -
+    # keep a copy as splice input
+    stitcher = sim.Stitcher(cfg['stitcher'], ctx=ctx)
+    stitcher.feed(bast)
+    stitcher.cut()
+    cut = dict([[name, arr.copy()]
+                for name, arr in unpack('cut', stitcher.checkpoint()).items()])
+    stitcher.splice()
+
+    arrays = stitcher.checkpoint()
+    arrays.update(pack(SPLICE_INPUT, cut))
+    ckpt.save(SPLICED, arrays)
+
+
+# ------------------------------------------------------------------------------
+#
+def area_cfg(cfg, area):
+    '''
+    return a copy of the cfg for a farm of the given area
+    '''
+
+    cfg = json.loads(json.dumps(cfg))
+    cfg['farmer']['areas'] = [area]
+
+    return cfg
+
+
+# ------------------------------------------------------------------------------
+#
+def load(ckpt, stage, prefix=None):
+    '''
+    load the arrays of a checkpointed stage (only those with the given prefix,
+    which is removed) into memory - not as memory maps, so that reading the
+    input does not count as stage memory
+    '''
+
+    arrays = ckpt.load(stage)
+    if prefix:
+        arrays = unpack(prefix, arrays)
+
+    return dict([[name, np.array(arr)] for name, arr in arrays.items()])
+
+
+# ------------------------------------------------------------------------------
+#
+# Each stage function gets cfg, context and the checkpoint with the stage
+# inputs, and loads the stage input.  It returns a function which runs the
+# stage, and one which returns the number of items the stage worked on (called
+# after the run).
+#
+def stage_grow(cfg, ctx, ckpt):
+
+    out = list()
+
+    return lambda: out.append(sim.grow_stalks(cfg, ctx)), \
+           lambda: len(out[0])
+
+
+def stage_peel(cfg, ctx, ckpt):
+
+    stalks = sim.StalkBatch.from_arrays(load(ckpt, STALKS))
+
+    return lambda: sim.peel_stalks(cfg, ctx, stalks), \
+           lambda: len(stalks)
+
+
+def stage_cut(cfg, ctx, ckpt):
+
+    bast = sim.BastBatch.from_arrays(load(ckpt, BAST))
+
+    return lambda: bast.cut(cfg['stitcher']['seg_length']), \
+           lambda: len(bast)
+
+
+def stage_splice(cfg, ctx, ckpt):
+
+    bast = sim.BastBatch.from_arrays(load(ckpt, SPLICED, SPLICE_INPUT))
+
+    return lambda: bast.splice(cfg['stitcher']['splice_width']), \
+           lambda: len(bast)
+
+
+def stage_sew(cfg, ctx, ckpt):
+
+    arrays   = dict()
+    for prefix in ['input', 'cut', 'spliced']:
+        arrays.update(pack(prefix, load(ckpt, SPLICED, prefix)))
+
+    spliced  = len(arrays['spliced.length'])
+    stitcher = sim.Stitcher(cfg['stitcher'], ctx=ctx)
+    stitcher.restore(arrays)
+
+    return stitcher.sew, \
+           lambda: spliced
+
+
+def stage_pipeline(cfg, ctx, ckpt):
+
+    # the stalk count is taken from the harvest statistics
+    return lambda: sim.run_pipeline(cfg, ctx=ctx), \
+           lambda: ctx.results['stalk_len']['n']
+
+
+# ------------------------------------------------------------------------------
+#
+def bench(args):
+    '''
+    run one stage for one area in this (fresh) process, and return a result
+    row
+    '''
+
+    stage, area, cfg, seed, path, quiet = args
+
+    if quiet:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    cfg = area_cfg(cfg, area)
+    ctx = sim.Context(plot=False, seed=seed)
+
+    run, count = globals()['stage_%s' % stage](cfg, ctx, sim.Checkpoint(path))
+
+    gc.collect()
+    if reset_peak(): scope, rss_in = 'stage',   rss()
+    else           : scope, rss_in = 'process', maxrss()
+
+    start = time.time()
+    run()
+    ttime = time.time() - start
+    items = int(count())
+
+    if scope == 'stage': rss_peak = peak_rss()
+    else               : rss_peak = maxrss()
+
+    return {'stage'    : stage,
+            'area'     : area,
+            'items'    : items,
+            'time'     : ttime,
+            'rate'     : items / ttime if ttime else None,
+            'rss_in'   : rss_in,
+            'rss_peak' : rss_peak,
+            'rss_grow' : rss_peak - rss_in,
+            'rss_scope': scope}
+
+
+# ------------------------------------------------------------------------------
+#
+def scaling(rows):
+    '''
+    return the scaling exponent of time over items (log-log least squares fit)
+    per stage
+    '''
+
+    ret = dict()
+    for stage in STAGES:
+        pts = [[r['items'], r['time']] for r in rows
+               if r['stage'] == stage and r['items'] and r['time']]
+        if len(pts) < 2:
+            continue
+        x, y       = np.log(np.array(pts, dtype=float)).T
+        ret[stage] = float(np.polyfit(x, y, 1)[0])
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+def fresh(func, task):
+    '''
+    run func(task) in a fresh process, so that the memory of one measurement
+    does not carry over to the next
+    '''
+
+    pool = mp.Pool(1)
+    try:
+        return pool.apply(func, [task])
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# ------------------------------------------------------------------------------
+#
+parser = argparse.ArgumentParser(
+        description='benchmark the hf.sim pipeline stages at several farm '
+                    'areas')
+parser.add_argument('-a', '--areas',    default='100,1000,10000',
+                    help='comma separated farm areas in m^2 '
+                         '(default: 100,1000,10000)')
+parser.add_argument('-c', '--cfg',      default=None,
+                    help='json configuration (default: hf.sim.DEFAULT_CFG)')
+parser.add_argument('-t', '--stages',   default=','.join(STAGES),
+                    help='comma separated stages (default: %s)'
+                         % ','.join(STAGES))
+parser.add_argument('-r', '--repeat',   default=1, type=int,
+                    help='repetitions per measurement, the fastest one is '
+                         'reported (default: 1)')
+parser.add_argument('-s', '--seed',     default=42, type=int,
+                    help='seed (default: 42)')
+parser.add_argument('-o', '--output',   default=None,
+                    help='write the results to this json file')
+parser.add_argument('-b', '--baseline', default=None,
+                    help='compare to the results in this json file')
+parser.add_argument('-p', '--plot',     default=None,
+                    help='plot the scaling curves into this directory')
+parser.add_argument('-v', '--verbose',  action='store_true',
+                    help='show the stage reports')
+args = parser.parse_args()
+
+cfg    = sim.get_cfg(args.cfg)
+areas  = [int(a)   for a in args.areas .split(',')]
+stages = [s.strip() for s in args.stages.split(',')]
+
+for stage in stages:
+    if stage not in STAGES:
+        parser.error('unknown stage %s' % stage)
+
+tmp  = tempfile.mkdtemp(prefix='hf_sim_bench.')
+rows = list()
+
+try:
+    # stage inputs are only needed for the single stages after `grow`
+    if [stage for stage in stages if stage not in ['grow', 'pipeline']]:
+        for area in areas:
+            fresh(prepare, [area, cfg, args.seed, '%s/%d' % (tmp, area),
+                            not args.verbose])
+
+    for stage in stages:
+        for area in areas:
+
+            runs = [fresh(bench, [stage, area, cfg, args.seed,
+                                  '%s/%d' % (tmp, area), not args.verbose])
+                    for _ in range(args.repeat)]
+            row  = min(runs, key=lambda r: r['time'])
+            rows.append(row)
+            rep.plain('%-8s %8d m^2 %10d items %9.3f s %12.0f items/s '
+                      '%8.1f MB (+%.1f MB)%s\n'
+                     % (stage, area, row['items'], row['time'],
+                        row['rate'] or 0, row['rss_peak'], row['rss_grow'],
+                        '*' if row['rss_scope'] == 'process' else ''))
+
+finally:
+    shutil.rmtree(tmp)
+
+if [row for row in rows if row['rss_scope'] == 'process']:
+    rep.plain('* peak RSS of the process, including the input loading\n')
+
+exponents = scaling(rows)
+
+rep.header('Scaling exponents (time over items)')
+for stage in stages:
+    if stage in exponents:
+        rep.plain('%-8s %6.2f\n' % (stage, exponents[stage]))
+
+if args.baseline:
+
+    with open(args.baseline, 'r') as fin:
+        base = json.load(fin)
+
+    base_rows = dict([[(r['stage'], r['area']), r] for r in base['results']])
+
+    rep.header('Compared to %s (%s)' % (args.baseline,
+                                        base['meta']['code_version'][:8]))
+    for row in rows:
+        old = base_rows.get((row['stage'], row['area']))
+        if not old:
+            continue
+        rep.plain('%-8s %8d m^2 %9.3f s -> %9.3f s  x%5.2f   '
+                  '%8.1f MB -> %8.1f MB\n'
+                 % (row['stage'], row['area'], old['time'], row['time'],
+                    old['time'] / row['time'] if row['time'] else 0,
+                    old['rss_peak'], row['rss_peak']))
+
+if args.plot:
+
+    ctx = sim.Context(path=args.plot)
+    for stage in stages:
+        data = [[r['items'], r['time']] for r in rows if r['stage'] == stage]
+        ctx.line_plot(fname='bench_%s' % stage,
+                      title='Stage Runtime (%s)' % stage,
+                      ptitle=stage,
+                      xlabel='number of items',
+                      ylabel='time [s]',
+                      data=data)
+    ctx.close()
+
+if args.output:
+    with open(args.output, 'w') as fout:
+        json.dump({'meta'   : {'code_version': code_version(),
+                               'seed'        : args.seed,
+                               'areas'       : areas,
+                               'repeat'      : args.repeat,
+                               'cfg'         : cfg,
+                               'python'      : sys.version.split()[0],
+                               'numpy'       : np.__version__},
+                   'results': rows,
+                   'scaling': exponents}, fout, indent=2, sort_keys=True)
+    rep.info('results written to %s\n' % args.output)
+
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+'''
+Micro-benchmark for the `Thing` state machine: per-object memory, construction
+and state transition times of the current `hf.sim.Thing`, compared to the
+former implementation (a state model list, state string, index and uid slot
+stored in each instance's `__dict__`), which is replicated below.  The results
+can be written as json (`-j`).
+'''
+
+import sys
+import json
+import timeit
+import argparse
+
+import radical.utils as ru
+import hf.sim       as sim
+
+from hf.sim.cache import code_version
+
+rep    = ru.LogReporter(name='hf')
+
+N      = 100000
+STATES = ['a', 'b', 'c', 'd', 'e']
+
+
+# ------------------------------------------------------------------------------
+#
+class LegacyThing(object):
+
+    def __init__(self, model, name=None):
+
+        self._model = model
+        self._sidx  = 0
+        self._state = model[0]
+        self._uid   = None
+
+    def advance(self):
+
+        assert(self._state in self._model)
+        assert(self._sidx  < (len(self._model)-1))
+
+        self._sidx  += 1
+        self._state  = self._model[self._sidx]
+
+
+class NewThing(sim.Thing):
+
+    __slots__ = list()
+
+    MODEL     = STATES
+
+
+# ------------------------------------------------------------------------------
+#
+def size(obj):
+
+    ret = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        ret += sys.getsizeof(obj.__dict__)
+
+    return ret
+
+
+def bench(stmt, number):
+
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e9
+
+
+# ------------------------------------------------------------------------------
+#
+# the legacy implementation reaches a given state by advancing to it
+def in_state_legacy():
+    LegacyThing(STATES).advance()
+
+def in_state_new():
+    NewThing(state='b')
+
+# four transitions through the model, on fresh objects
+def advance_legacy():
+    thing = LegacyThing(STATES)
+    for _ in range(4): thing.advance()
+
+def advance_new():
+    thing = NewThing()
+    for _ in range(4): thing.advance()
+
+
+# ------------------------------------------------------------------------------
+#
+parser = argparse.ArgumentParser(
+        description='benchmark the hf.sim Thing state machine against the '
+                    'former implementation')
+parser.add_argument('-n', '--number', default=N, type=int,
+                    help='calls per timing (default: %d)' % N)
+parser.add_argument('-j', '--json',   default=None,
+                    help='write the results to this json file (- for stdout)')
+args = parser.parse_args()
+
+n      = args.number
+legacy = LegacyThing(STATES)
+new    = NewThing()
+rows   = [['object size [bytes]', size(legacy), size(new)],
+          ['construct [ns]',
+           bench(lambda: LegacyThing(STATES), n), bench(lambda: NewThing(), n)],
+          ['construct in state [ns]',
+           bench(in_state_legacy, n), bench(in_state_new, n)],
+          ['construct + 4 advances [ns]',
+           bench(advance_legacy, n), bench(advance_new, n)]]
+
+# the batch views which are created per stalk / bast
+views  = {'stalk': size(sim.Stalk(length=1.0, diameter=1.0)),
+          'bast' : size(sim.Bast(length=1.0, width=[2, 1]))}
+
+rep.header('Thing: legacy vs. slots')
+rep.plain('%-28s %10s %10s %8s\n' % ('', 'legacy', 'slots', 'ratio'))
+for name, old, cur in rows:
+    rep.plain('%-28s %10.1f %10.1f %8.2f\n'
+             % (name, old, cur, float(old) / cur))
+
+rep.header('Batch views')
+rep.plain('Stalk view size [bytes]: %d\n' % views['stalk'])
+rep.plain('Bast  view size [bytes]: %d\n' % views['bast'])
+
+if args.json:
+    data = {'meta'   : {'code_version': code_version(),
+                        'number'      : n,
+                        'python'      : sys.version.split()[0]},
+            'results': [{'name'  : name,
+                         'legacy': old,
+                         'slots' : cur,
+                         'ratio' : float(old) / cur}
+                        for name, old, cur in rows],
+            'views'  : views}
+
+    if args.json == '-':
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+    else:
+        with open(args.json, 'w') as fout:
+            json.dump(data, fout, indent=2, sort_keys=True)
+        rep.info('results written to %s\n' % args.json)
+
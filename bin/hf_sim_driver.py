@@ -1,6 +1,10 @@
 #!/usr/bin/env python 
 
+import os
 import sys
+import json
+import argparse
+import binascii
 
 import radical.utils as ru
 import hf.sim       as sim
@@ -10,58 +14,83 @@ flat   = sim.create_flat_distribution
 rep    = ru.LogReporter(name='hf')
 
 
-cfg = { 'farmer'   : {'sprout'          : {'min'  :   50,
-                                           'max'  :  100,
-                                           'mean' :   75,
-                                           'var'  :    5
-                                          },
-                      'length'          : {'min'  : 1000,
-                                           'max'  : 2500,
-                                           'mean' : 2000,
-                                           'var'  :    5
-                                          },
-                      'diameter'        : {'min'  :    4,
-                                           'max'  :   15,
-                                          },
-                     },
-        'peeler'   : {'min_len'         :   300,
-                      'max_len'         :  1600, 
-                      'min_dia'         :     6,
-                      'max_dia'         :    12,
-                      'prep_efficiency' :    99,  # in percent
-                      'peel_efficiency' :    90,  # in percent
-
-                      'success_min'     :     0,  # in percent of stalk length
-                      'success_max'     :   100,
-                      'success_mean'    :    90,
-                      'success_var'     :     1,
-                     },
-        'stitcher' : {'resolution'      :    10,
-                      'splice_width'    :     7,
-                      'seg_width'       :    12,
-                      'seg_length'      :   500, 
-                      'mode'            :  'continuous'
-                     },
-      }
-
-
-farmer = sim.Farmer(cfg['farmer'])
-farmer.plant(areas=200)
-farmer.harvest()
-farmer.dry()
-stalks = farmer.get()
-
-peeler = sim.Peeler(cfg['peeler'])
-peeler.feed(stalks)
-peeler.select()
-peeler.cut()
-bast = peeler.peel()
-
-stitcher = sim.Stitcher(cfg['stitcher'])
-stitcher.feed(bast)
-stitcher.cut()
-stitcher.splice()
-bht = stitcher.sew()
+parser = argparse.ArgumentParser(description='run a single hf.sim simulation')
+parser.add_argument('cfg',                nargs='?', default=None,
+                    help='json configuration (default: hf.sim.DEFAULT_CFG)')
+parser.add_argument('-s', '--seed',       default=None, type=int,
+                    help='random seed (default: random)')
+parser.add_argument('-w', '--workers',    default=1, type=int,
+                    help='number of processes for parallel stages (default: 1)')
+parser.add_argument('-k', '--checkpoint', default=None,
+                    help='checkpoint directory: store the stage outputs, and '
+                         'resume after the latest completed stage')
+parser.add_argument('-t', '--stream',     action='store_true',
+                    help='stream the stages tile by tile, so that memory does '
+                         'not grow with the farm size (no checkpoints)')
+parser.add_argument('-P', '--profile',    default=None,
+                    help='profile the stages: cprofile or tracemalloc, '
+                         'optionally followed by :stage,.. (default: '
+                         '$HF_SIM_PROFILE)')
+parser.add_argument('-e', '--export',     default=None,
+                    help='export the stalk, bast, spliced bast and BHT tables '
+                         'as columnar files into this directory')
+parser.add_argument('-f', '--format',     default=None,
+                    help='export format: parquet, arrow (both need pyarrow) '
+                         'or npy (default: parquet if available, else npy)')
+parser.add_argument('-r', '--report',     default=None,
+                    help='write the run report (metrics, stage measurements '
+                         'and scrap) to this json file')
+args = parser.parse_args()
+
+if args.stream and args.checkpoint:
+    parser.error('streamed runs cannot be checkpointed')
+
+if args.stream and args.export:
+    parser.error('streamed runs cannot be exported')
+
+cfg  = sim.get_cfg(args.cfg)
+seed = args.seed
+
+try:
+    sim.validate_cfg(cfg)
+except ValueError as e:
+    parser.error(str(e))
+
+ckpt = None
+expo = None
+
+if args.checkpoint:
+    # a checkpointed run needs a seed to be resumed exactly - reuse the one of
+    # an existing checkpoint
+    ckpt = sim.Checkpoint(args.checkpoint)
+    if seed is None: seed = ckpt.seed
+    if seed is None: seed = int(binascii.hexlify(os.urandom(4)), 16)
+
+if args.export:
+    try:
+        expo = sim.Exporter(args.export, fmt=args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+ctx = sim.Context(seed=seed, workers=args.workers, profile=args.profile)
+if args.stream: bht = sim.stream_pipeline(cfg, ctx=ctx)
+else          : bht = sim.run_pipeline(cfg, ctx=ctx, checkpoint=ckpt,
+                                       export=expo)
 
 bht.stats()
+ctx.ledger.report()
+ctx.instrument.report()
+
+if args.report:
+    with open(args.report, 'w') as fout:
+        json.dump({'seed'   : seed,
+                   'cfg'    : cfg,
+                   'metrics': bht.metrics(),
+                   'stages' : ctx.instrument.result(),
+                   'scrap'  : ctx.ledger.rows()}, fout, indent=2,
+                  sort_keys=True)
+    rep.info('report written to %s\n' % args.report)
+
+# wait for the plots to be rendered, and stop the renderer
+ctx.close()
 
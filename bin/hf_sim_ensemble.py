@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import argparse
+
+import radical.utils as ru
+import hf.sim       as sim
+
+rep    = ru.LogReporter(name='hf')
+
+
+parser = argparse.ArgumentParser(
+        description='run a Monte Carlo ensemble of hf.sim replicates and '
+                    'report the BHT metrics')
+parser.add_argument('-c', '--cfg',      default=None,
+                    help='json configuration (default: hf.sim.DEFAULT_CFG)')
+parser.add_argument('-n', '--replicas', default=16, type=int,
+                    help='number of replicates (default: 16)')
+parser.add_argument('-s', '--seed',     default=None, type=int,
+                    help='root seed (default: random)')
+parser.add_argument('-w', '--workers',  default=None, type=int,
+                    help='number of worker processes (default: all cores)')
+parser.add_argument('-o', '--output',   default=None,
+                    help='write summary and per-replicate metrics to this '
+                         'json file')
+parser.add_argument('-C', '--cache',    default=None,
+                    help='stage cache directory (default: no cache)')
+parser.add_argument('-S', '--cache-size', default=1024, type=int,
+                    help='stage cache size limit in MB (default: 1024)')
+args = parser.parse_args()
+
+
+cfg      = sim.get_cfg(args.cfg)
+ensemble = sim.Ensemble(cfg, n=args.replicas, seed=args.seed,
+                        workers=args.workers, cache=args.cache,
+                        cache_size=args.cache_size * 1024 ** 2)
+summary  = ensemble.run()
+
+rep.header('BHT metrics (%d replicates, seed %s)'
+          % (args.replicas, ensemble.seed))
+
+for key in sorted(summary):
+    res = summary[key]
+    rep.plain('%-16s: %10.4f +/- %8.4f  [%10.4f .. %10.4f]  (n=%d)\n'
+             % (key, res['mean'], res['std'], res['ci'][0], res['ci'][1],
+                res['n']))
+
+if args.output:
+    with open(args.output, 'w') as fout:
+        json.dump({'seed'    : ensemble.seed,
+                   'cfg'     : cfg,
+                   'summary' : summary,
+                   'metrics' : ensemble.metrics}, fout, indent=2,
+                  sort_keys=True)
+    rep.info('metrics written to %s\n' % args.output)
+
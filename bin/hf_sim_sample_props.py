@@ -1,38 +1,326 @@
-#!/usr/bin/env python 
+#!/usr/bin/env python
+
+'''
+Column statistics of data files (`.dat` plot data as written by a run, or
+`.npy` arrays, like those of an export): count, mean, standard deviation, min,
+max, quantiles and histogram for every column.
+
+The stage histograms of a run are not written as samples but as binned
+`(center, count)` rows, under a `# n: .. mean: .. std: .. min: .. max: ..`
+header.  Such files are recognized by that header, and result in the
+statistics of the one binned value: count, mean, standard deviation, min and
+max are taken from the header, histogram and quantiles from the bins.
+
+Each file is read once, in chunks: text is parsed by numpy a block at a time
+(not line by line), `.npy` files are memory mapped.  All columns of a chunk
+update their `hf.sim.Accumulator` together (Welford moments, histogram and
+quantile sketch), so memory does not grow with the file size.  Several files
+are processed in parallel, and with `-m` the statistics of all files are
+merged per column.  Results are reported as text, and written as json (`-j`)
+and / or csv (`-c`).
+'''
 
 import os
+import re
 import sys
-import numpy
-
-fname = sys.argv[1]
-rows  = list()
-with open('%s.dat' % fname, 'r') as fin:
-    for line in fin.readlines():
-        line = line.strip()
-        if not line or line.startswith('#'):
-            continue
-        rows.append(line.split())
-
-nrows = len(rows[0])
-for row in rows:
-    if len(row) != nrows:
-        raise ValueError('inconsistent data')
-
-for n in range(nrows):
-
-    vals = list()
-    for row in rows:
-        vals.append(float(row[n]))
-
-    with open('%s.row.%d' % (fname, n+1), 'w') as fout:
-        for val in vals:
-            fout.write('%f\n' % val) 
-
-    print 'row : %7d '  % (n+1)
-    print 'min : %7.2f' % min(vals)
-    print 'max : %7.2f' % max(vals)
-    print 'mean: %7.2f' % numpy.mean(vals)
-    print 'var : %7.2f' % numpy.std(vals)
-
-    print
+import csv
+import json
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+import radical.utils as ru
+import hf.sim       as sim
+
+rep = ru.LogReporter(name='hf')
+
+# bytes of text (or rows of a `.npy` file) per chunk
+CHUNK = 4 * 1024 * 1024
+
+# the quantiles reported in csv output
+QUANTILES = sim.Accumulator.QUANTILES
+
+# the header of binned histogram files, as written by `hf.sim.Context`
+BINNED = re.compile(r'^#\s*n:\s*(\S+)\s+mean:\s*(\S+)\s+std:\s*(\S+)'
+                    r'\s+min:\s*(\S+)\s+max:\s*(\S+)')
+
+
+# ------------------------------------------------------------------------------
+#
+def _parse(text, ncols, fname):
+    '''
+    parse a block of complete lines into an array of `ncols` columns
+    '''
+
+    if '#' in text or '\n\n' in text:
+        text = '\n'.join([line for line in text.split('\n')
+                          if line.strip() and not line.lstrip().startswith('#')])
+        if text:
+            text += '\n'
+
+    nrows = text.count('\n')
+    vals  = np.fromstring(text, sep=' ')
+
+    if len(vals) != nrows * ncols:
+        raise ValueError('inconsistent data in %s' % fname)
+
+    return vals.reshape(nrows, ncols)
+
+
+# ------------------------------------------------------------------------------
+#
+def _ncols(fname):
+    '''
+    number of columns of a text file (from the first data line)
+    '''
+
+    with open(fname, 'r') as fin:
+        for line in fin:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                return len(line.split())
+
+    return 0
+
+
+# ------------------------------------------------------------------------------
+#
+def binned_header(fname):
+    '''
+    return n, mean, std, min and max from the header of a binned histogram
+    file, or None if the file is no such file
+    '''
+
+    if fname.endswith('.npy'):
+        return None
+
+    with open(fname, 'r') as fin:
+        match = BINNED.match(fin.readline())
+
+    if not match:
+        return None
+
+    return [None if val == 'None' else float(val) for val in match.groups()]
+
+
+# ------------------------------------------------------------------------------
+#
+def sample_binned(fname, header, chunk):
+    '''
+    return the accumulator of the binned value of a histogram file
+    '''
+
+    n, mean, std, vmin, vmax = header
+
+    acc  = sim.Accumulator()
+    data = np.loadtxt(fname, ndmin=2)
+
+    # the bins of the file are bins of an `hf.sim.Histogram`, so their centers
+    # fall into the same bins again
+    for center, count in data[:,:2]:
+        count = int(count)
+        for start in range(0, count, chunk):
+            values = np.full(min(chunk, count - start), center)
+            acc.hist  .update(values)
+            acc.sketch.update(values)
+
+    if n:
+        acc.moments.n    = int(n)
+        acc.moments.mean = mean
+        acc.moments.m2   = std ** 2 * n
+        acc.moments.min  = vmin
+        acc.moments.max  = vmax
+
+    return fname, [acc]
+
+
+# ------------------------------------------------------------------------------
+#
+def read_chunks(fname, chunk=CHUNK):
+    '''
+    yield the data of a `.dat` or `.npy` file as 2D arrays of up to `chunk`
+    bytes of text, or `chunk` rows
+    '''
+
+    if fname.endswith('.npy'):
+        data = np.load(fname, mmap_mode='r')
+        data = data.reshape(len(data), -1)
+        for start in range(0, len(data), chunk):
+            yield np.asarray(data[start:start + chunk], dtype=float)
+        return
+
+    ncols = _ncols(fname)
+    if not ncols:
+        return
+
+    rest = ''
+    with open(fname, 'r') as fin:
+        while True:
+            data = fin.read(chunk)
+            if not data:
+                break
+            data = rest + data
+            cut  = data.rfind('\n') + 1
+            data, rest = data[:cut], data[cut:]
+            if data:
+                yield _parse(data, ncols, fname)
+
+    if rest.strip():
+        yield _parse(rest + '\n', ncols, fname)
+
+
+# ------------------------------------------------------------------------------
+#
+def sample(args):
+    '''
+    return the column accumulators of one file (one pass over the file)
+    '''
+
+    fname, chunk, split = args
+    accs  = list()
+    outs  = list()
+
+    header = binned_header(fname)
+    if header:
+        return sample_binned(fname, header, chunk)
+
+    try:
+        for data in read_chunks(fname, chunk):
+
+            if not accs:
+                accs = [sim.Accumulator() for _ in range(data.shape[1])]
+                if split:
+                    outs = [open('%s.row.%d' % (os.path.splitext(fname)[0],
+                                                n + 1), 'w')
+                            for n in range(data.shape[1])]
+
+            if data.shape[1] != len(accs):
+                raise ValueError('inconsistent data in %s' % fname)
+
+            for n, acc in enumerate(accs):
+                acc.update(data[:,n])
+                if outs:
+                    np.savetxt(outs[n], data[:,n], fmt='%f')
+
+    finally:
+        for out in outs:
+            out.close()
+
+    return fname, accs
+
+
+# ------------------------------------------------------------------------------
+#
+def as_dict(acc):
+    '''
+    json serializable statistics of an accumulator
+    '''
+
+    res = acc.result()
+
+    return {'n'        : res['n'],
+            'mean'     : res['mean'],
+            'std'      : res['std'],
+            'variance' : res['variance'],
+            'min'      : res['min'],
+            'max'      : res['max'],
+            'quantiles': dict([['%g' % q, v]
+                               for q, v in res['quantiles'].items()]),
+            'bins'     : res['bins'].tolist(),
+            'counts'   : res['counts'].tolist()}
+
+
+# ------------------------------------------------------------------------------
+#
+parser = argparse.ArgumentParser(
+        description='column statistics of hf.sim data files')
+parser.add_argument('files',           nargs='+',
+                    help='data files (`.dat` text, which can be given without '
+                         'extension, or `.npy`)')
+parser.add_argument('-w', '--workers', default=None, type=int,
+                    help='number of worker processes (default: all cores)')
+parser.add_argument('-m', '--merge',   action='store_true',
+                    help='also report the statistics of all files together')
+parser.add_argument('-j', '--json',    default=None,
+                    help='write the statistics to this json file (- for '
+                         'stdout)')
+parser.add_argument('-c', '--csv',     default=None,
+                    help='write the statistics to this csv file (- for '
+                         'stdout)')
+parser.add_argument('-s', '--split',   action='store_true',
+                    help='also write each column to `<file>.row.<n>` (not '
+                         'for binned histogram files)')
+parser.add_argument('-q', '--quiet',   action='store_true',
+                    help='no text report')
+parser.add_argument('--chunk',         default=CHUNK, type=int,
+                    help='bytes of text (or rows of .npy files) per chunk '
+                         '(default: %d)' % CHUNK)
+args = parser.parse_args()
+
+fnames = list()
+for fname in args.files:
+    if not os.path.isfile(fname) and os.path.isfile('%s.dat' % fname):
+        fname = '%s.dat' % fname
+    fnames.append(fname)
+
+todo    = [[fname, args.chunk, args.split] for fname in fnames]
+workers = min(args.workers or mp.cpu_count(), len(todo))
+
+if workers > 1:
+    pool = mp.Pool(workers)
+    try:
+        results = pool.map(sample, todo, chunksize=1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+else:
+    results = [sample(task) for task in todo]
+
+if args.merge:
+    merged = list()
+    for _, accs in results:
+        for n, acc in enumerate(accs):
+            if n >= len(merged):
+                merged.append(sim.Accumulator())
+            merged[n].merge(acc)
+    results.append(['all', merged])
+
+if not args.quiet:
+    for fname, accs in results:
+        rep.header(fname)
+        for n, acc in enumerate(accs):
+            res = acc.result()
+            rep.plain('col %2d: n %10d  min %10.2f  max %10.2f  '
+                      'mean %10.2f  std %10.2f\n'
+                     % (n + 1, res['n'], res['min'], res['max'],
+                        res['mean'], res['std']))
+
+if args.json:
+    data = dict([[fname, [as_dict(acc) for acc in accs]]
+                 for fname, accs in results])
+    if args.json == '-':
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+    else:
+        with open(args.json, 'w') as fout:
+            json.dump(data, fout, indent=2, sort_keys=True)
+
+if args.csv:
+    fout = sys.stdout if args.csv == '-' else open(args.csv, 'w')
+    try:
+        writer = csv.writer(fout)
+        writer.writerow(['file', 'column', 'n', 'mean', 'std', 'min', 'max'] +
+                        ['q%g' % q for q in QUANTILES])
+        for fname, accs in results:
+            for n, acc in enumerate(accs):
+                res = acc.result()
+                writer.writerow([fname, n + 1, res['n'], res['mean'],
+                                 res['std'], res['min'], res['max']] +
+                                [res['quantiles'][q] for q in QUANTILES])
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import argparse
+
+import radical.utils as ru
+import hf.sim       as sim
+
+rep    = ru.LogReporter(name='hf')
+
+
+# ------------------------------------------------------------------------------
+#
+def parse_value(val):
+
+    try:
+        return json.loads(val)
+    except ValueError:
+        return val
+
+
+def parse_axis(spec):
+    '''
+    axis specs look like
+
+      peeler.max_dia=10,12,14      : discrete values
+      stitcher.seg_width=8:16      : range
+      stitcher.seg_width=8:16:9    : range, 9 points for grid designs
+    '''
+
+    path, vals = spec.split('=', 1)
+
+    if ':' in vals:
+        elems = [parse_value(v) for v in vals.split(':')]
+        if len(elems) == 3:
+            return sim.Axis(path, low=elems[0], high=elems[1], num=elems[2])
+        return sim.Axis(path, low=elems[0], high=elems[1])
+
+    return sim.Axis(path, values=[parse_value(v) for v in vals.split(',')])
+
+
+# ------------------------------------------------------------------------------
+#
+parser = argparse.ArgumentParser(
+        description='sweep hf.sim configuration parameters and collect the BHT '
+                    'metrics per point (rerun to resume an interrupted sweep)')
+parser.add_argument('-a', '--axis',       action='append', required=True,
+                    help='sweep axis: path=v1,v2,.. or path=low:high[:num]')
+parser.add_argument('-c', '--cfg',        default=None,
+                    help='json configuration (default: hf.sim.DEFAULT_CFG)')
+parser.add_argument('-d', '--design',     default='grid',
+                    choices=['grid', 'random', 'lhs'],
+                    help='sweep design (default: grid)')
+parser.add_argument('-n', '--points',     default=None, type=int,
+                    help='number of points for random and lhs designs')
+parser.add_argument('-r', '--replicates', default=1, type=int,
+                    help='replicates per point (default: 1)')
+parser.add_argument('-s', '--seed',       default=None, type=int,
+                    help='root seed (default: random)')
+parser.add_argument('-w', '--workers',    default=None, type=int,
+                    help='number of worker processes (default: all cores)')
+parser.add_argument('-o', '--output',     default='sweep.jsonl',
+                    help='json-lines result file (default: sweep.jsonl)')
+parser.add_argument('-C', '--cache',      default=None,
+                    help='stage cache directory (default: no cache)')
+parser.add_argument('-S', '--cache-size', default=1024, type=int,
+                    help='stage cache size limit in MB (default: 1024)')
+args = parser.parse_args()
+
+
+sweep = sim.Sweep(sim.get_cfg(args.cfg),
+                  axes=[parse_axis(spec) for spec in args.axis],
+                  output=args.output, design=args.design, n=args.points,
+                  seed=args.seed, replicates=args.replicates,
+                  workers=args.workers, cache=args.cache,
+                  cache_size=args.cache_size * 1024 ** 2)
+rows  = sweep.run()
+
+rep.info('%d of %d points completed, results in %s\n'
+        % (len(rows), len(sweep.points), args.output))
+
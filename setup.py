@@ -262,11 +262,15 @@ setup_args = {
     'package_dir'        : {'': 'src'},
     'scripts'            : [
                             'bin/hf_sim_driver.py',
+                            'bin/hf_sim_ensemble.py',
+                            'bin/hf_sim_sweep.py',
+                            'bin/hf_sim_bench.py',
+                            'bin/hf_sim_bench_thing.py',
                             'bin/hf_sim_sample_props.py',
                             'bin/hf_sim_plot_hist.gplot',
                            ],
     'package_data'       : {'': ['*.txt', '*.sh', '*.json', '*.gz', 'VERSION', 'SDIST', sdist_name]},
-    'install_requires'   : ['radical.utils'],
+    'install_requires'   : ['radical.utils', 'numpy'],
     'zip_safe'           : False,
 }
 
@@ -1,6 +1,23 @@
 
 from .distribution import create_beta_distribution
 from .distribution import create_flat_distribution
+from .distribution import create_beta_array
+from .distribution import create_flat_array
+from .distribution import create_rng, get_rng, set_seed, derive_seed
+from .distribution import Sampler, beta_sampler, flat_sampler
+from .distribution import BetaDistribution, FlatDistribution
+from .distribution import beta_distribution, check_beta
+
+from .plot    import Renderer
+from .context import Context, get_context, flush_plots
+from .stats   import Histogram, Moments, QuantileSketch, Accumulator
+from .config  import DEFAULT_CFG, get_cfg, validate_cfg
+from .cache   import StageCache
+from .checkpoint import Checkpoint
+from .ledger  import ScrapLedger
+from .instrument import Instrument
+from .store   import BHTStore
+from .export  import Exporter, read_table
 
 from .farmer    import *
 from .field     import *
@@ -10,3 +27,7 @@ from .bast      import *
 from .stitcher  import *
 from .bht       import *
 
+from .pipeline  import run_pipeline, stream_pipeline
+from .pipeline  import grow_stalks, peel_stalks, splice_bast
+from .ensemble  import Ensemble, summarize
+from .sweep     import Axis, Sweep, design_points
@@ -2,13 +2,13 @@
 import sys
 import math
 
+import numpy as np
+
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
-
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
+from .distribution import create_beta_array
 
 from .thing import Thing
 
@@ -21,54 +21,352 @@ CUT       = 'cut'
 SPLICED   = 'spliced'
 SEWN      = 'sewn'
 
+# the bast state model - a `BastBatch` stores the index of a bast's state in
+# this list as state code
+BAST_MODEL = [FRESH, CUT, SPLICED, SEWN]
+
+
+# ------------------------------------------------------------------------------
+#
+def end_width_parameters(width):
+    '''
+    boundary conditions `[min, max, mean, variance]` of the beta distribution
+    of the bast end width, for the given start width(s)
+    '''
+
+    return 0, width, width * 2 / 3, 0.7
+
+
+# ------------------------------------------------------------------------------
+#
+def draw_end_width(width, rng=None):
+    '''
+    The bast width degrades over length, although the distribution is somewhat
+    weighted towards constant width.  For a given (array of) start width(s),
+    draw the width(s) at the end of the bast.
+    '''
+
+    width = np.asarray(width, dtype=float)
+
+    dmin, dmax, dmean, dvar = end_width_parameters(width)
+
+    return create_beta_array(n=width.shape, dmin=dmin, dmax=dmax,
+                             dmean=dmean, dvar=dvar, rng=rng)
+
+
+# ------------------------------------------------------------------------------
+#
+class BastBatch(object):
+    '''
+    A set of bast pieces, stored as columns (start width, end width, length and
+    state code) instead of one `Bast` object per piece.  Width is linear over
+    length, so those columns fully describe the geometry.  `cut()` and
+    `splice()` operate on the whole batch at once and return new batches.
+    Indexing a batch with an integer returns a `Bast` view on that piece,
+    indexing with a slice or boolean mask returns a new batch.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, w0=None, w1=None, length=None, state=None):
+        '''
+        w0    : widths at the begin of the basts (mm)
+        w1    : widths at the end   of the basts (mm)
+        length: bast lengths (mm)
+        state : state codes (index into `BAST_MODEL`, default: FRESH)
+        '''
+
+        if w0     is None: w0     = list()
+        if w1     is None: w1     = list()
+        if length is None: length = list()
+
+        self.w0     = np.array(w0,     dtype=float)
+        self.w1     = np.array(w1,     dtype=float)
+        self.length = np.array(length, dtype=float)
+
+        assert(len(self.w0) == len(self.w1) == len(self.length))
+
+        n = len(self.length)
+
+        if state is None: self.state = np.zeros(n, dtype=np.uint8)
+        else            : self.state = np.array(state, dtype=np.uint8)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_peel(cls, length, width, rng=None):
+        '''
+        Create a batch of freshly peeled basts of the given length(s) and start
+        width(s) - the end widths are drawn via `draw_end_width()`.
+        '''
+
+        length = np.asarray(length, dtype=float)
+        width  = np.asarray(width,  dtype=float) * np.ones(length.shape)
+
+        return cls(w0=width, w1=draw_end_width(width, rng=rng), length=length)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def concat(cls, batches):
+        '''
+        merge a list of batches into one batch
+        '''
+
+        batches = [b for b in batches if len(b)]
+
+        if not batches:
+            return cls()
+
+        return cls(w0    =np.concatenate([b.w0     for b in batches]),
+                   w1    =np.concatenate([b.w1     for b in batches]),
+                   length=np.concatenate([b.length for b in batches]),
+                   state =np.concatenate([b.state  for b in batches]))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_basts(cls, basts):
+        '''
+        create a batch from a list of `Bast` instances
+        '''
+
+        if isinstance(basts, BastBatch):
+            return basts
+
+        return cls(w0    =[b.width[0] for b in basts],
+                   w1    =[b.width[1] for b in basts],
+                   length=[b.length   for b in basts],
+                   state =[BAST_MODEL.index(b.state) for b in basts])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        Create a batch from a dict of columns (see `to_arrays()`).  The
+        columns are used as they are, not copied (they can be memory maps).
+        '''
+
+        ret        = cls()
+        ret.w0     = np.asarray(arrays['w0'],     dtype=float)
+        ret.w1     = np.asarray(arrays['w1'],     dtype=float)
+        ret.length = np.asarray(arrays['length'], dtype=float)
+        ret.state  = np.asarray(arrays['state'],  dtype=np.uint8)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def to_arrays(self):
+        '''
+        return the batch columns as dict of numpy arrays
+        '''
+
+        return {'w0'    : self.w0,
+                'w1'    : self.w1,
+                'length': self.length,
+                'state' : self.state}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self.length)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __getitem__(self, idx):
+
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if idx < 0 or idx >= len(self):
+                raise IndexError('bast index out of range')
+            return Bast(batch=self, idx=idx)
+
+        return BastBatch(w0    =self.w0    [idx],
+                         w1    =self.w1    [idx],
+                         length=self.length[idx],
+                         state =self.state [idx])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __iter__(self):
+
+        for idx in range(len(self)):
+            yield Bast(batch=self, idx=idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def grad(self):
+        '''
+        width change per mm of length
+        '''
+
+        grad = np.zeros(len(self))
+        mask = self.length > 0
+        grad[mask] = (self.w0[mask] - self.w1[mask]) / self.length[mask]
+
+        return grad
+
+
+    # --------------------------------------------------------------------------
+    #
+    def width_at(self, l):
+        '''
+        determine the width of all basts at length l (scalar or array)
+        '''
+
+        l = np.asarray(l, dtype=float)
+
+        return np.where(l > self.length, 0.0, self.w0 - self.grad * l)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cut(self, length):
+        '''
+        Cut all basts into segments of the given length (the last segment of
+        each bast is shorter).  This returns a new batch with all segments,
+        segments of the same bast being consecutive.
+        '''
+
+        assert(np.all(self.state == BAST_MODEL.index(FRESH)))
+
+        n_segments = np.ceil(self.length / length).astype(int)
+        total      = int(n_segments.sum())
+
+        # index of the originating bast, and index of the segment within that
+        # bast, for each segment
+        origin = np.repeat(np.arange(len(self)), n_segments)
+        first  = np.repeat(np.cumsum(n_segments) - n_segments, n_segments)
+        seg    = np.arange(total) - first
+
+        start  = seg * float(length)
+        end    = np.minimum((seg + 1) * float(length), self.length[origin])
+
+        w0     = self.w0[origin]
+        grad   = self.grad[origin]
+
+        return BastBatch(w0=w0 - grad * start,
+                         w1=w0 - grad * end,
+                         length=end - start,
+                         state=np.full(total, BAST_MODEL.index(CUT)))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def splice(self, width):
+        '''
+        Splice all basts which are too wide into `ceil(width / splice_width)`
+        pieces of equal width.  This returns a new batch with all splices.
+        '''
+
+        assert(np.all(self.state == BAST_MODEL.index(CUT)))
+
+        n_splices = np.ceil(self.w0 / width).astype(int)
+        origin    = np.repeat(np.arange(len(self)), n_splices)
+        n         = n_splices[origin]
+
+        self.state[:] = BAST_MODEL.index(SPLICED)
+
+        return BastBatch(w0    =self.w0[origin] / n,
+                         w1    =self.w1[origin] / n,
+                         length=self.length[origin],
+                         state =np.full(len(origin), BAST_MODEL.index(SPLICED)))
+
 
 # ------------------------------------------------------------------------------
 #
 class Bast(Thing):
+    '''
+    A single piece of bast.  The bast geometry and state live in a `BastBatch`
+    - this class is a view on one entry of such a batch.  A bast created on its
+    own gets its own batch of size one.
+    '''
+
+    __slots__ = ['_batch', '_idx', '_cfg']
+
+    MODEL     = BAST_MODEL
 
     # --------------------------------------------------------------------------
     #
-    def __init__(self, length, width, cfg, state=None):
+    def __init__(self, length=None, width=None, cfg=None, state=None,
+                       batch=None, idx=0, rng=None):
         '''
         Create a piece of bast of given geometry (values in mm).
         We assume that the width degrades over length, although the distribution
         is somewhat weighted towards constant length.  Width can also be givenm
         as a tuple though, which is then interpreted as width at begin and end
-        of the bast, respectively.
+        of the bast, respectively.  The end width of a bast created with a single
+        width is drawn from `rng` (default: module wide generator).
         '''
 
         self._cfg = cfg
 
-        if   isinstance(width, list) or \
-             isinstance(width, tuple)   :
-            self._width  = width
+        if batch is None:
 
-        elif isinstance(width, int)  or \
-             isinstance(width, float)   :
-             max_width   = width
-             mean_width  = max_width * 2/3
-             end_width   = beta(n=1, dmin=0, dmax=max_width, dmean=mean_width, dvar=0.7)
-             self._width = [width, end_width[0]]
+            if   isinstance(width, list) or \
+                 isinstance(width, tuple)   :
+                 w0, w1 = width
 
-        else:
-            raise TypeError('Cannot handle width type')
+            elif isinstance(width, int)  or \
+                 isinstance(width, float)   :
+                 w0 = width
+                 w1 = float(draw_end_width(width, rng=rng))
+
+            else:
+                raise TypeError('Cannot handle width type')
 
-        self._len   = length
-        self._wdiff = self._width[0] - self._width[1]
-        self._grad  = self._wdiff / self._len
+            if state: code = BAST_MODEL.index(state)
+            else    : code = BAST_MODEL.index(FRESH)
 
-        model = [FRESH, CUT, SPLICED, SEWN]
-        super(Bast, self).__init__(model)
+            batch = BastBatch(w0=[w0], w1=[w1], length=[length], state=[code])
 
-        if state:
-            while self.state != state:
-                self.advance()
+        self._batch = batch
+        self._idx   = idx
 
+        super(Bast, self).__init__()
 
+
+    @property
+    def length(self): return float(self._batch.length[self._idx])
     @property
-    def length(self): return self._len
+    def width(self):  return [float(self._batch.w0[self._idx]),
+                              float(self._batch.w1[self._idx])]
     @property
-    def width(self):  return self._width
+    def state(self):  return BAST_MODEL[self._batch.state[self._idx]]
+    @property
+    def state_code(self): return int(self._batch.state[self._idx])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def advance(self, state=None):
+        '''
+        Transision to the next state in the state model, or to the given later
+        state.
+        '''
+
+        if state is None:
+            assert(self._batch.state[self._idx] < (len(BAST_MODEL)-1))
+            self._batch.state[self._idx] += 1
+
+        else:
+            code = BAST_MODEL.index(state)
+            assert(code > self._batch.state[self._idx])
+            self._batch.state[self._idx] = code
 
 
     # --------------------------------------------------------------------------
@@ -77,10 +375,13 @@ class Bast(Thing):
         '''
         determine the width of the bast at length l
         '''
-        if l > self._len:
+        w0, w1 = self.width
+        length = self.length
+
+        if l > length:
             return 0
         else:
-            return self._width[0] - self._grad * float(l)
+            return w0 - (w0 - w1) / length * float(l)
 
     # --------------------------------------------------------------------------
     #
@@ -88,10 +389,12 @@ class Bast(Thing):
         '''
         determine at what len the bast has width w
         '''
-        assert(w <= self._width[0])
-        assert(w >= self._width[1])
+        w0, w1 = self.width
+
+        assert(w <= w0)
+        assert(w >= w1)
 
-        return (self._width[0] - float(w)) / self._wdiff * self._len
+        return (w0 - float(w)) / (w0 - w1) * self.length
 
 
     # --------------------------------------------------------------------------
@@ -106,25 +409,13 @@ class Bast(Thing):
 
         assert(self.state == FRESH)
 
-        n_segments = int(math.ceil(self._len / length))
-        segments   = list()
-
-        for n in range(n_segments):
-
-            start =  n    * length
-            end   = (n+1) * length
+        segments = self._batch[self._idx:self._idx + 1].cut(length)
 
-            if  end >= self._len:
-                end  = self._len
+        self._batch.length[self._idx] = segments.length[0]
+        self._batch.w0    [self._idx] = segments.w0[0]
+        self._batch.w1    [self._idx] = segments.w1[0]
 
-            new_width = [self.width_at(start), self.width_at(end)]
-            segments.append(Bast(length=(end-start), width=new_width, 
-                                 cfg=self._cfg, state=CUT))
-
-        self._len   = segments[0].length
-        self._width = segments[0].width
-
-        return segments
+        return list(segments)
 
 
     # --------------------------------------------------------------------------
@@ -136,17 +427,12 @@ class Bast(Thing):
 
         assert(self.state == CUT)
 
-        n_splices = int(math.ceil(self._width[0] / width))
-        s_width   = [self._width[0] / n_splices, 
-                     self._width[1] / n_splices]
-        splices   = list()
-
-        for n in range(n_splices):
-            splices.append(Bast(length=self._len, width=s_width, cfg=self._cfg))
+        splices = self._batch[self._idx:self._idx + 1].splice(width)
 
         self.advance()
 
-        return splices
+        return list(splices)
 
 
 # ------------------------------------------------------------------------------
+
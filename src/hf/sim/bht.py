@@ -1,15 +1,24 @@
 
+import os
 import sys
 
+import numpy as np
+
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
 
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
+from .thing   import Thing
+from .context import get_context
+
+from .checkpoint import pack, unpack
 
-from .thing import Thing
+from .instrument import instrumented
+from .store      import BHTStore, BLOCK
+
+# names of the segment columns (see `BHT.__init__`)
+SEGMENT_COLUMNS = ['start', 'rows', 'layers', 'width', 'slope']
 
 rep = ru.LogReporter(name='hf.sim')
 
@@ -17,44 +26,702 @@ rep = ru.LogReporter(name='hf.sim')
 SEWN = 'sewn'
 
 
+# ------------------------------------------------------------------------------
+#
+def _sum_width(width, slope, n):
+    '''
+    sum of the widths over the first `n` rows of linear segments
+    '''
+
+    return n * width + slope * n * (n - 1) / 2.0
+
+
+def _sum_width2(width, slope, n):
+    '''
+    sum of the squared widths over the first `n` rows of linear segments
+    '''
+
+    return n * width ** 2 + width * slope * n * (n - 1) \
+         + slope ** 2 * (n - 1) * n * (2 * n - 1) / 6.0
+
+
+def _cumsum(values):
+    '''
+    prefix sums, starting with 0
+    '''
+
+    return np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+
+
+# ------------------------------------------------------------------------------
+#
+class _MinMaxTree(object):
+    '''
+    segment tree for range minimum and maximum queries in O(log n).  The `n`
+    leaves are stored at `[n, 2n)`, node `i` covers its children `2i` and
+    `2i+1`, so the tree needs no padding to a power of two.
+    '''
+
+    def __init__(self, vmin, vmax):
+
+        n = len(vmin)
+
+        self._size = n
+        self._min  = np.empty(2 * n, dtype=np.asarray(vmin).dtype)
+        self._max  = np.empty(2 * n, dtype=np.asarray(vmax).dtype)
+
+        self._min[n:] = vmin
+        self._max[n:] = vmax
+
+        # build the nodes bottom up, in blocks whose children are all built
+        # already, one vectorized pass per block
+        hi = n
+        while hi > 1:
+            lo = (hi + 1) // 2
+            self._min[lo:hi] = np.minimum(self._min[2 * lo:2 * hi:2],
+                                          self._min[2 * lo + 1:2 * hi:2])
+            self._max[lo:hi] = np.maximum(self._max[2 * lo:2 * hi:2],
+                                          self._max[2 * lo + 1:2 * hi:2])
+            hi = lo
+
+
+    def query(self, lo, hi):
+        '''
+        min and max over the elements `[lo, hi)`
+        '''
+
+        vmin =  np.inf
+        vmax = -np.inf
+        lo  += self._size
+        hi  += self._size
+
+        while lo < hi:
+            if lo & 1:
+                vmin = min(vmin, self._min[lo])
+                vmax = max(vmax, self._max[lo])
+                lo  += 1
+            if hi & 1:
+                hi  -= 1
+                vmin = min(vmin, self._min[hi])
+                vmax = max(vmax, self._max[hi])
+            lo //= 2
+            hi //= 2
+
+        return vmin, vmax
+
+
+# ------------------------------------------------------------------------------
+#
+class BHTIndex(object):
+    '''
+    An index over the piecewise linear segments of a BHT (see `BHT`), to query
+    thickness (number of layers), total width and joins over any range of rows
+    without expanding the BHT row by row:
+
+      - prefix sums of layers, squared layers, width and squared width at the
+        segment starts, so that sums (and thus mean and standard deviation)
+        over any row range take two binary searches;
+      - a segment tree over the per-segment minima and maxima, for range
+        minimum and maximum in O(log n);
+      - the sorted join rows, to count joins in a range by binary search.
+
+    `profile()` computes the same metrics for all windows of a given size in
+    one vectorized pass.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, segments, joins=None):
+
+        start, rows, layers, width, slope = [np.asarray(x) for x in segments]
+
+        # no copies of segments which have the right types already
+        self._start  = start .astype(np.int64, copy=False)
+        self._rows   = rows  .astype(np.int64, copy=False)
+        self._layers = layers.astype(float,    copy=False)
+        self._width  = width .astype(float,    copy=False)
+        self._slope  = slope .astype(float,    copy=False)
+        self._nrows  = int(self._rows.sum())
+
+        if joins is None: self._joins = None
+        else            : self._joins = np.sort(np.asarray(joins,
+                                                           dtype=np.int64))
+
+        self._cl  = _cumsum(self._layers      * self._rows)
+        self._cl2 = _cumsum(self._layers ** 2 * self._rows)
+        self._cw  = _cumsum(_sum_width (self._width, self._slope, self._rows))
+        self._cw2 = _cumsum(_sum_width2(self._width, self._slope, self._rows))
+
+        last = self._width + self._slope * (self._rows - 1)
+        self._layer_tree = _MinMaxTree(self._layers, self._layers)
+        self._width_tree = _MinMaxTree(np.minimum(self._width, last),
+                                       np.maximum(self._width, last))
+
+
+    @property
+    def rows(self): return self._nrows
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _segment(self, row):
+        '''
+        index of the segment(s) containing the given row(s)
+        '''
+
+        return np.searchsorted(self._start, row, side='right') - 1
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _cum(self, row):
+        '''
+        sums of layers, squared layers, width and squared width over the rows
+        before `row` (scalar or array)
+        '''
+
+        row = np.clip(np.asarray(row, dtype=np.int64), 0, self._nrows)
+        seg = np.maximum(self._segment(row), 0)
+        n   = row - self._start[seg]
+        n   = np.where(row > 0, n, 0)
+
+        layers = self._layers[seg]
+        width  = self._width [seg]
+        slope  = self._slope [seg]
+
+        return (self._cl [seg] + layers      * n,
+                self._cl2[seg] + layers ** 2 * n,
+                self._cw [seg] + _sum_width (width, slope, n),
+                self._cw2[seg] + _sum_width2(width, slope, n))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _width_at(self, seg, row):
+
+        return self._width[seg] + self._slope[seg] * (row - self._start[seg])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _minmax(self, a, b):
+        '''
+        min and max of layers and width over the rows `[a, b)`
+        '''
+
+        sa = int(self._segment(a))
+        sb = int(self._segment(b - 1))
+
+        # the (partial) first and last segments
+        ends   = [self._width_at(sa, a), self._width_at(sb, b - 1)]
+        if sa != sb:
+            ends += [self._width_at(sa, self._start[sa] + self._rows[sa] - 1),
+                     self._width_at(sb, self._start[sb])]
+
+        lmin = min(self._layers[sa], self._layers[sb])
+        lmax = max(self._layers[sa], self._layers[sb])
+        wmin = min(ends)
+        wmax = max(ends)
+
+        # the full segments in between
+        if sb - sa > 1:
+            tmin, tmax = self._layer_tree.query(sa + 1, sb)
+            lmin, lmax = min(lmin, tmin), max(lmax, tmax)
+            tmin, tmax = self._width_tree.query(sa + 1, sb)
+            wmin, wmax = min(wmin, tmin), max(wmax, tmax)
+
+        return lmin, lmax, wmin, wmax
+
+
+    # --------------------------------------------------------------------------
+    #
+    def query(self, a=0, b=None):
+        '''
+        Return the metrics over the rows `[a, b)` (default: all rows) as dict:
+
+          rows            : number of rows in the range
+          thickness_mean  : mean number of layers
+          thickness_std   : standard deviation of the number of layers
+          thickness_min   : minimum number of layers
+          thickness_max   : maximum number of layers
+          width_mean      : mean total bast width [mm]
+          width_std       : standard deviation of the total bast width [mm]
+          width_min       : minimum total bast width [mm]
+          width_max       : maximum total bast width [mm]
+          joins           : number of joins in the range (`None` if unknown)
+        '''
+
+        if b is None:
+            b = self._nrows
+
+        a = max(0, int(a))
+        b = min(self._nrows, int(b))
+
+        ret = {'rows'          : max(0, b - a),
+               'thickness_mean': 0.0, 'thickness_std': 0.0,
+               'thickness_min' : 0,   'thickness_max': 0,
+               'width_mean'    : 0.0, 'width_std'    : 0.0,
+               'width_min'     : 0.0, 'width_max'    : 0.0,
+               'joins'         : None}
+
+        if self._joins is not None:
+            ret['joins'] = int(np.searchsorted(self._joins, b)
+                             - np.searchsorted(self._joins, a))
+
+        if b <= a:
+            return ret
+
+        n  = float(b - a)
+        ca = self._cum(a)
+        cb = self._cum(b)
+        l, l2, w, w2 = [float(y - x) / n for x, y in zip(ca, cb)]
+
+        lmin, lmax, wmin, wmax = self._minmax(a, b)
+
+        ret.update({'thickness_mean': l,
+                    'thickness_std' : max(0.0, l2 - l * l) ** 0.5,
+                    'thickness_min' : int(lmin),
+                    'thickness_max' : int(lmax),
+                    'width_mean'    : w,
+                    'width_std'     : max(0.0, w2 - w * w) ** 0.5,
+                    'width_min'     : float(wmin),
+                    'width_max'     : float(wmax)})
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def profile(self, window):
+        '''
+        Return the metrics of `query()` for all consecutive windows of
+        `window` rows (the last window can be shorter), as dict of arrays
+        (plus the `start` row of each window).
+        '''
+
+        window = int(window)
+        assert(window > 0)
+
+        bounds = np.arange(0, self._nrows + window, window, dtype=np.int64)
+        bounds = np.minimum(bounds, self._nrows)
+        bounds = np.unique(bounds)
+        start  = bounds[:-1]
+        n      = (bounds[1:] - start).astype(float)
+
+        ret = {'start': start, 'rows': n.astype(np.int64)}
+
+        if not len(start):
+            for key in ['thickness_mean', 'thickness_std', 'thickness_min',
+                        'thickness_max', 'width_mean', 'width_std',
+                        'width_min', 'width_max', 'joins']:
+                ret[key] = np.zeros(0)
+            return ret
+
+        # means and standard deviations from the prefix sums
+        cum = self._cum(bounds)
+        l, l2, w, w2 = [np.diff(c) / n for c in cum]
+
+        ret['thickness_mean'] = l
+        ret['thickness_std']  = np.sqrt(np.maximum(0.0, l2 - l * l))
+        ret['width_mean']     = w
+        ret['width_std']      = np.sqrt(np.maximum(0.0, w2 - w * w))
+
+        # minima and maxima: split the segments at the window bounds, so that
+        # each piece is linear and lies in one window, and reduce the pieces
+        # per window
+        pieces = np.union1d(self._start, start)
+        pieces = pieces[pieces < self._nrows]
+        last   = np.append(pieces[1:], self._nrows) - 1
+        seg    = self._segment(pieces)
+        w0     = self._width_at(seg, pieces)
+        w1     = self._width_at(seg, last)
+        first  = np.searchsorted(pieces, start)
+
+        ret['thickness_min'] = np.minimum.reduceat(self._layers[seg], first)
+        ret['thickness_max'] = np.maximum.reduceat(self._layers[seg], first)
+        ret['width_min']     = np.minimum.reduceat(np.minimum(w0, w1), first)
+        ret['width_max']     = np.maximum.reduceat(np.maximum(w0, w1), first)
+
+        if self._joins is None:
+            ret['joins'] = None
+        else:
+            ret['joins'] = np.diff(np.searchsorted(self._joins, bounds))
+
+        return ret
+
+
 # ------------------------------------------------------------------------------
 #
 class BHT(Thing):
 
+    __slots__ = ['_ctx', '_res', '_minw', '_store', '_segments', '_joins',
+                 '_index']
+
+    MODEL     = [SEWN]
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, res, segw, bht=None, segments=None, joins=None,
+                       store=None, ctx=None):
+        '''
+        The BHT is given either as list of `[total width, number of layers]`
+        pairs, one per `res` mm, or as `BHTStore` with such rows, or as list of
+        piecewise linear segments `[start rows, number of rows, layers, width
+        at start row, width change per row]` (as produced by the event driven
+        sew engine).  `joins` lists the rows at which bast pieces were inserted
+        into the seam (a store holds its own joins).  A list of rows is
+        converted into a store.
+        '''
+
+        if not ctx:
+            ctx = get_context()
+
+        if bht is not None:
+            rows  = np.array(bht, dtype=float).reshape(-1, 2)
+            store = BHTStore.from_arrays(res, segw, rows[:,0], rows[:,1],
+                                         joins)
+
+        if store is None and segments is None:
+            raise ValueError('need either bht, store or segments')
+
+        if store is not None:
+            joins = store.joins()
+
+        self._ctx      = ctx
+        self._res      = res
+        self._minw     = segw
+        self._store    = store
+        self._segments = segments
+        self._joins    = joins
+        self._index    = None
+
+        super(BHT, self).__init__('bht')
+
+
+    @property
+    def store(self): return self._store
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def rows(self):
+        '''
+        number of rows (of `res` mm)
+        '''
+
+        if self._segments is None:
+            return len(self._store)
+
+        return int(np.sum(self._segments[1]))
+
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, res, segw, bht): 
+    @classmethod
+    def from_arrays(cls, arrays, ctx=None):
+        '''
+        create a BHT from a dict of arrays (see `to_arrays()`)
+        '''
+
+        res      = arrays['res'].item()
+        segw     = arrays['segw'].item()
+        joins    = arrays.get('joins')
+        segments = None
+        store    = None
+
+        if 'bht' in arrays:
+            # rows stored as `[width, layers]` pairs
+            rows  = arrays['bht']
+            store = BHTStore.from_arrays(res, segw, rows[:,0], rows[:,1], joins)
 
-        self._res  = res
-        self._minw = segw
-        self._bht  = bht
+        elif 'rows.width' in arrays:
+            rows  = unpack('rows', arrays)
+            store = BHTStore.from_arrays(res, segw, rows['width'],
+                                         rows['layers'], joins)
+        else:
+            columns  = unpack('segments', arrays)
+            segments = [columns[name] for name in SEGMENT_COLUMNS]
 
-        model = [SEWN]
-        super(BHT, self).__init__(model, 'bht')
+        return cls(res=res, segw=segw, segments=segments, joins=joins,
+                   store=store, ctx=ctx)
 
 
     # --------------------------------------------------------------------------
     #
+    def to_arrays(self):
+        '''
+        return the BHT as dict of numpy arrays
+        '''
+
+        ret = {'res' : np.array(self._res),
+               'segw': np.array(self._minw)}
+
+        if self._segments is not None:
+            ret.update(pack('segments', dict(zip(SEGMENT_COLUMNS,
+                                    [np.asarray(x) for x in self._segments]))))
+        else:
+            width, layers = self._store.read()
+            ret.update(pack('rows', {'width' : width,
+                                     'layers': layers}))
+
+        if self._joins is not None:
+            ret['joins'] = np.asarray(self._joins, dtype=np.int64)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def save(self, path):
+        '''
+        write the BHT rows to a `BHTStore` in the directory `path` (segments are
+        sampled at every row, block by block), to be reopened with `load()`.
+        A BHT cannot be saved onto the store it is read from.
+        '''
+
+        if self._store is not None and self._store.path and \
+           os.path.realpath(self._store.path) == os.path.realpath(path):
+            raise ValueError('cannot save a BHT onto its own store %s' % path)
+
+        store = BHTStore(self._res, self._minw, path=path)
+
+        for a in range(0, self.rows, BLOCK):
+            store.extend(*self._read_rows(a, a + BLOCK))
+
+        if self._joins is not None:
+            store.add_joins(self._joins)
+
+        store.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def load(cls, path, ctx=None):
+        '''
+        open a BHT saved with `save()` (or sewn into a store in `path`), with the
+        rows memory mapped
+        '''
+
+        store = BHTStore.open(path)
+
+        return cls(res=store.res, segw=store.segw, store=store, ctx=ctx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def bht(self):
+        '''
+        list of `[total width, number of layers]` pairs, one per `res` mm
+        '''
+
+        tot, layers = self.columns()
+
+        return [list(x) for x in zip(tot.tolist(), layers.tolist())]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def columns(self):
+        '''
+        return the total width and number of layers for each row, as two numpy
+        arrays.  Piecewise linear segments are sampled at every row.
+        '''
+
+        if self._segments is None:
+            width, layers = self._store.read()
+            return width.astype(float), layers.astype(int)
+
+        start, rows, layers, width, slope = [np.asarray(x) for x in
+                                             self._segments]
+
+        if not len(rows):
+            return np.zeros(0), np.zeros(0, dtype=int)
+
+        seg   = np.repeat(np.arange(len(rows)), rows)
+        step  = np.arange(len(seg)) - np.repeat(np.cumsum(rows) - rows, rows)
+        tot   = width[seg] + slope[seg] * step
+
+        return tot, layers[seg]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _read_rows(self, a, b):
+        '''
+        total width and number of layers of the rows `[a, b)`
+        '''
+
+        if self._segments is None:
+            return self._store.read(a, b)
+
+        start, rows, layers, width, slope = [np.asarray(x) for x in
+                                             self._segments]
+
+        row = np.arange(max(0, a), min(b, self.rows))
+        seg = np.searchsorted(start, row, side='right') - 1
+
+        return width[seg] + slope[seg] * (row - start[seg]), layers[seg]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def read(self, a=0.0, b=None):
+        '''
+        Return the total width and number of layers of each row between `a` and
+        `b` meters (default: up to the end) as two numpy arrays.  Only those
+        rows are sampled from segments or read from a (memory mapped) store.
+        '''
+
+        if b is None: b = self.rows
+        else        : b = self._row(b)
+
+        return self._read_rows(self._row(a), b)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def index(self):
+        '''
+        the `BHTIndex` over this BHT (created on first use)
+        '''
+
+        if self._index is None:
+
+            if self._segments is not None:
+                segments = self._segments
+            else:
+                # one segment per row, without slope
+                tot, layers = self.columns()
+                segments    = [np.arange(len(tot)), np.ones(len(tot), int),
+                               layers, tot, np.zeros(len(tot))]
+
+            self._index = BHTIndex(segments, self._joins)
+
+        return self._index
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _row(self, pos):
+        '''
+        convert a position along the BHT [m] into a row
+        '''
+
+        return int(round(pos * 1000.0 / self._res))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def query(self, a=0.0, b=None):
+        '''
+        Return the metrics of the BHT section between `a` and `b` meters
+        (default: up to the end), see `BHTIndex.query()`.  Additionally,
+        `length` is the section length [m], and `joins_per_m` the number of
+        joins per meter in the section (`None` if the joins are unknown).
+        '''
+
+        if b is not None:
+            b = self._row(b)
+
+        ret    = self.index.query(self._row(a), b)
+        length = ret['rows'] * self._res / 1000.0
+
+        ret['length']      = length
+        ret['joins_per_m'] = None
+
+        if ret['joins'] is not None and length:
+            ret['joins_per_m'] = ret['joins'] / length
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def profile(self, window=1.0):
+        '''
+        Return the metrics of all consecutive BHT sections of `window` meters
+        as dict of arrays (see `BHTIndex.profile()`), with the section `start`
+        and `length` in meters, and the `joins_per_m` per section.
+        '''
+
+        rows = max(1, self._row(window))
+        ret  = self.index.profile(rows)
+
+        ret['start']  = ret['start'] * self._res / 1000.0
+        ret['length'] = ret['rows']  * self._res / 1000.0
+
+        if ret['joins'] is None: ret['joins_per_m'] = None
+        else                   : ret['joins_per_m'] = ret['joins'] \
+                                                    / ret['length']
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def metrics(self):
+        '''
+        Return the scalar quality metrics of this BHT as dict:
+
+          length          : BHT length [m]
+          thickness_mean  : mean number of layers
+          thickness_std   : standard deviation of the number of layers
+          width_mean      : mean total bast width [mm]
+          width_std       : standard deviation of the total bast width [mm]
+          joins_per_m     : bast pieces inserted per meter of BHT (`None` if
+                            the joins are unknown)
+        '''
+
+        ret = self.query()
+
+        return dict([[key, ret[key]] for key in ['length',
+                                                 'thickness_mean',
+                                                 'thickness_std',
+                                                 'width_mean',
+                                                 'width_std',
+                                                 'joins_per_m']])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @instrumented('bht.stats')
     def stats(self):
 
         assert(self.state == SEWN)
 
         rep.header('BHT Stats')
-        rep.info('length: %d m\n' % (len(self._bht) * 10 / 10 / 100))
+        ret = self.query()
 
-        data = list()
-        x    = 0
-        for section in self._bht:
-            x += self._res
-            y  = section[1]
-            data.append([x, y])
+        rep.info('length: %d m\n' % ret['length'])
+        rep.plain('thickness : %6.2f +- %5.2f layers (%d - %d)\n'
+                 % (ret['thickness_mean'], ret['thickness_std'],
+                    ret['thickness_min'],  ret['thickness_max']))
+        rep.plain('width     : %6.2f +- %5.2f mm (%.2f - %.2f)\n'
+                 % (ret['width_mean'], ret['width_std'],
+                    ret['width_min'],  ret['width_max']))
+        if ret['joins_per_m'] is not None:
+            rep.plain('joins     : %6.2f per m\n' % ret['joins_per_m'])
 
-        create_line_plot(fname='bht_thickness', 
-                         title='BHT Thickness over Length',
-                         ptitle='thickness',
-                         xlabel='length [mm]', 
-                         ylabel='number of layers', 
-                         data=data)
+        # plot per meter profiles, not every row
+        prof = self.profile(1.0)
+        x    = prof['start'] + prof['length']
+
+        self._ctx.line_plot(fname='bht_thickness',
+                            title='BHT Thickness over Length',
+                            ptitle='thickness',
+                            xlabel='length [m]',
+                            ylabel='mean number of layers per m',
+                            data=np.column_stack([x, prof['thickness_mean']]))
+
+        self._ctx.line_plot(fname='bht_width',
+                            title='BHT Width over Length',
+                            ptitle='width',
+                            xlabel='length [m]',
+                            ylabel='mean total width per m [mm]',
+                            data=np.column_stack([x, prof['width_mean']]))
 
 
 # ------------------------------------------------------------------------------
+
@@ -0,0 +1,180 @@
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+
+import radical.utils as ru
+
+rep = ru.LogReporter(name='hf.sim')
+
+# default cache size limit (bytes)
+MAX_SIZE = 1024 ** 3
+
+_code_version = None
+
+
+# ------------------------------------------------------------------------------
+#
+def code_version():
+    '''
+    Return a hash over the source of this package.  It is part of every cache
+    key, so that cached stage outputs are not reused after the code changed.
+    '''
+
+    global _code_version
+
+    if _code_version is None:
+
+        digest = hashlib.sha256()
+        root   = os.path.dirname(os.path.abspath(__file__))
+
+        for fname in sorted(glob.glob('%s/*.py' % root)):
+            with open(fname, 'rb') as fin:
+                digest.update(fin.read())
+
+        _code_version = digest.hexdigest()
+
+    return _code_version
+
+
+# ------------------------------------------------------------------------------
+#
+class StageCache(object):
+    '''
+    A content addressed store for stage outputs on local disk.  An entry is a
+    set of named numpy arrays (like `StalkBatch.to_arrays()`), stored as one
+    `.npz` file named after its key.  Keys are hashes over everything the
+    stage output depends on (see `key()`).
+
+    The cache is limited in size: when it grows beyond `max_size` bytes, the
+    least recently used entries are removed.  Entries are written atomically,
+    so that several processes can share a cache directory.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, path, max_size=MAX_SIZE):
+
+        self._path     = path
+        self._max_size = max_size
+
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # created concurrently
+                if not os.path.isdir(path):
+                    raise
+
+
+    @property
+    def path(self): return self._path
+
+
+    # --------------------------------------------------------------------------
+    #
+    @staticmethod
+    def key(*parts):
+        '''
+        return the cache key for the given json serializable parts (stage name,
+        cfg sections, seed, ...) and the current code version
+        '''
+
+        data = json.dumps([code_version()] + list(parts), sort_keys=True)
+
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _fname(self, key):
+
+        return '%s/%s.npz' % (self._path, key)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get(self, key):
+        '''
+        return the dict of arrays stored for `key`, or `None`
+        '''
+
+        fname = self._fname(key)
+
+        try:
+            with np.load(fname) as data:
+                ret = dict([[name, data[name]] for name in data.files])
+            os.utime(fname, None)   # mark as recently used
+
+        except (IOError, OSError, ValueError):
+            # missing, evicted concurrently, or incompletely written
+            return None
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, key, arrays):
+        '''
+        store a dict of arrays under `key`, and evict old entries if needed
+        '''
+
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self._path)
+
+        with os.fdopen(fd, 'wb') as fout:
+            np.savez(fout, **arrays)
+
+        os.rename(tmp, self._fname(key))
+
+        self._evict()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _evict(self):
+
+        entries = list()
+        size    = 0
+
+        for fname in glob.glob('%s/*.npz' % self._path):
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                continue
+            entries.append([stat.st_mtime, stat.st_size, fname])
+            size += stat.st_size
+
+        for _, fsize, fname in sorted(entries):
+
+            if size <= self._max_size:
+                break
+
+            try:
+                os.unlink(fname)
+            except OSError:
+                pass
+
+            size -= fsize
+
+
+    # --------------------------------------------------------------------------
+    #
+    def clear(self):
+        '''
+        remove all entries
+        '''
+
+        for fname in glob.glob('%s/*.npz' % self._path):
+            try:
+                os.unlink(fname)
+            except OSError:
+                pass
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,192 @@
+
+import os
+import json
+
+import numpy as np
+
+import radical.utils as ru
+
+rep = ru.LogReporter(name='hf.sim')
+
+# the pipeline stages which are checkpointed, in order
+STALKS  = 'stalks'     # dried stalks         (farmer output)
+BAST    = 'bast'       # peeled bast          (peeler output)
+SPLICED = 'spliced'    # spliced bast         (stitcher input for sewing)
+SEWN    = 'bht'        # sewn BHT             (stitcher output)
+STAGES  = [STALKS, BAST, SPLICED, SEWN]
+
+MANIFEST = 'manifest.json'
+
+
+# ------------------------------------------------------------------------------
+#
+def pack(prefix, arrays):
+    '''
+    prefix all array names (`length` -> `<prefix>.length`), so that the
+    columns of several batches can be stored in one checkpoint stage
+    '''
+
+    return dict([['%s.%s' % (prefix, name), arr]
+                 for name, arr in arrays.items()])
+
+
+def unpack(prefix, arrays):
+    '''
+    return the arrays with the given prefix, with the prefix removed
+    '''
+
+    prefix = '%s.' % prefix
+
+    return dict([[name[len(prefix):], arr] for name, arr in arrays.items()
+                 if name.startswith(prefix)])
+
+
+# ------------------------------------------------------------------------------
+#
+class Checkpoint(object):
+    '''
+    A directory with the outputs of completed pipeline stages, so that an
+    interrupted run can resume from the latest completed stage.
+
+    Each stage output is a set of named numpy arrays (like
+    `StalkBatch.to_arrays()`), stored as one `.npy` file per array.  The
+    manifest (`manifest.json`) lists the completed stages and their arrays, and
+    records cfg and seed of the run, so that a checkpoint is not resumed with
+    a different configuration.  A stage only counts as completed once the
+    manifest is updated (which happens atomically), so a run which dies while
+    writing a checkpoint resumes from the stage before.
+
+    Arrays are loaded as copy-on-write memory maps: a resumed run only reads
+    the data it actually touches, and does not parse anything back into python
+    objects.
+
+    Checkpoints are taken at stage boundaries only: a run which dies within
+    a stage repeats that whole stage.  There are no checkpoints of a partial
+    BHT or of the peeler inventory, and streamed runs (`stream_pipeline()`)
+    are not checkpointed at all.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, path):
+
+        self._path     = path
+        self._manifest = None
+
+        if os.path.isfile(self._fname(MANIFEST)):
+            with open(self._fname(MANIFEST), 'r') as fin:
+                self._manifest = json.load(fin)
+
+
+    @property
+    def path(self):   return self._path
+    @property
+    def seed(self):   return self._manifest['seed'] if self._manifest else None
+    @property
+    def stages(self): return list(self._manifest['stages']) \
+                             if self._manifest else list()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _fname(self, name):
+
+        return '%s/%s' % (self._path, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _write_manifest(self):
+
+        tmp = self._fname('%s.tmp' % MANIFEST)
+        with open(tmp, 'w') as fout:
+            json.dump(self._manifest, fout, indent=2, sort_keys=True)
+
+        os.rename(tmp, self._fname(MANIFEST))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def open(self, cfg, seed):
+        '''
+        Start a new checkpoint for a run with the given cfg and seed, or make
+        sure that an existing one belongs to such a run.
+        '''
+
+        # normalize, as the manifest stores json
+        cfg = json.loads(json.dumps(cfg))
+
+        if self._manifest:
+
+            if self._manifest['cfg']  != cfg or \
+               self._manifest['seed'] != seed:
+                raise ValueError('checkpoint %s belongs to a different run'
+                                % self._path)
+            return
+
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+
+        self._manifest = {'cfg'   : cfg,
+                          'seed'  : seed,
+                          'stages': list(),
+                          'arrays': dict()}
+        self._write_manifest()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def latest(self):
+        '''
+        return the latest completed stage, or `None`
+        '''
+
+        stages = self.stages
+
+        if not stages:
+            return None
+
+        return max(stages, key=STAGES.index)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def save(self, stage, arrays):
+        '''
+        store the output arrays of a completed stage
+        '''
+
+        assert(self._manifest is not None), 'checkpoint not opened'
+        assert(stage in STAGES), 'unknown stage %s' % stage
+
+        for name, arr in arrays.items():
+            np.save(self._fname('%s.%s.npy' % (stage, name)), np.asarray(arr))
+
+        if stage not in self._manifest['stages']:
+            self._manifest['stages'].append(stage)
+
+        self._manifest['arrays'][stage] = sorted(arrays.keys())
+        self._write_manifest()
+
+        rep.info('checkpoint: %s\n' % stage)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def load(self, stage):
+        '''
+        return the output arrays of a completed stage, as memory maps
+        '''
+
+        assert(stage in self.stages), 'stage %s not checkpointed' % stage
+
+        ret = dict()
+        for name in self._manifest['arrays'][stage]:
+            fname     = self._fname('%s.%s.npy' % (stage, name))
+            ret[name] = np.load(fname, mmap_mode='c')
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+
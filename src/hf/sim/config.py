@@ -0,0 +1,151 @@
+
+import copy
+
+import radical.utils as ru
+
+from .distribution import check_beta
+from .bast         import PI, end_width_parameters
+
+
+# ------------------------------------------------------------------------------
+#
+# The default simulation configuration, with one section per stage.  The
+# `farmer.areas` entry lists the field sizes (m^2) planted in a run.
+#
+DEFAULT_CFG = {
+        'farmer'   : {'areas'           : [200],
+                      'sprout'          : {'min'  :   50,
+                                           'max'  :  100,
+                                           'mean' :   75,
+                                           'var'  :    5
+                                          },
+                      'length'          : {'min'  : 1000,
+                                           'max'  : 2500,
+                                           'mean' : 2000,
+                                           'var'  :    5
+                                          },
+                      'diameter'        : {'min'  :    4,
+                                           'max'  :   15,
+                                          },
+                      'accuracy'        :  None,  # inverse CDF tables
+                     },
+        'peeler'   : {'min_len'         :   300,
+                      'max_len'         :  1600,
+                      'min_dia'         :     6,
+                      'max_dia'         :    12,
+                      'prep_efficiency' :    99,  # in percent
+                      'peel_efficiency' :    90,  # in percent
+
+                      'success_min'     :     0,  # in percent of stalk length
+                      'success_max'     :   100,
+                      'success_mean'    :    90,
+                      'success_var'     :     1,
+                      'accuracy'        :  None,  # inverse CDF tables
+                     },
+        'stitcher' : {'resolution'      :    10,
+                      'splice_width'    :     7,
+                      'seg_width'       :    12,
+                      'seg_length'      :   500,
+                      'engine'          :  'event',
+                      'mode'            :  'continuous', # or 'sequential'
+                      'store'           :  None          # BHT rows directory
+                     },
+      }
+
+
+# ------------------------------------------------------------------------------
+#
+def get_cfg(path=None):
+    '''
+    Return a copy of the default configuration, or the configuration read from
+    the json file at `path` (which may contain `#` comments).
+    '''
+
+    if path:
+        return ru.read_json(path)
+
+    return copy.deepcopy(DEFAULT_CFG)
+
+
+# ------------------------------------------------------------------------------
+#
+def validate_cfg(cfg):
+    '''
+    Check a configuration before running it, and raise a `ValueError` which
+    lists all problems found: missing entries, empty or inverted ranges,
+    percentages out of range, unknown engine or mode names, and beta
+    distributions whose mean and variance are impossible for their range -
+    including the bast end width distribution at the thinnest bast the peeler
+    accepts.  `accuracy` entries are optional (see
+    `distribution.BetaDistribution`).
+    '''
+
+    errors = list()
+
+    def check(ok, msg):
+        if not ok:
+            errors.append(msg)
+
+    def beta(name, dmin, dmax, dmean, dvar):
+        try:
+            check_beta(dmin, dmax, dmean, dvar, name=name)
+        except ValueError as e:
+            errors.append(str(e))
+
+    def accuracy(name, section):
+        acc = section.get('accuracy')
+        check(acc is None or 0 < acc < 1,
+              '%s.accuracy: %s not in (0, 1)' % (name, acc))
+
+    try:
+        farmer = cfg['farmer']
+        check(len(farmer['areas']) and min(farmer['areas']) > 0,
+              'farmer.areas: need positive field areas')
+        for name in ['sprout', 'length']:
+            dist = farmer[name]
+            beta('farmer.%s' % name, dist['min'], dist['max'],
+                                     dist['mean'], dist['var'])
+        check(0 <= farmer['diameter']['min'] <= farmer['diameter']['max'],
+              'farmer.diameter: invalid range')
+        accuracy('farmer', farmer)
+
+        peeler = cfg['peeler']
+        check(0 <= peeler['min_len'] <= peeler['max_len'],
+              'peeler: invalid length range')
+        check(0 <= peeler['min_dia'] <= peeler['max_dia'],
+              'peeler: invalid diameter range')
+        for name in ['prep_efficiency', 'peel_efficiency']:
+            check(0 <= peeler[name] <= 100,
+                  'peeler.%s: %s not in [0, 100]' % (name, peeler[name]))
+        check(0 <= peeler['success_min'] and peeler['success_max'] <= 100,
+              'peeler.success: range not in [0, 100]')
+        beta('peeler.success', peeler['success_min'], peeler['success_max'],
+                               peeler['success_mean'], peeler['success_var'])
+        accuracy('peeler', peeler)
+
+        # the bast end width distribution gets narrower with the bast width:
+        # check it for the thinnest stalks which are peeled
+        dia   = max(peeler['min_dia'], farmer['diameter']['min'])
+        width = dia * PI / 2
+        beta('bast end width (stalk diameter %s)' % dia,
+             *end_width_parameters(width))
+
+        stitcher = cfg['stitcher']
+        for name in ['resolution', 'splice_width', 'seg_width', 'seg_length']:
+            check(stitcher[name] > 0,
+                  'stitcher.%s: %s is not positive' % (name, stitcher[name]))
+        check(stitcher.get('engine', 'step') in ['step', 'event'],
+              'stitcher.engine: unknown engine %s' % stitcher.get('engine'))
+        check(stitcher.get('mode', 'sequential') in ['sequential',
+                                                     'continuous'],
+              'stitcher.mode: unknown mode %s' % stitcher.get('mode'))
+
+    except KeyError as e:
+        errors.append('missing cfg entry %s' % e)
+
+    if errors:
+        raise ValueError('invalid cfg:\n  %s' % '\n  '.join(errors))
+
+
+# ------------------------------------------------------------------------------
+
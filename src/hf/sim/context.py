@@ -0,0 +1,394 @@
+
+import os
+import sys
+import atexit
+import tempfile
+
+import numpy as np
+
+import radical.utils as ru
+
+from .plot import Renderer
+from .plot import line_script
+from .plot import hist_script
+
+from .stats  import Accumulator
+from .ledger import ScrapLedger
+
+from .instrument import Instrument
+from .progress   import Progress, get_interval
+
+from .distribution import create_rng, derive_seed
+
+rep = ru.LogReporter(name='hf.sim')
+
+# all run directories are created below this directory
+DATA_ROOT = 'data'
+
+
+# ------------------------------------------------------------------------------
+#
+class Context(object):
+    '''
+    A `Context` represents a single simulation run.  It is passed to `Farmer`,
+    `Peeler`, `Stitcher` and `BHT`, and owns everything which must not be
+    shared between concurrent runs: the output directory, the plot file
+    counter, the stage statistics, the scrap ledger (see `ledger`) and the
+    stage measurements (see `instrument`).
+
+    Stage histograms are not built from lists of values: each `hist_plot()`
+    call updates an online `Accumulator` (binned histogram, moments, quantiles)
+    for that plot, and the binned results are rendered on `flush()`.
+
+    With `plot=False` the run is headless: nothing is written to disk and no
+    renderer is started - the stage results are available in `results`
+    instead, keyed by plot name.  A plotting context is closed with `close()`
+    (which renders the pending plots and stops its renderer) - contexts which
+    are still open at exit are closed then.
+
+    A context created with a `seed` gives each stage its own random stream,
+    derived from that seed and the stage name (see `rng()`), so that a run is
+    reproducible, and runs with different seeds are independent.  Stages which
+    can be spread over several processes (like growing the fields) use up to
+    `workers` processes - the results do not depend on that number.
+
+    The stage methods record their wall time, item counts and peak memory via
+    `stage()`, and can be profiled (see `instrument.Instrument` for `profile`
+    and the `HF_SIM_PROFILE` environment variable).  Long running stages
+    report their progress via `progress()`, every `progress` seconds (see
+    `progress.get_interval()` for the default).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, path=None, plot=True, seed=None, workers=1,
+                       profile=None, progress=None):
+        '''
+        path: output directory (default: a new unique directory below `data/`,
+              created on the first plot)
+        plot: render plots (default), or run headless
+        seed: root seed for the stage random streams (default: use the module
+              wide generator, see `distribution.get_rng()`)
+        workers: number of processes a stage may use (seeded runs only)
+        profile: profile the stages (`cprofile` or `tracemalloc`, see
+              `Instrument`)
+        progress: progress report interval in seconds (`0`: no reports)
+        '''
+
+        self._path     = path
+        self._plot     = plot
+        self._seed     = seed
+        self._workers  = workers
+        self._rngs     = dict()    # random streams by stage name
+        self._fnum     = 0
+        self._renderer = None
+        self._lines    = dict()    # line plot data
+        self._stats    = dict()    # accumulators for histograms
+        self._ledger   = ScrapLedger()
+        self._instrument = Instrument(profile, path=lambda: self.path)
+        self._interval = get_interval(progress)
+        self._labels   = dict()    # plot labels for histograms
+        self._bases    = dict()    # plot file names
+        self._dirty    = set()     # histograms to be rendered
+        self._names    = list()
+
+
+    @property
+    def plot(self):  return self._plot
+    @property
+    def stats(self): return self._stats
+    @property
+    def names(self): return list(self._names)
+    @property
+    def labels(self): return dict(self._labels)
+    @property
+    def seed(self):  return self._seed
+    @property
+    def workers(self): return self._workers
+    @property
+    def ledger(self):  return self._ledger
+    @property
+    def instrument(self): return self._instrument
+
+
+    # --------------------------------------------------------------------------
+    #
+    def rng(self, name):
+        '''
+        Return the random number generator for the stage `name`.  That is
+        `None` for a context without seed, which makes all sampling calls fall
+        back to the module wide generator.
+        '''
+
+        if self._seed is None:
+            return None
+
+        if name not in self._rngs:
+            self._rngs[name] = create_rng(derive_seed(self._seed, name))
+
+        return self._rngs[name]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stage(self, name):
+        '''
+        measure (and possibly profile) the enclosed block as stage `name` -
+        this yields a `StageRecord` to set the item counts on:
+
+            with ctx.stage('peeler.peel') as rec:
+                rec.items_in = len(stalks)
+                ...
+        '''
+
+        return self._instrument.stage(name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def progress(self, name, total=None):
+        '''
+        return a `Progress` for a stage working through `total` items
+        '''
+
+        return Progress(name, total=total, interval=self._interval)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def results(self):
+        '''
+        Stage results by plot name: a dict of accumulated statistics (see
+        `Accumulator.result()`) for histograms, a numpy array for line plots.
+        '''
+
+        ret = dict()
+        for name in self._names:
+            if name in self._stats: ret[name] = self._stats[name].result()
+            else                  : ret[name] = self._lines[name]
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def path(self):
+        '''
+        the run's output directory (created on first access)
+        '''
+
+        if self._path is None:
+            if not os.path.isdir(DATA_ROOT):
+                os.makedirs(DATA_ROOT)
+            self._path = tempfile.mkdtemp(prefix='run.', dir=DATA_ROOT)
+
+        elif not os.path.isdir(self._path):
+            os.makedirs(self._path)
+
+        return self._path
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _base(self, name):
+
+        base        = '%s/%02d_%s' % (self.path, self._fnum, name)
+        self._fnum += 1
+
+        return base
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _render(self, base, plot, data, fmt, header=''):
+
+        if not self._renderer:
+            self._renderer = Renderer()
+            _open.add(self)
+
+        self._renderer.submit(base, plot, data, fmt, header)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def line_plot(self, fname, title, ptitle, xlabel, ylabel, data):
+        '''
+        plot `data` (pairs of x and y values) as line
+        '''
+
+        if fname not in self._names:
+            self._names.append(fname)
+
+        if not self._plot:
+            self._lines[fname] = np.asarray(data)
+            return
+
+        base = self._base(fname)
+        plot = line_script(base, title, ptitle, xlabel, ylabel)
+
+        self._render(base, plot, data, '%7.2f\t%7.1f')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def hist_plot(self, fname, title, ptitle, xlabel, ylabel, data):
+        '''
+        Add `data` to the histogram of that name.  The histogram is rendered
+        on the next `flush()`.
+        '''
+
+        if fname not in self._stats:
+
+            self._names.append(fname)
+            self._stats [fname] = Accumulator()
+            self._labels[fname] = [title, ptitle, xlabel, ylabel]
+
+            if self._plot:
+                _open.add(self)
+                self._bases[fname] = self._base(fname)
+
+        self._stats[fname].update(data)
+        self._dirty.add(fname)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, stats, labels=None):
+        '''
+        merge the accumulators from another context's `stats` into this one
+        (histograms are only plotted if the other context's `labels` are given
+        as well)
+        '''
+
+        if not labels:
+            labels = dict()
+
+        for name, acc in stats.items():
+
+            if name not in self._stats:
+                self._names.append(name)
+                self._stats[name] = Accumulator()
+
+            if name in labels and name not in self._labels:
+                self._labels[name] = labels[name]
+                if self._plot:
+                    _open.add(self)
+                    self._bases[name] = self._base(name)
+
+            self._stats[name].merge(acc)
+            self._dirty.add(name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _render_hists(self):
+
+        for name in self._names:
+
+            if name not in self._dirty or name not in self._bases:
+                continue
+
+            acc    = self._stats[name]
+            res    = acc.result()
+            header = 'n: %d  mean: %.2f  std: %.2f  min: %s  max: %s' \
+                   % (res['n'], res['mean'], res['std'], res['min'], res['max'])
+            data   = np.column_stack([res['bins'], res['counts']])
+            plot   = hist_script(self._bases[name], *(self._labels[name] +
+                                                      [acc.hist.width or 1]))
+
+            self._render(self._bases[name], plot, data, '%g\t%d', header)
+
+        self._dirty = set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def flush(self):
+        '''
+        render all pending histograms and wait until all plots of this run are
+        rendered
+        '''
+
+        if self._plot:
+            self._render_hists()
+
+        if self._renderer:
+            self._renderer.flush()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+        '''
+        render all pending plots and stop the renderer - plotting again starts
+        a new one
+        '''
+
+        self.flush()
+
+        if self._renderer:
+            self._renderer.close()
+            self._renderer = None
+
+        _open.discard(self)
+
+
+# ------------------------------------------------------------------------------
+#
+# plotting contexts which are not closed yet, closed at exit
+_open = set()
+
+
+def _close_all():
+
+    for ctx in list(_open):
+        ctx.close()
+
+
+atexit.register(_close_all)
+
+
+# ------------------------------------------------------------------------------
+#
+_context = None
+
+
+def get_context():
+    '''
+    Return the default context, used by all components which are not given an
+    explicit one.  It writes into `data/` directly, as before contexts existed.
+    '''
+
+    global _context
+
+    if _context is None:
+        _context = Context(path=DATA_ROOT)
+
+    return _context
+
+
+def flush_plots():
+    '''
+    wait until all plots of the default context are rendered
+    '''
+
+    if _context is not None:
+        _context.flush()
+
+
+# ------------------------------------------------------------------------------
+#
+def create_line_plot(fname, title, ptitle, xlabel, ylabel, data):
+
+    get_context().line_plot(fname, title, ptitle, xlabel, ylabel, data)
+
+
+def create_hist_plot(fname, title, ptitle, xlabel, ylabel, data):
+
+    get_context().hist_plot(fname, title, ptitle, xlabel, ylabel, data)
+
+
+# ------------------------------------------------------------------------------
+
@@ -1,211 +1,555 @@
 
 import os
 import sys
-import random
+import math
+import hashlib
+
+import numpy as np
+
+# size of the blocks pre-drawn by a `Sampler`
+BLOCK_SIZE = 4096
+
+# iteration limit and precision of the incomplete beta function
+BETA_ITER  = 300
+BETA_EPS   = 1e-12
+
+_rng      = None
+_samplers = dict()
+_dists    = dict()
 
-fnum = 0
 
 # ------------------------------------------------------------------------------
 #
-# see https://stats.stackexchange.com/questions/12232/
-# 
-def create_beta_distribution(n, dmin, dmax, dmean, dvar):
+def create_rng(seed=None):
+    '''
+    Create a new random number generator, seeded with `seed` (or from OS
+    entropy if `seed` is `None`).  We use a `numpy.random.Generator` where
+    numpy provides one, and fall back to `numpy.random.RandomState` on older
+    numpy versions (which is the last thing available for python 2.7).  Both
+    provide the `beta()` and `uniform()` calls we use below.
     '''
-    Create `n` numbers according to a beta distribution with the given boundary
-    conditions:
 
-      dmin: lower bound of the distribution
-      dmax: upper bound of the distribution
-      dmax: mean        of the distribution
-      dvar: variance    of the distribution
+    if hasattr(np.random, 'default_rng'):
+        return np.random.default_rng(seed)
+
+    return np.random.RandomState(seed)
+
+
+# ------------------------------------------------------------------------------
+#
+def derive_seed(seed, *keys):
+    '''
+    Derive the seed of an independent random stream from a root `seed` and
+    a sequence of keys, like `derive_seed(42, 'replicate', 7)`.  The same
+    arguments always result in the same seed, different keys in unrelated
+    seeds.  The seed is a list of four 32 bit words, which both generator types
+    accept (see `create_rng()`).
+    '''
+
+    digest = hashlib.sha256(repr((seed,) + keys).encode('utf-8')).hexdigest()
+
+    return [int(digest[i:i + 8], 16) for i in range(0, 32, 8)]
+
+
+# ------------------------------------------------------------------------------
+#
+def get_rng():
+    '''
+    Return the module wide default random number generator, which is used
+    whenever no explicit generator is passed to the sampling calls.
+    '''
+
+    global _rng
+
+    if _rng is None:
+        _rng = create_rng()
+
+    return _rng
+
+
+# ------------------------------------------------------------------------------
+#
+def set_seed(seed):
+    '''
+    Reseed the module wide default random number generator.  This also drops
+    all values pre-drawn by the default samplers, so that a seeded run is
+    reproducible.
+    '''
+
+    global _rng
+
+    _rng = create_rng(seed)
+    _samplers.clear()
+
+
+# ------------------------------------------------------------------------------
+#
+# see https://stats.stackexchange.com/questions/12232/
+#
+def beta_parameters(dmin, dmax, dmean, dvar):
+    '''
+    Derive the shape parameters `(alpha, beta)` of a beta distribution with the
+    given boundary conditions (see `create_beta_distribution`).  All arguments
+    can also be numpy arrays, in which case arrays of parameters are returned.
     '''
 
-    vmin  = float(dmin)
-    vmax  = float(dmax)
-    vmean = float(dmean)
-    vvar  = float(dvar)
+    vmin  = np.asarray(dmin,  dtype=float)
+    vmax  = np.asarray(dmax,  dtype=float)
+    vmean = np.asarray(dmean, dtype=float)
+    vvar  = np.asarray(dvar,  dtype=float)
+
+    check_beta(vmin, vmax, vmean, vvar)
 
     dif   =  vmax  - vmin
     wmean = (vmean - vmin) / dif   # weighted mean in 0..1 range
     wvar  =  vvar / dif            # weighted variance
 
-  # print vmin
-  # print vmax
-  # print dif
-  # print wmean
-  # print wvar
-    
-    assert(wmean > 0 and wmean < 1.00)
-  # assert(wvar  > 0 and wvar  < 0.25)
-    
     alpha = ((1 - wmean) / wvar - 1 / wmean) * wmean**2
     beta  = alpha * (1 / wmean - 1)
-    vals  = list()
 
-    for n in range(n):
-        vals.append((random.betavariate(alpha, beta) * dif) + vmin)
-    
-    # mode: most frequent value
-    mode     = (((alpha - 1) / (alpha + beta - 2)      ) * dif) + vmin
-    mean     = ((1 / (1 + beta  /   alpha)             ) * dif) + vmin
-    median   = (((alpha -  1/3) / ( alpha + beta - 2/3)) * dif) + vmin
-    variance = (((alpha * beta) / ((alpha + beta)**2 * (alpha + beta + 1))) * dif)
-    
-  # print 'alpha   : %3.2f' % alpha
-  # print 'beta    : %3.2f' % beta
-  # print 'min     : %3.2f' % vmin
-  # print 'max     : %3.2f' % vmax
-  # print 'mode    : %3.2f' % mode
-  # print 'mean    : %3.2f' % mean
-  # print 'median  : %3.2f' % median
-  # print 'variance: %3.2f' % variance
+    return alpha, beta
+
+
+# ------------------------------------------------------------------------------
+#
+def check_beta(dmin, dmax, dmean, dvar, name='beta distribution'):
+    '''
+    Raise a `ValueError` if no beta distribution has the given boundary
+    conditions (see `create_beta_distribution`): the mean must lie strictly
+    between min and max, and the variance must be positive and small enough
+    for both shape parameters to be positive.  All arguments can be arrays.
+    '''
+
+    vmin  = np.asarray(dmin,  dtype=float)
+    vmax  = np.asarray(dmax,  dtype=float)
+    vmean = np.asarray(dmean, dtype=float)
+    vvar  = np.asarray(dvar,  dtype=float)
+
+    if not np.all(vmin < vmax):
+        raise ValueError('%s: min %s must be smaller than max %s'
+                        % (name, dmin, dmax))
+
+    dif   =  vmax  - vmin
+    wmean = (vmean - vmin) / dif
+    wvar  =  vvar / dif
+
+    if not (np.all(wmean > 0) and np.all(wmean < 1)):
+        raise ValueError('%s: mean %s must lie between min %s and max %s'
+                        % (name, dmean, dmin, dmax))
 
-    return vals
+    # alpha > 0 and beta > 0 need wvar < wmean * (1 - wmean)
+    if not (np.all(wvar > 0) and np.all(wvar < wmean * (1 - wmean))):
+        raise ValueError('%s: variance %s is impossible for min %s, max %s '
+                         'and mean %s' % (name, dvar, dmin, dmax, dmean))
 
 
 # ------------------------------------------------------------------------------
-# 
-def create_flat_distribution(n, dmin, dmax):
+#
+def _beta_fraction(a, b, x):
     '''
-    create a flat distribution of values in the given range
+    continued fraction of the incomplete beta function (modified Lentz), for
+    an array of `x`
+    '''
+
+    tiny = 1e-300
+    qab  = a + b
+    qap  = a + 1
+    qam  = a - 1
+
+    def clip(v):
+        return np.where(np.abs(v) < tiny, tiny, v)
+
+    c = np.ones_like(x)
+    d = 1 / clip(1 - qab * x / qap)
+    h = d
+
+    for m in range(1, BETA_ITER + 1):
+
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d  = 1 / clip(1 + aa * d)
+        c  =     clip(1 + aa / c)
+        h *= d * c
+
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d  = 1 / clip(1 + aa * d)
+        c  =     clip(1 + aa / c)
+        h *= d * c
+
+        if np.all(np.abs(d * c - 1) < BETA_EPS):
+            break
+
+    return h
+
+
+def beta_cdf(x, alpha, beta):
+    '''
+    the CDF of the beta distribution `(alpha, beta)` on `[0, 1]` (regularized
+    incomplete beta function) at `x` (scalar or array)
+    '''
+
+    x   = np.clip(np.asarray(x, dtype=float), 0.0, 1.0)
+    ret = np.where(x < 1, 0.0, 1.0)
+    idx = (x > 0) & (x < 1)
+    xi  = x[idx]
+
+    if not len(xi):
+        return ret
+
+    lbt = math.lgamma(alpha + beta) - math.lgamma(alpha) - math.lgamma(beta)
+    bt  = np.exp(lbt + alpha * np.log(xi) + beta * np.log(1 - xi))
+
+    # the continued fraction converges fast below the mean, use the symmetry
+    # relation above it
+    low  = xi < (alpha + 1) / (alpha + beta + 2)
+    vals = np.empty(len(xi))
+    vals[ low] = bt[low] * _beta_fraction(alpha, beta, xi[low]) / alpha
+    vals[~low] = 1 - bt[~low] * _beta_fraction(beta, alpha, 1 - xi[~low]) \
+                              / beta
+
+    ret[idx] = np.clip(vals, 0.0, 1.0)
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class BetaDistribution(object):
+    '''
+    A beta distribution with fixed boundary conditions (see
+    `create_beta_distribution`).  The boundary conditions are checked and the
+    shape parameters derived once, when the distribution is created.
+
+    With an `accuracy`, values are drawn through a tabulated inverse CDF: the
+    CDF is computed on a grid of spacing `accuracy` over the normalized range,
+    and uniform random numbers are mapped through it by linear interpolation.
+    A value drawn that way lies in the same grid cell as the exact inverse CDF
+    of its uniform number, so it is off by at most `accuracy * (dmax - dmin)`.
+    Without an `accuracy`, values are drawn by the generator's beta sampler
+    (which results in a different random sequence).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, dmin, dmax, dmean, dvar, accuracy=None):
+
+        self.dmin     = dmin
+        self.dmax     = dmax
+        self.dmean    = dmean
+        self.dvar     = dvar
+        self.accuracy = accuracy
+        self.dif      = float(dmax) - float(dmin)
+
+        alpha, beta   = beta_parameters(dmin, dmax, dmean, dvar)
+        self.alpha    = float(alpha)
+        self.beta     = float(beta)
+
+        self._grid    = None
+        self._cdf     = None
+
+        if accuracy is not None:
+
+            if not 0 < accuracy < 1:
+                raise ValueError('accuracy %s not in (0, 1)' % accuracy)
+
+            n          = int(math.ceil(1.0 / accuracy)) + 1
+            self._grid = np.linspace(0.0, 1.0, n)
+            self._cdf  = np.maximum.accumulate(beta_cdf(self._grid, self.alpha,
+                                                                    self.beta))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cdf(self, x):
+        '''
+        the CDF at `x` (scalar or array, in the distribution's range)
+        '''
+
+        return beta_cdf((np.asarray(x, dtype=float) - self.dmin) / self.dif,
+                        self.alpha, self.beta)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def ppf(self, u):
+        '''
+        the inverse CDF at `u` (scalar or array in [0, 1]), from the table
+        '''
+
+        if self._cdf is None:
+            raise ValueError('inverse CDF needs a distribution with accuracy')
+
+        return np.interp(u, self._cdf, self._grid) * self.dif + self.dmin
+
+
+    # --------------------------------------------------------------------------
+    #
+    def sample(self, n, rng=None):
+        '''
+        draw `n` values (as numpy array)
+        '''
+
+        if rng is None:
+            rng = get_rng()
+
+        if self._cdf is not None:
+            return self.ppf(rng.uniform(0.0, 1.0, size=n))
+
+        return (rng.beta(self.alpha, self.beta, size=n) * self.dif) + self.dmin
+
+
+# ------------------------------------------------------------------------------
+#
+class FlatDistribution(object):
+    '''
+    a flat distribution over `[dmin, dmax)` (see `create_flat_distribution`)
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, dmin, dmax):
+
+        if not dmin <= dmax:
+            raise ValueError('flat distribution: min %s must not exceed max %s'
+                            % (dmin, dmax))
+
+        self.dmin = dmin
+        self.dmax = dmax
+
+
+    # --------------------------------------------------------------------------
+    #
+    def sample(self, n, rng=None):
+
+        if rng is None:
+            rng = get_rng()
+
+        return rng.uniform(self.dmin, self.dmax, size=n)
+
+
+# ------------------------------------------------------------------------------
+#
+def beta_distribution(dmin, dmax, dmean, dvar, accuracy=None):
+    '''
+    Return the `BetaDistribution` with the given boundary conditions and
+    accuracy.  Distributions are immutable, and are shared between all callers
+    with the same arguments.
+    '''
+
+    key = ('beta', dmin, dmax, dmean, dvar, accuracy)
+    if key not in _dists:
+        _dists[key] = BetaDistribution(dmin, dmax, dmean, dvar,
+                                       accuracy=accuracy)
+
+    return _dists[key]
+
+
+def cfg_distribution(cfg, accuracy=None):
+    '''
+    Return the distribution described by a cfg section: a `BetaDistribution`
+    for sections with `min`, `max`, `mean` and `var`, a `FlatDistribution` for
+    sections with `min` and `max` only.
+    '''
+
+    if 'mean' in cfg or 'var' in cfg:
+        return beta_distribution(cfg['min'], cfg['max'], cfg['mean'],
+                                 cfg['var'], accuracy=accuracy)
+
+    return FlatDistribution(cfg['min'], cfg['max'])
+
+
+# ------------------------------------------------------------------------------
+#
+def create_beta_array(n, dmin, dmax, dmean, dvar, rng=None):
+    '''
+    Same as `create_beta_distribution`, but draws all `n` numbers in a single
+    call and returns them as numpy array.  The boundary conditions can also be
+    given as arrays of length `n`, to draw each number from its own
+    distribution.
+    '''
+
+    if np.isscalar(dmin) and np.isscalar(dmax) and \
+       np.isscalar(dmean) and np.isscalar(dvar):
+        # the shape parameters of fixed boundary conditions are derived once
+        return beta_distribution(dmin, dmax, dmean, dvar).sample(n, rng=rng)
+
+    if rng is None:
+        rng = get_rng()
+
+    alpha, beta = beta_parameters(dmin, dmax, dmean, dvar)
+    dif = np.asarray(dmax, dtype=float) - np.asarray(dmin, dtype=float)
+
+    return (rng.beta(alpha, beta, size=n) * dif) + dmin
+
+
+# ------------------------------------------------------------------------------
+#
+def create_flat_array(n, dmin, dmax, rng=None):
+    '''
+    Same as `create_flat_distribution`, but draws all `n` numbers in a single
+    call and returns them as numpy array.
+    '''
+
+    if rng is None:
+        rng = get_rng()
+
+    return rng.uniform(dmin, dmax, size=n)
+
+
+# ------------------------------------------------------------------------------
+#
+def create_beta_distribution(n, dmin, dmax, dmean, dvar, rng=None):
+    '''
+    Create `n` numbers according to a beta distribution with the given boundary
+    conditions:
 
       dmin: lower bound of the distribution
       dmax: upper bound of the distribution
+      dmax: mean        of the distribution
+      dvar: variance    of the distribution
     '''
 
-    dif = dmax - dmin
+    return create_beta_array(n, dmin, dmax, dmean, dvar, rng=rng).tolist()
 
-    vals = list()
-    for n in range(n):
-        vals.append((random.random() * dif) + dmin)
 
-    mean = sum(vals) / float(n)
-    
-  # print 'min     : %3.2f' % dmin
-  # print 'max     : %3.2f' % dmax
-  # print 'mean    : %3.2f' % mean
+# ------------------------------------------------------------------------------
+#
+def create_flat_distribution(n, dmin, dmax, rng=None):
+    '''
+    create a flat distribution of values in the given range
+
+      dmin: lower bound of the distribution
+      dmax: upper bound of the distribution
+    '''
+
+    return create_flat_array(n, dmin, dmax, rng=rng).tolist()
 
-    return vals
 
 # ------------------------------------------------------------------------------
 #
-def create_line_plot(fname, title, ptitle, xlabel, ylabel, data):
+class Sampler(object):
+    '''
+    A `Sampler` hands out values of a fixed distribution one (or a few) at
+    a time, but draws them from the random number generator in blocks of
+    `block` values.  This is used in places which consume values one by one,
+    where calling into numpy for each single value would be much slower than
+    the draw itself.
+    '''
 
-    global fnum
-    fname = '%02d_%s' % (fnum, fname)
-    fnum += 1
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, draw, rng=None, block=BLOCK_SIZE):
+        '''
+        draw : callable `draw(n, rng)` which returns a numpy array of `n` values
+        rng  : generator to draw from (default: module wide generator)
+        block: number of values to pre-draw at once
+        '''
 
-    plot = '''#!/usr/bin/env gnuplot
+        self._draw  = draw
+        self._rng   = rng
+        self._block = block
+        self._buf   = np.empty(0)
+        self._pos   = 0
 
-fname = "data/%(fname)s.dat"
-stats fname using 1 nooutput
-set   terminal dumb
 
-set autoscale                          # scale axes automatically
-set xtic auto                          # set xtics automatically
-set ytic auto                          # set ytics automatically
-set title  "%(title)s"
-set xlabel "%(xlabel)s"
-set ylabel "%(ylabel)s"
+    # --------------------------------------------------------------------------
+    #
+    def _refill(self):
 
-set yrange [0:]
+        rng       = self._rng if self._rng is not None else get_rng()
+        self._buf = self._draw(self._block, rng)
+        self._pos = 0
 
-# define reasonably sized boxes for the hist plot in range 0..1.  Those boxes
-# get scaled to the actual data range later on, in `hist()`.
-n     = 100              # number of intervals
-min   = STATS_min        # min value
-max   = STATS_max        # max value
-width = (max - min) / n  # interval width
 
-# function used to map a value to the intervals
-hist(x,width) = width * floor(x / width) + width / 2.0
+    # --------------------------------------------------------------------------
+    #
+    def get(self):
+        '''
+        return a single value
+        '''
 
-# count and plot
-set  boxwidth width * 1.0
-# plot fname u (hist($1,width)):(1.0) title '%(ptitle)s' smooth freq w boxes lc rgb"green"
-plot fname u 1:2 title 'thickness' with lines lc rgb"green"
+        if self._pos >= len(self._buf):
+            self._refill()
 
-pause 1
+        val        = self._buf[self._pos]
+        self._pos += 1
 
-set terminal png
-set output 'data/%(fname)s.png'
-replot
+        return float(val)
 
-    ''' % { 'title'  : title , 
-            'ptitle' : ptitle, 
-            'xlabel' : xlabel,
-            'ylabel' : ylabel,
-            'fname'  : fname }
 
-    with open('data/%s.plot' % fname, 'w') as f:
-        f.write(plot)
+    # --------------------------------------------------------------------------
+    #
+    def take(self, n):
+        '''
+        return an array of `n` values
+        '''
 
-    with open('data/%s.dat' % fname, 'w') as f:
-        for d in data:
-            f.write('%7.2f\t%7.1f\n' % (d[0], d[1]))
+        ret = list()
+        while n > 0:
+            if self._pos >= len(self._buf):
+                self._refill()
+            chunk      = self._buf[self._pos:self._pos + n]
+            self._pos += len(chunk)
+            n         -= len(chunk)
+            ret.append(chunk)
 
-    os.system('chmod 0755 data/%s.plot' % fname)
-    os.system('data/%s.plot' % fname)
+        if not ret:
+            return np.empty(0)
+
+        return np.concatenate(ret)
 
 
 # ------------------------------------------------------------------------------
 #
-def create_hist_plot(fname, title, ptitle, xlabel, ylabel, data):
-
-    global fnum
-    fname = '%02d_%s' % (fnum, fname)
-    fnum += 1
+def beta_sampler(dmin, dmax, dmean, dvar, rng=None, block=BLOCK_SIZE,
+                 accuracy=None):
+    '''
+    Return a `Sampler` for the given beta distribution (see `BetaDistribution`
+    for `accuracy`).  Samplers on the default generator are shared between
+    callers with the same boundary conditions.
+    '''
 
-    plot = '''#!/usr/bin/env gnuplot
+    draw = beta_distribution(dmin, dmax, dmean, dvar, accuracy=accuracy).sample
 
-fname = "data/%(fname)s.dat"
-stats fname using 1 nooutput
-set   terminal dumb
+    if rng is not None:
+        return Sampler(draw, rng=rng, block=block)
 
-set autoscale                          # scale axes automatically
-set xtic auto                          # set xtics automatically
-set ytic auto                          # set ytics automatically
-set title  "%(title)s"
-set xlabel "%(xlabel)s"
-set ylabel "%(ylabel)s"
+    key = ('beta', dmin, dmax, dmean, dvar, accuracy)
+    if key not in _samplers:
+        _samplers[key] = Sampler(draw, block=block)
 
-set yrange [0:]
+    return _samplers[key]
 
-# define reasonably sized boxes for the hist plot in range 0..1.  Those boxes
-# get scaled to the actual data range later on, in `hist()`.
-n     = 100              # number of intervals
-min   = STATS_min        # min value
-max   = STATS_max        # max value
-width = (max - min) / n  # interval width
 
-# function used to map a value to the intervals
-hist(x,width) = width * floor(x / width) + width / 2.0
+# ------------------------------------------------------------------------------
+#
+def flat_sampler(dmin, dmax, rng=None, block=BLOCK_SIZE):
+    '''
+    Return a `Sampler` for the given flat distribution.  Samplers on the default
+    generator are shared between callers with the same boundary conditions.
+    '''
 
-# count and plot
-set  boxwidth width * 1.0
-plot fname u (hist($1,width)):(1.0) title '%(ptitle)s' smooth freq w boxes lc rgb"green"
+    def draw(n, rng):
+        return create_flat_array(n, dmin, dmax, rng=rng)
 
-# pause 1
+    if rng is not None:
+        return Sampler(draw, rng=rng, block=block)
 
-set terminal png
-set output 'data/%(fname)s.png'
-replot
+    key = ('flat', dmin, dmax)
+    if key not in _samplers:
+        _samplers[key] = Sampler(draw, block=block)
 
-    ''' % { 'title'  : title ,
-            'ptitle' : ptitle,
-            'xlabel' : xlabel,
-            'ylabel' : ylabel,
-            'fname'  : fname }
+    return _samplers[key]
 
-    with open('data/%s.plot' % fname, 'w') as f:
-        f.write(plot)
 
-    with open('data/%s.dat' % fname, 'w') as f:
-        for d in data:
-            f.write('%7.2f\n' % d)
+# ------------------------------------------------------------------------------
+#
+# plotting moved to `context.py` - keep the old import location working (this
+# import comes last, as `context.py` in turn imports from this module)
+#
+from .context import create_line_plot
+from .context import create_hist_plot
 
-    os.system('chmod 0755 data/%s.plot' % fname)
-    os.system('data/%s.plot' % fname)
 
 # ------------------------------------------------------------------------------
 
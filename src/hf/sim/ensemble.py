@@ -0,0 +1,251 @@
+
+import os
+import math
+import binascii
+import multiprocessing as mp
+
+import numpy as np
+
+import radical.utils as ru
+
+from .context      import Context
+from .cache        import StageCache, MAX_SIZE
+from .distribution import derive_seed
+from .pipeline     import run_pipeline
+from .progress     import Progress
+
+rep = ru.LogReporter(name='hf.sim')
+
+# z value for 95% confidence intervals (normal approximation, large n)
+CI_Z = 1.96
+
+# two-sided 95% quantiles of Student's t distribution, by degrees of freedom
+T_95 = [None,   12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228,  2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086,  2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042]
+
+# timeout for collecting a replicate result - this is only used so that the
+# worker pool can be interrupted (python 2 blocks signals in a plain `get()`)
+TIMEOUT = 60 * 60 * 24 * 365
+
+
+# ------------------------------------------------------------------------------
+#
+def _init_worker(quiet):
+    '''
+    pool initializer: silence the stage reports of the workers, as replicates
+    running concurrently would garble the terminal
+    '''
+
+    if quiet:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+
+# ------------------------------------------------------------------------------
+#
+def get_cache(cache):
+    '''
+    Stage caches are passed to worker processes as `[path, max_size]` (or
+    `None`) - return the respective `StageCache` instance.
+    '''
+
+    if not cache:
+        return None
+
+    return StageCache(*cache)
+
+
+# ------------------------------------------------------------------------------
+#
+def _replicate(args):
+    '''
+    run one replicate (headless, with its own random streams) and return its
+    BHT metrics
+    '''
+
+    cfg, seed, cache = args
+
+    ctx = Context(plot=False, seed=seed)
+    try:
+        bht = run_pipeline(cfg, ctx=ctx, cache=get_cache(cache))
+    finally:
+        ctx.close()
+
+    return bht.metrics()
+
+
+# ------------------------------------------------------------------------------
+#
+def t_95(df):
+    '''
+    return the two-sided 95% quantile of Student's t distribution for `df`
+    degrees of freedom (from a table up to 30, and the Cornish-Fisher
+    expansion around `CI_Z` beyond)
+    '''
+
+    if df < len(T_95):
+        return T_95[df]
+
+    z = CI_Z
+    return z + (z ** 3 + z) / (4.0 * df) \
+             + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96.0 * df ** 2)
+
+
+# ------------------------------------------------------------------------------
+#
+def summarize(metrics, z=None):
+    '''
+    Reduce a list of per-replicate metric dicts (see `BHT.metrics()`) into
+    a dict of statistics per metric: number of replicates `n`, `mean`, sample
+    `variance`, `std`, and the 95% confidence interval `ci` of the mean
+    (`mean -/+ t * std / sqrt(n)`, with the Student t quantile for `n - 1`
+    degrees of freedom, see `t_95()` - or with the given `z` value instead).
+    Metrics which are `None` for a replicate are skipped for that replicate.
+    '''
+
+    ret = dict()
+
+    if not metrics:
+        return ret
+
+    for key in sorted(metrics[0]):
+
+        values = np.array([m[key] for m in metrics if m[key] is not None],
+                          dtype=float)
+        n      = len(values)
+
+        if not n:
+            continue
+
+        mean = float(values.mean())
+        var  = float(values.var(ddof=1)) if n > 1 else 0.0
+        t    = z if z is not None else t_95(n - 1) if n > 1 else 0.0
+        half = t * math.sqrt(var / n)
+
+        ret[key] = {'n'       : n,
+                    'mean'    : mean,
+                    'variance': var,
+                    'std'     : math.sqrt(var),
+                    'ci'      : [mean - half, mean + half]}
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class Ensemble(object):
+    '''
+    A Monte Carlo ensemble: `n` independent replicates of the full production
+    chain (see `run_pipeline()`) for one configuration.  Replicate `i` runs in
+    a headless `Context` seeded with `derive_seed(seed, 'replicate', i)`, so
+    all replicates use independent random streams, and an ensemble with a given
+    seed is reproducible no matter how many workers run it.
+
+    Replicates are distributed over a pool of worker processes, one replicate
+    per task, and only the per-replicate metrics are sent back - the
+    replicates share nothing, so throughput scales with the number of cores.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg, n, seed=None, workers=None, quiet=True, z=None,
+                       cache=None, cache_size=MAX_SIZE):
+        '''
+        cfg    : simulation configuration (see `config.DEFAULT_CFG`)
+        n      : number of replicates
+        seed   : root seed (default: drawn from OS entropy, see `seed`)
+        workers: number of worker processes (default: number of cores, `1`
+                 runs all replicates in this process)
+        quiet  : suppress the stage reports of the worker processes
+        z      : z value for the confidence intervals (default: Student t
+                 quantile for 95%, see `summarize()`)
+        cache  : directory of a `StageCache` for the upstream stage outputs
+                 (default: no caching)
+        cache_size: size limit of that cache (bytes)
+        '''
+
+        if seed is None:
+            seed = int(binascii.hexlify(os.urandom(4)), 16)
+
+        if not workers:
+            workers = mp.cpu_count()
+
+        self._cfg     = cfg
+        self._seed    = seed
+        self._workers = min(workers, n) or 1
+        self._quiet   = quiet
+        self._z       = z
+        self._cache   = [cache, cache_size] if cache else None
+        self._seeds   = [derive_seed(seed, 'replicate', i) for i in range(n)]
+        self._metrics = None
+
+
+    @property
+    def seed(self):    return self._seed
+    @property
+    def seeds(self):   return list(self._seeds)
+    @property
+    def metrics(self): return self._metrics
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self):
+        '''
+        run all replicates, and return the summary of their metrics (see
+        `summarize()`).  The per-replicate metrics are available in `metrics`
+        afterwards, in replicate order.
+        '''
+
+        rep.header('Ensemble: %d replicates, %d workers, seed %s'
+                  % (len(self._seeds), self._workers, self._seed))
+
+        tasks   = [[self._cfg, seed, self._cache] for seed in self._seeds]
+        metrics = list()
+        prog    = Progress('replicates', total=len(tasks))
+
+        if self._workers == 1:
+            for task in tasks:
+                metrics.append(_replicate(task))
+                prog.update()
+
+        else:
+            pool = mp.Pool(self._workers, initializer=_init_worker,
+                           initargs=[self._quiet])
+            try:
+                results = pool.imap(_replicate, tasks, chunksize=1)
+                for _ in tasks:
+                    metrics.append(results.next(TIMEOUT))
+                    prog.update()
+                pool.close()
+
+            except:
+                pool.terminate()
+                raise
+
+            finally:
+                pool.join()
+
+        prog.close()
+        rep.ok('>> ok\n')
+
+        self._metrics = metrics
+
+        return self.summary()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def summary(self):
+        '''
+        return the summary of the replicate metrics (see `summarize()`)
+        '''
+
+        assert(self._metrics is not None)
+
+        return summarize(self._metrics, z=self._z)
+
+
+# ------------------------------------------------------------------------------
+
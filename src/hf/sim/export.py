@@ -0,0 +1,233 @@
+
+import os
+import json
+
+import numpy as np
+
+import radical.utils as ru
+
+try:
+    import pyarrow         as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from .cache import code_version
+
+rep = ru.LogReporter(name='hf.sim')
+
+# export formats
+PARQUET = 'parquet'    # one parquet file per table
+ARROW   = 'arrow'      # one arrow IPC file per table
+NPY     = 'npy'        # one `.npy` file per table column
+FORMATS = [PARQUET, ARROW, NPY]
+
+MANIFEST = 'export.json'
+
+# metadata key in the schema of arrow and parquet files
+META_KEY = 'hf.sim'
+
+
+# ------------------------------------------------------------------------------
+#
+class Exporter(object):
+    '''
+    Writes the per-entity tables of a run (see `run_pipeline()`) as columnar
+    files into the directory `path`:
+
+      stalks   : the harvested stalks (`StalkBatch` columns)
+      bast     : the peeled bast (`BastBatch` columns)
+      spliced  : the spliced bast which is sewn into BHT
+      bht      : the BHT, as piecewise linear segments or as rows (see `BHT`)
+      bht_joins: the rows at which bast was inserted into the BHT
+
+    The format is `parquet` or `arrow` (IPC files, which can be memory mapped)
+    if `pyarrow` is installed, and `npy` otherwise: one `.npy` file per column,
+    which `numpy.load(..., mmap_mode='r')` maps without parsing.  The manifest
+    (`export.json`) lists the tables with their schema (column names and
+    dtypes) and row counts, and records cfg, seed and code version of the run.
+    Arrow and parquet files carry the same metadata in their schema.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, path, fmt=None):
+
+        if fmt is None:
+            fmt = PARQUET if pa else NPY
+
+        if fmt not in FORMATS:
+            raise ValueError('unknown export format %s' % fmt)
+
+        if fmt != NPY and not pa:
+            raise ValueError('export format %s needs pyarrow' % fmt)
+
+        self._path     = path
+        self._fmt      = fmt
+        self._manifest = None
+
+
+    @property
+    def path(self):   return self._path
+    @property
+    def fmt(self):    return self._fmt
+    @property
+    def tables(self): return sorted(self._manifest['tables']) \
+                             if self._manifest else list()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _fname(self, name):
+
+        return '%s/%s' % (self._path, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def open(self, cfg, seed):
+        '''
+        start the export of a run with the given cfg and seed
+        '''
+
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+
+        self._manifest = {'format'      : self._fmt,
+                          'cfg'         : json.loads(json.dumps(cfg)),
+                          'seed'        : seed,
+                          'code_version': code_version(),
+                          'tables'      : dict()}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def write(self, name, columns, meta=None):
+        '''
+        write the table `name`, given as dict of equally long column arrays,
+        with optional table metadata (a json serializable dict)
+        '''
+
+        assert(self._manifest is not None), 'export not opened'
+
+        names   = sorted(columns)
+        columns = [np.ascontiguousarray(columns[col]) for col in names]
+        rows    = len(columns[0]) if columns else 0
+
+        for col, arr in zip(names, columns):
+            if len(arr) != rows:
+                raise ValueError('column %s.%s has %d rows, not %d'
+                                % (name, col, len(arr), rows))
+
+        info = {'rows'   : rows,
+                'columns': [[col, arr.dtype.str]
+                            for col, arr in zip(names, columns)],
+                'meta'   : meta or dict()}
+
+        if self._fmt == NPY:
+            info['files'] = dict()
+            for col, arr in zip(names, columns):
+                fname = '%s.%s.npy' % (name, col)
+                np.save(self._fname(fname), arr)
+                info['files'][col] = fname
+
+        else:
+            meta  = dict(self._manifest, tables=None, table=name, **info)
+            table = pa.Table.from_arrays([pa.array(arr) for arr in columns],
+                                         names=names)
+            table = table.replace_schema_metadata(
+                                         {META_KEY: json.dumps(meta)})
+
+            if self._fmt == PARQUET:
+                info['file'] = '%s.parquet' % name
+                pq.write_table(table, self._fname(info['file']))
+
+            else:
+                info['file'] = '%s.arrow' % name
+                with pa.OSFile(self._fname(info['file']), 'wb') as sink:
+                    writer = pa.ipc.new_file(sink, table.schema)
+                    writer.write_table(table)
+                    writer.close()
+
+        self._manifest['tables'][name] = info
+        self._write_manifest()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def write_bht(self, bht):
+        '''
+        write the tables `bht` and `bht_joins` for the given `BHT`
+        '''
+
+        arrays = bht.to_arrays()
+        meta   = {'res' : arrays.pop('res') .item(),
+                  'segw': arrays.pop('segw').item()}
+        joins  = arrays.pop('joins', None)
+
+        if 'segments.start' in arrays: meta['kind'] = 'segments'
+        else                         : meta['kind'] = 'rows'
+
+        prefix = '%s.' % meta['kind']
+        self.write('bht', dict([[name[len(prefix):], arr]
+                                for name, arr in arrays.items()]), meta=meta)
+
+        if joins is not None:
+            self.write('bht_joins', {'row': joins})
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _write_manifest(self):
+
+        tmp = self._fname('%s.tmp' % MANIFEST)
+        with open(tmp, 'w') as fout:
+            json.dump(self._manifest, fout, indent=2, sort_keys=True)
+
+        os.rename(tmp, self._fname(MANIFEST))
+
+
+# ------------------------------------------------------------------------------
+#
+def read_manifest(path):
+    '''
+    return the manifest of an export directory
+    '''
+
+    with open('%s/%s' % (path, MANIFEST), 'r') as fin:
+        return json.load(fin)
+
+
+# ------------------------------------------------------------------------------
+#
+def read_table(path, name):
+    '''
+    Return the table `name` of an export directory as dict of numpy arrays.
+    `npy` columns and arrow IPC files are memory mapped, not read.
+    '''
+
+    manifest = read_manifest(path)
+    info     = manifest['tables'][name]
+    fmt      = manifest['format']
+
+    if fmt == NPY:
+        return dict([[col, np.load('%s/%s' % (path, fname), mmap_mode='r')]
+                     for col, fname in info['files'].items()])
+
+    if not pa:
+        raise ValueError('reading %s exports needs pyarrow' % fmt)
+
+    fname = '%s/%s' % (path, info['file'])
+
+    if fmt == PARQUET:
+        table = pq.read_table(fname)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(fname, 'r')).read_all()
+
+    return dict([[col, table.column(col).to_numpy()]
+                 for col in table.schema.names])
+
+
+# ------------------------------------------------------------------------------
+
@@ -1,16 +1,21 @@
 
 import sys
+import multiprocessing as mp
+
+import numpy as np
 
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
 
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
+from .thing   import Thing
+from .context import get_context
+from .field import Field, grow_tile, GROWN
+from .distribution import derive_seed
+from .stalk import StalkBatch
 
-from .thing import Thing
-from .field import Field
+from .instrument import instrumented
 
 PI  = 3.1415926
 rep = ru.LogReporter(name='hf.sim')
@@ -28,25 +33,39 @@ class Farmer(Thing):
     directly translate into operations on those fields.
     '''
 
+    __slots__ = ['_cfg', '_ctx', '_fields', '_stalks']
+
+    MODEL     = [ACTIVE, RETIRED]
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, cfg):
+    def __init__(self, cfg, ctx=None):
+
+        if not ctx:
+            ctx = get_context()
 
         self._cfg    = cfg
+        self._ctx    = ctx
         self._fields = list()
-        self._stalks = list()
+        self._stalks = StalkBatch()
 
-        model = [ACTIVE, RETIRED]
-        super(Farmer, self).__init__(model, 'farmer')
+        super(Farmer, self).__init__('farmer')
 
         rep.header('Farmer')
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('farmer.plant',
+                  items_in =lambda self, areas: int(np.sum(areas)),
+                  items_out=lambda self, ret: sum([len(f.stalks)
+                                                   for f in self._fields]))
     def plant(self, areas):
         '''
-        Create a set of fields and sow hemp on them, then let them grow.
+        Create a set of fields and sow hemp on them, then let them grow.  With
+        a seeded context, each field gets its own random stream (derived from
+        the seed and the field's index), and the fields are grown tile by tile
+        on `ctx.workers` processes.
         '''
 
         assert(self.state == ACTIVE)
@@ -54,27 +73,118 @@ class Farmer(Thing):
         if not isinstance(areas, list):
             areas = [areas]
 
+        seed   = self._ctx.seed
+        fields = list()
         for area in areas:
-            self._fields.append(Field(area, self._cfg))
+            field = self._field(area, len(self._fields) + len(fields))
+            field.sow()
+            fields.append(field)
+
+        if seed is None or self._ctx.workers < 2:
+            for field in fields:
+                field.grow()
+
+        else:
+            tasks = [field.tiles() for field in fields]
+            pool  = mp.Pool(min(self._ctx.workers, sum(map(len, tasks))))
+            try:
+                tiles = pool.map(grow_tile, sum(tasks, []), chunksize=1)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+
+            for field, ftasks in zip(fields, tasks):
+                field.grow(tiles[:len(ftasks)])
+                tiles = tiles[len(ftasks):]
+
+        self._fields.extend(fields)
+
+        # only the new fields are added to the stage statistics
+        data = np.concatenate([field.nstalks for field in fields])
+
+        self._ctx.hist_plot(fname='stalk_density',
+                            title='Number of Stalks per Area',
+                            ptitle='area',
+                            xlabel='density of stalks [1/(m*m)]',
+                            ylabel='area [m^2]',
+                            data=data)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _field(self, area, idx):
+        '''
+        create the field with the given index (which defines its random stream
+        in a seeded context)
+        '''
+
+        seed = self._ctx.seed
+
+        if seed is None:
+            return Field(area, self._cfg, rng=self._ctx.rng('farmer'))
+
+        return Field(area, self._cfg, seed=derive_seed(seed, 'field', idx))
 
-        for field in self._fields:
+
+    # --------------------------------------------------------------------------
+    #
+    def stream(self, areas):
+        '''
+        Plant, grow, harvest and dry fields of the given areas tile by tile
+        (see `Field.stream()`), and yield the dried stalks of each tile as
+        `StalkBatch`.  Nothing is kept between tiles, so the memory used
+        depends on the tile size, not on the field sizes.  In a seeded context
+        the stalks are the same as those of `plant()`, `harvest()` and `dry()`.
+        '''
+
+        assert(self.state == ACTIVE)
+
+        if not isinstance(areas, list):
+            areas = [areas]
+
+        for area in areas:
+
+            field = self._field(area, len(self._fields))
             field.sow()
-            field.grow()
+            self._fields.append(field)
+
+            rep.header('Stream field %s: %d m^2' % (field.uid, area))
+
+            for nstalks, stalks in field.stream():
 
-        data = list()
-        for field in self._fields:
-            data.extend(field.nstalks)
+                stalks.dry()
 
-        create_hist_plot(fname='stalk_density',
-                         title='Number of Stalks per Area',
-                         ptitle='area',
-                         xlabel='density of stalks [1/(m*m)]',
-                         ylabel='area [m^2]',
-                         data=data)
+                self._ctx.hist_plot(fname='stalk_density',
+                                    title='Number of Stalks per Area',
+                                    ptitle='area',
+                                    xlabel='density of stalks [1/(m*m)]',
+                                    ylabel='area [m^2]',
+                                    data=nstalks)
+
+                self._ctx.hist_plot(fname='stalk_len',
+                                    title='Stalk Length Histogram',
+                                    ptitle='length',
+                                    xlabel='length [mm]',
+                                    ylabel='number of stalks',
+                                    data=stalks.length)
+
+                self._ctx.hist_plot(fname='stalk_dia',
+                                    title='Stalk Diameter Histogram',
+                                    ptitle='diameter',
+                                    xlabel='diameter [mm]',
+                                    ylabel='number of stalks',
+                                    data=stalks.diameter)
+
+                yield stalks
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('farmer.dry',
+                  items_in=lambda self: len(self._stalks))
     def dry(self):
         '''
         For all fields (or for a given specific field), collect and return all
@@ -86,55 +196,58 @@ class Farmer(Thing):
         rep.header('Dry harvest: %d stalks'
                  % sum([len(f.stalks) for f in self._fields]))
 
-        for stalk in self._stalks:
-            stalk.dry()
+        self._stalks.dry()
         rep.ok('>> ok')
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('farmer.harvest',
+                  items_out=lambda self, ret: len(self._stalks))
     def harvest(self):
         '''
-        For all fields, collect all grown stalks.
+        For all fields which are not harvested yet, collect all grown stalks.
         '''
 
         assert(self.state == ACTIVE)
 
+        fields = [f for f in self._fields if f.state == GROWN]
+
         rep.header('Harvest %d field(s): %s'
-                 % (len(self._fields), ' '.join([f.uid for f in self._fields])))
-        for field in self._fields:
-            self._stalks.extend(field.harvest())
+                 % (len(fields), ' '.join([f.uid for f in fields])))
+        harvested = list()
+        for field in fields:
+            harvested.append(field.harvest())
             rep.progress('.')
+        harvested    = StalkBatch.concat(harvested)
+        self._stalks = StalkBatch.concat([self._stalks, harvested])
         rep.ok('>> ok')
 
-        data = list()
-        for stalk in self._stalks:
-            data.append(stalk.len)
+        # only the harvested stalks are added to the stage statistics
+        data = harvested.length
 
-        create_hist_plot(fname='stalk_len',
-                         title='Stalk Length Histogram',
-                         ptitle='length',
-                         xlabel='length [mm]',
-                         ylabel='number of stalks',
-                         data=data)
+        self._ctx.hist_plot(fname='stalk_len',
+                            title='Stalk Length Histogram',
+                            ptitle='length',
+                            xlabel='length [mm]',
+                            ylabel='number of stalks',
+                            data=data)
 
-        data = list()
-        for stalk in self._stalks:
-            data.append(stalk.dia)
+        data = harvested.diameter
 
-        create_hist_plot(fname='stalk_dia',
-                         title='Stalk Diameter Histogram',
-                         ptitle='diameter',
-                         xlabel='diameter [mm]',
-                         ylabel='number of stalks',
-                         data=data)
+        self._ctx.hist_plot(fname='stalk_dia',
+                            title='Stalk Diameter Histogram',
+                            ptitle='diameter',
+                            xlabel='diameter [mm]',
+                            ylabel='number of stalks',
+                            data=data)
 
 
     # --------------------------------------------------------------------------
     #
     def get(self):
         '''
-        return all dried stalks
+        return all dried stalks (as `StalkBatch`)
         '''
 
         assert(self.state == ACTIVE)
@@ -143,7 +256,7 @@ class Farmer(Thing):
       # rep.ok('>> ok')
 
         ret = self._stalks
-        self._stalks = list()
+        self._stalks = StalkBatch()
         return ret
 
 
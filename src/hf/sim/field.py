@@ -1,16 +1,18 @@
 
 import sys
 
+import numpy as np
+
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
-
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
+from .distribution import create_beta_array
+from .distribution import create_flat_array
+from .distribution import create_rng, derive_seed, cfg_distribution
 
 from .thing import Thing
-from .stalk import Stalk
+from .stalk import StalkBatch
 
 PI  = 3.1415926
 rep = ru.LogReporter(name='hf.sim')
@@ -21,24 +23,81 @@ SOWN      = 'sown'
 GROWN     = 'grown'
 HARVESTED = 'harvested'
 
+# fields are grown in tiles of this many m^2, each with its own random stream
+TILE_AREA = 1000
+
+
+# ------------------------------------------------------------------------------
+#
+def draw_stalks(cfg, area, rng=None):
+    '''
+    Draw the number of stalks for each m^2 of `area`, and the geometry of all
+    those stalks.  Returns the array of stalk numbers per m^2, and the arrays
+    of stalk lengths and diameters.
+    '''
+
+    # FIXME: model loss over growth period
+    #
+    # we assume the following stalk parameter distributions
+    # length: 
+    # #/m^2   :  200 /  250 /  350 m^-2
+    # length  : 2.00 / 2.75 / 3.00 m
+    # diameter:    6 /    8 /   10 mm
+    # the distributions are derived from the cfg once, and shared by all tiles
+    accuracy    = cfg.get('accuracy')
+    sprout      = cfg_distribution(cfg['sprout'],   accuracy=accuracy)
+    length      = cfg_distribution(cfg['length'],   accuracy=accuracy)
+    diameter    = cfg_distribution(cfg['diameter'])
+
+    nstalks     = sprout.sample(area, rng=rng)
+
+    # draw the geometries for all stalks on all m^2 at once
+    total       = int(nstalks.astype(int).sum())
+    length_list = length  .sample(total, rng=rng)
+    diam_list   = diameter.sample(total, rng=rng)
+
+    return nstalks, length_list, diam_list
+
+
+# ------------------------------------------------------------------------------
+#
+def grow_tile(args):
+    '''
+    grow one tile (see `Field.tiles()`) - this is what worker processes run
+    '''
+
+    cfg, area, seed = args
+
+    return draw_stalks(cfg, area, rng=create_rng(seed))
+
 
 # ------------------------------------------------------------------------------
 #
 class Field(Thing):
 
+    __slots__ = ['_cfg', '_area', '_rng', '_seed', '_stalks', '_nstalks']
+
+    MODEL     = [FRESH, SOWN, GROWN, HARVESTED]
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, area, cfg): 
+    def __init__(self, area, cfg, rng=None, seed=None): 
         '''
         area: area of field in square meter (default: 1 acre == 10,000m^2)
+        rng : random number generator to grow the field with (default: module
+              wide generator)
+        seed: if given, the field is grown in tiles of `TILE_AREA` m^2, each
+              with its own random stream derived from this seed (`rng` is
+              then not used)
         '''
 
         self._cfg    = cfg
         self._area   = area
-        self._stalks = list()
+        self._rng    = rng
+        self._seed   = seed
+        self._stalks = StalkBatch()
 
-        model = [FRESH, SOWN, GROWN, HARVESTED]
-        super(Field, self).__init__(model, 'field')
+        super(Field, self).__init__('field')
 
         rep.header('Planting new field %s: %6d m^2' % (self.uid, area))
 
@@ -59,56 +118,61 @@ class Field(Thing):
 
     # --------------------------------------------------------------------------
     #
-    def grow(self):
+    def tiles(self):
+        '''
+        Return the growth tasks for the tiles of this field, as arguments for
+        `grow_tile()`.  Tiles have a fixed size and random streams derived from
+        the field seed, so the grown field does not depend on how (or where)
+        the tiles are grown.
+        '''
 
-        assert(self.state == SOWN)
-        self.advance()     # GROWN
+        assert(self._seed is not None), 'tiles need a seed'
 
-        # FIXME: model loss over growth period
-        #
-        # we assume the following stalk parameter distributions
-        # length: 
-        # #/m^2   :  200 /  250 /  350 m^-2
-        # length  : 2.00 / 2.75 / 3.00 m
-        # diameter:    6 /    8 /   10 mm
-        sprout_min  = self._cfg['sprout']['min']
-        sprout_max  = self._cfg['sprout']['max']
-        sprout_mean = self._cfg['sprout']['mean']
-        sprout_var  = self._cfg['sprout']['var']
-
-        self._nstalks = beta(n=self._area, dmin=sprout_min, dmax=sprout_max, 
-                             dmean=sprout_mean, dvar=sprout_var)
+        return [[self._cfg, area, derive_seed(self._seed, 'tile', idx)]
+                for idx, area in enumerate(self._tile_areas())]
 
-        rep.info('area: %d m^2>>' % self._area)
-        for n in self._nstalks:
 
-            len_min     = self._cfg['length']['min']
-            len_max     = self._cfg['length']['max']
-            len_mean    = self._cfg['length']['mean']
-            len_var     = self._cfg['length']['var']
+    def _tile_areas(self):
 
-            dia_min     = self._cfg['diameter']['min']
-            dia_max     = self._cfg['diameter']['max']
+        return [min(TILE_AREA, self._area - start)
+                for start in range(0, self._area, TILE_AREA)]
 
-            length_list = beta(n=int(n), dmin=len_min,   dmax=len_max,
-                                         dmean=len_mean, dvar=len_var)
-            diam_list   = flat(n=int(n), dmin=dia_min,   dmax=dia_max)
 
-            idx = 0
-            for l,d in zip(length_list, diam_list):
-                self._stalks.append(Stalk(l, d))
-                if not idx % 10:
-                    rep.progress('|')
-                idx += 1
-            rep.progress(' ')
-        rep.ok('>> ok\n')
+    # --------------------------------------------------------------------------
+    #
+    def grow(self, tiles=None):
+        '''
+        Grow the field.  For a field with seed, the results of `grow_tile()`
+        for all `tiles()` can be passed in (when grown elsewhere) - otherwise
+        the tiles are grown here.
+        '''
+
+        assert(self.state == SOWN)
+        self.advance()     # GROWN
 
+        if self._seed is None:
+            self._nstalks, length_list, diam_list = \
+                    draw_stalks(self._cfg, self._area, rng=self._rng)
 
+        else:
+            if tiles is None:
+                tiles = [grow_tile(task) for task in self.tiles()]
+
+            self._nstalks = np.concatenate([t[0] for t in tiles])
+            length_list   = np.concatenate([t[1] for t in tiles])
+            diam_list     = np.concatenate([t[2] for t in tiles])
+
+        rep.info('area: %d m^2>>' % self._area)
+        self._stalks = StalkBatch(length=length_list, diameter=diam_list)
+        rep.ok('>> %d stalks\n' % len(self._stalks))
 
 
     # --------------------------------------------------------------------------
     #
     def harvest(self):
+        '''
+        return the grown stalks as `StalkBatch`
+        '''
 
         assert(self.state == GROWN)
         self.advance()     # HARVESTED
@@ -119,5 +183,38 @@ class Field(Thing):
         return self._stalks
 
 
+    # --------------------------------------------------------------------------
+    #
+    def stream(self):
+        '''
+        Grow and harvest the field tile by tile, and yield the stalk numbers
+        per m^2 and the stalks (`StalkBatch`) of each tile - the field does
+        not keep the stalks.  A field with seed yields the same stalks as
+        `grow()` and `harvest()` (in tiles); a field without seed draws the
+        tiles from `rng` one after the other.
+        '''
+
+        assert(self.state == SOWN)
+        self.advance()     # GROWN
+
+        rep.info('area: %d m^2 (streamed)\n' % self._area)
+
+        if self._seed is None:
+            tiles = [[self._cfg, area, None] for area in self._tile_areas()]
+        else:
+            tiles = self.tiles()
+
+        for cfg, area, seed in tiles:
+
+            if seed is None:
+                nstalks, lengths, diams = draw_stalks(cfg, area, rng=self._rng)
+            else:
+                nstalks, lengths, diams = grow_tile([cfg, area, seed])
+
+            yield nstalks, StalkBatch(length=lengths, diameter=diams)
+
+        self.advance()     # HARVESTED
+
+
 # ------------------------------------------------------------------------------
 
@@ -0,0 +1,379 @@
+
+import os
+import time
+import cProfile
+import resource
+import functools
+import contextlib
+
+import radical.utils as ru
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+rep = ru.LogReporter(name='hf.sim')
+
+# environment variable to enable stage profiling (see `Instrument`)
+PROFILE_ENV = 'HF_SIM_PROFILE'
+
+# profilers
+CPROFILE    = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+PROFILERS   = [CPROFILE, TRACEMALLOC]
+
+# scope of the peak RSS of a stage record (see `Instrument.stage()`)
+STAGE       = 'stage'      # peak RSS during the stage
+PROCESS     = 'process'    # peak RSS of the process up to the stage's end
+
+# linux: memory status, and peak RSS reset
+PROC_STATUS = '/proc/self/status'
+CLEAR_REFS  = '/proc/self/clear_refs'
+
+
+# ------------------------------------------------------------------------------
+#
+def maxrss():
+    '''
+    peak resident set size of this process so far, in MB (linux reports kB)
+    '''
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+# ------------------------------------------------------------------------------
+#
+def _status(key):
+    '''
+    the memory entry `key` (like `VmRSS`) of `/proc/self/status` in MB, or
+    None if not available
+    '''
+
+    try:
+        with open(PROC_STATUS, 'r') as fin:
+            for line in fin:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError):
+        pass
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+#
+def rss():
+    '''
+    current resident set size of this process in MB (linux only, None
+    otherwise)
+    '''
+
+    return _status('VmRSS')
+
+
+# ------------------------------------------------------------------------------
+#
+def peak_rss():
+    '''
+    peak resident set size of this process since the last `reset_peak()` in
+    MB (linux only, None otherwise)
+    '''
+
+    return _status('VmHWM')
+
+
+# ------------------------------------------------------------------------------
+#
+def reset_peak():
+    '''
+    reset the peak resident set size of this process to its current RSS
+    (linux only), return True on success
+    '''
+
+    try:
+        with open(CLEAR_REFS, 'w') as fout:
+            fout.write('5')
+    except (IOError, OSError):
+        return False
+
+    return peak_rss() is not None
+
+
+# ------------------------------------------------------------------------------
+#
+class StageRecord(object):
+    '''
+    the measurements of one stage call: wall time, items in and out, and the
+    peak RSS (and how far it rose above the RSS at the stage start).  The peak
+    is that during the stage if `rss_scope` is `stage`, and that of the process
+    up to the end of the stage if it is `process` (where the peak cannot be
+    reset, see `reset_peak()`).
+    '''
+
+    __slots__ = ['name', 'items_in', 'items_out', 'time', 'rss_peak',
+                 'rss_grow', 'rss_scope', 'traced_peak']
+
+    def __init__(self, name):
+
+        self.name        = name
+        self.items_in    = None
+        self.items_out   = None
+        self.time        = None
+        self.rss_peak    = None
+        self.rss_grow    = None
+        self.rss_scope   = None
+        self.traced_peak = None    # MB, with tracemalloc profiling only
+
+
+    @property
+    def rate(self):
+        '''
+        items per second (input items, or output items if the input is unknown)
+        '''
+
+        items = self.items_in if self.items_in is not None else self.items_out
+
+        if items is None or not self.time:
+            return None
+
+        return items / self.time
+
+
+    def as_dict(self):
+
+        ret = dict([[key, getattr(self, key)] for key in self.__slots__])
+        ret['rate'] = self.rate
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class Instrument(object):
+    '''
+    Collects a `StageRecord` per instrumented stage call (see `stage()` and the
+    `instrumented` decorator).
+
+    A stage can additionally be profiled: `profile` is `cprofile` or
+    `tracemalloc`, optionally followed by a comma separated list of stage names
+    or name prefixes to profile (like `cprofile:peeler,stitcher.sew`) - all
+    stages are profiled otherwise.  If `profile` is not given, it is taken from
+    the environment variable `HF_SIM_PROFILE`.  cProfile stats are written to
+    `profile.<nn>.<stage>.prof` in the directory returned by `path()`;
+    tracemalloc (python 3 only) records the peak of traced memory per stage.
+
+    On linux, the peak RSS of the process is reset when a stage starts, so
+    each record holds the peak of its own stage (nested stages included), not
+    that of an earlier, heavier one.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, profile=None, path=None):
+
+        if profile is None:
+            profile = os.environ.get(PROFILE_ENV) or None
+
+        self._records  = list()
+        self._peaks    = list()    # peak RSS so far of the open stages
+        self._path     = path
+        self._profiler = None
+        self._filter   = None
+
+        if profile:
+            if ':' in profile:
+                profile, names = profile.split(':', 1)
+                self._filter   = [n for n in names.split(',') if n]
+
+            if profile not in PROFILERS:
+                raise ValueError('unknown profiler %s' % profile)
+
+            if profile == TRACEMALLOC and tracemalloc is None:
+                rep.warn('tracemalloc not available - no memory profiling\n')
+            else:
+                self._profiler = profile
+
+
+    @property
+    def records(self): return list(self._records)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _profiled(self, name):
+
+        if not self._profiler:
+            return False
+
+        if not self._filter:
+            return True
+
+        for prefix in self._filter:
+            if name == prefix or name.startswith(prefix + '.'):
+                return True
+
+        return False
+
+
+    # --------------------------------------------------------------------------
+    #
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Measure the enclosed block as stage `name`, and yield its `StageRecord`
+        (to set `items_in` and `items_out` on).  The record is kept even if the
+        block raises.
+        '''
+
+        rec  = StageRecord(name)
+        prof = None
+
+        if self._profiled(name):
+            if self._profiler == CPROFILE:
+                prof = cProfile.Profile()
+                prof.enable()
+            else:
+                tracemalloc.start()
+
+        # the peak RSS is reset for this stage - keep the peak of the
+        # enclosing stage so far
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak_rss() or 0.0)
+
+        if reset_peak():
+            rec.rss_scope = STAGE
+            start_rss     = rss()
+        else:
+            rec.rss_scope = PROCESS
+            start_rss     = maxrss()
+
+        self._peaks.append(0.0)
+        start = time.time()
+
+        try:
+            yield rec
+
+        finally:
+            rec.time = time.time() - start
+
+            if rec.rss_scope == STAGE:
+                rec.rss_peak = max(self._peaks.pop(), peak_rss())
+            else:
+                rec.rss_peak = max(self._peaks.pop(), maxrss())
+
+            rec.rss_grow = rec.rss_peak - start_rss
+
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], rec.rss_peak)
+
+            if self._profiled(name):
+                if self._profiler == CPROFILE:
+                    prof.disable()
+                    path = self._path() if self._path else '.'
+                    prof.dump_stats('%s/profile.%02d.%s.prof'
+                                   % (path, len(self._records), name))
+                else:
+                    rec.traced_peak = tracemalloc.get_traced_memory()[1] \
+                                    / 1024.0 ** 2
+                    tracemalloc.stop()
+
+            self._records.append(rec)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, records):
+        '''
+        add the stage records of another instrument (like those of a stage run
+        in a different process)
+        '''
+
+        self._records.extend(records)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def totals(self):
+        '''
+        return the total wall time per stage name
+        '''
+
+        ret = dict()
+        for rec in self._records:
+            ret[rec.name] = ret.get(rec.name, 0.0) + rec.time
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def result(self):
+        '''
+        return all stage records as list of dicts
+        '''
+
+        return [rec.as_dict() for rec in self._records]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def report(self):
+
+        rep.header('Stages')
+        rep.plain('%-18s %11s %10s %10s %14s %8s\n'
+                 % ('stage', 'time', 'in', 'out', 'rate', 'peak RSS'))
+
+        scopes = set()
+        for rec in self._records:
+
+            items = '%10s %10s' % (rec.items_in  if rec.items_in  is not None
+                                                 else '-',
+                                   rec.items_out if rec.items_out is not None
+                                                 else '-')
+            rate  = '%12.0f/s' % rec.rate if rec.rate is not None else ''
+            mark  = '*' if rec.rss_scope == PROCESS else ''
+            rep.plain('%-18s %9.3f s %s %s %8.1f MB (+%.1f)%s\n'
+                     % (rec.name, rec.time, items, rate.rjust(14),
+                        rec.rss_peak, rec.rss_grow, mark))
+            scopes.add(rec.rss_scope)
+
+        if PROCESS in scopes:
+            rep.plain('* peak RSS of the process so far, not of the stage\n')
+
+
+# ------------------------------------------------------------------------------
+#
+def instrumented(name, items_in=None, items_out=None):
+    '''
+    Method decorator for the stage methods of `Farmer`, `Peeler`, `Stitcher`
+    and `BHT`: measure each call as stage `name` in the instance's context
+    (`self._ctx.stage()`).  `items_in(self, *args, **kwargs)` is called before
+    the method, `items_out(self, ret)` after it, to count the items the stage
+    consumes and produces.
+    '''
+
+    def decorator(method):
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+
+            with self._ctx.stage(name) as rec:
+
+                if items_in:
+                    rec.items_in = items_in(self, *args, **kwargs)
+
+                ret = method(self, *args, **kwargs)
+
+                if items_out:
+                    rec.items_out = items_out(self, ret)
+
+            return ret
+
+        return wrapper
+
+    return decorator
+
+
+# ------------------------------------------------------------------------------
+
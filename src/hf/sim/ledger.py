@@ -0,0 +1,146 @@
+
+import numpy as np
+
+import radical.utils as ru
+
+rep = ru.LogReporter(name='hf.sim')
+
+# scrapped materials
+STALK = 'stalk'      # whole stalks or stalk pieces
+WOOD  = 'wood'       # the stalk core which remains after peeling
+FIBRE = 'fibre'      # bast which is lost while peeling
+
+# scrap reasons
+TOO_THIN     = 'too_thin'
+TOO_THICK    = 'too_thick'
+TOO_SHORT    = 'too_short'
+CUT_OFF      = 'cut_off'
+PREP_FAILURE = 'prep_failure'
+PEEL_FAILURE = 'peel_failure'
+PEEL_LOSS    = 'peel_loss'
+PEEL_REMAINS = 'peel_remainder'
+
+
+# ------------------------------------------------------------------------------
+#
+class ScrapLedger(object):
+    '''
+    Running totals of scrapped material, by stage, material and reason: the
+    number of scrapped items and their total length (mm).  Stages add their
+    scrap to the ledger and can then drop the scrapped objects, so that waste
+    can be accounted for without keeping those objects alive.  Ledgers can be
+    merged, like the stage statistics of a `Context`.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self):
+
+        self._totals = dict()    # [stage, material, reason] -> [count, length]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add(self, stage, material, reason, lengths):
+        '''
+        add scrapped items (given as array of their lengths) to the ledger
+        '''
+
+        lengths = np.asarray(lengths, dtype=float).ravel()
+
+        if not len(lengths):
+            return
+
+        key   = (stage, material, reason)
+        total = self._totals.setdefault(key, [0, 0.0])
+
+        total[0] += len(lengths)
+        total[1] += float(lengths.sum())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stage(self, name):
+        '''
+        return a view on this ledger which adds scrap for the given stage
+        '''
+
+        return StageLedger(self, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+
+        for key, (count, length) in other._totals.items():
+            total     = self._totals.setdefault(key, [0, 0.0])
+            total[0] += count
+            total[1] += length
+
+
+    # --------------------------------------------------------------------------
+    #
+    def rows(self):
+        '''
+        return the ledger as sorted list of `[stage, material, reason, count,
+        length]` rows
+        '''
+
+        return [list(key) + list(self._totals[key])
+                for key in sorted(self._totals)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def totals(self, stage=None, material=None, reason=None):
+        '''
+        return the total count and length of all scrap matching the given
+        stage, material and reason (`None` matches all)
+        '''
+
+        count  = 0
+        length = 0.0
+
+        for (s, m, r), (c, l) in self._totals.items():
+            if stage    not in [None, s]: continue
+            if material not in [None, m]: continue
+            if reason   not in [None, r]: continue
+            count  += c
+            length += l
+
+        return {'count': count, 'length': length}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def report(self):
+
+        rep.header('Scrap')
+
+        for stage, material, reason, count, length in self.rows():
+            rep.plain('%-10s %-6s %-16s %10d  %12.1f m\n'
+                     % (stage, material, reason, count, length / 1000))
+
+
+# ------------------------------------------------------------------------------
+#
+class StageLedger(object):
+    '''
+    a `ScrapLedger` view which adds scrap for a single stage
+    '''
+
+    __slots__ = ['_ledger', '_stage']
+
+    def __init__(self, ledger, stage):
+
+        self._ledger = ledger
+        self._stage  = stage
+
+
+    def add(self, material, reason, lengths):
+
+        self._ledger.add(self._stage, material, reason, lengths)
+
+
+# ------------------------------------------------------------------------------
+
@@ -1,16 +1,17 @@
 
 import sys
-import random
 
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
+from .distribution import create_flat_array
 
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
+from .thing   import Thing
+from .context import get_context
+from .stalk import StalkBatch
 
-from .thing import Thing
+from .instrument import instrumented
 
 PI  = 3.1415926
 rep = ru.LogReporter(name='hf.sim')
@@ -26,46 +27,61 @@ class Peeler(Thing):
     '''
     This class models the operations of a Peeler, who obtains a set of stalks,
     shortens them to a certain fixed length, selects them for peeling (sort out
-    unusable geometries), peels them, and thus produces bast.  The class will
-    keep track of the scrap byproducts used while peeling. The Peeler could be
-    considered to represent a worker or a (set of) machine(s).  
+    unusable geometries), peels them, and thus produces bast.  The scrap
+    byproducts are accounted for in the context's scrap ledger (see
+    `ledger.ScrapLedger`) - scrapped stalks are not kept around.  The Peeler
+    could be considered to represent a worker or a (set of) machine(s).
     '''
 
+    __slots__ = ['_cfg', '_ctx', '_rng', '_ledger', '_input', '_selected',
+                 '_cut']
+
+    MODEL     = [ON, OFF]
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, cfg): 
+    def __init__(self, cfg, ctx=None):
         '''
         Peeler starts working
         '''
 
         rep.header('Initialize peeler')
 
+        if not ctx:
+            ctx = get_context()
+
         self._cfg      = cfg
-        self._input    = list()
-        self._selected = list()
-        self._cut      = list()
-        self._scrapped = list()
+        self._ctx      = ctx
+        self._rng      = ctx.rng('peeler')
+        self._ledger   = ctx.ledger.stage('peeler')
+        self._input    = StalkBatch()
+        self._selected = StalkBatch()
+        self._cut      = StalkBatch()
 
-        model = [ON, OFF]
-        super(Peeler, self).__init__(model, 'peeler')
+        super(Peeler, self).__init__('peeler')
 
 
     # --------------------------------------------------------------------------
     #
     def feed(self, stalks):
         '''
-        Fresh stalks are given to the peeler
+        Fresh stalks are given to the peeler (as `StalkBatch` or as list of
+        `Stalk` instances)
         '''
 
         assert(self.state == ON)
 
-        self._input.extend(stalks)
+        stalks      = StalkBatch.from_stalks(stalks)
+        self._input = StalkBatch.concat([self._input, stalks])
         rep.info('input: %d stalks' % len(stalks))
         rep.ok('>> ok\n')
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('peeler.select',
+                  items_in =lambda self: len(self._input),
+                  items_out=lambda self, ret: len(self._selected))
     def select(self):
         '''
         Not all stalks are eligible for peeling.  This can result in some waste.
@@ -74,40 +90,38 @@ class Peeler(Thing):
         assert(self.state == ON)
 
         rep.info('select from %d stalks' % len(self._input))
-        for stalk in self._input:
-            if stalk.select(self._cfg):
-                self._selected.append(stalk)
-            else:
-                self._scrapped.append(stalk)
+        selected, scrapped = self._input.select(self._cfg, self._ledger)
+
+        self._selected = StalkBatch.concat([self._selected, selected])
 
         # all inputs have been selected
-        self._input = list()
-        rep.ok('>> ok\n')
+        self._input = StalkBatch()
+        rep.ok('>> %d selected, %d scrapped\n' % (len(selected), len(scrapped)))
 
-        data = list()
-        for stalk in self._selected:
-            data.append(stalk.dia)
-        create_hist_plot(fname='stalk_dia_selected', 
-                         title='Stalk Diameter Histogram (after selection)',
-                         ptitle='diameter',
-                         xlabel='diameter [mm]', 
-                         ylabel='number of stalks', 
-                         data=data)
+        # only the newly selected stalks are added to the stage statistics
+        data = selected.diameter
+        self._ctx.hist_plot(fname='stalk_dia_selected', 
+                            title='Stalk Diameter Histogram (after selection)',
+                            ptitle='diameter',
+                            xlabel='diameter [mm]', 
+                            ylabel='number of stalks', 
+                            data=data)
 
 
-        data = list()
-        for stalk in self._selected:
-            data.append(stalk.len)
-        create_hist_plot(fname='stalk_len_selected', 
-                         title='Stalk Length Histogram (after selection)',
-                         ptitle='length',
-                         xlabel='length [mm]', 
-                         ylabel='number of stalks', 
-                         data=data)
+        data = selected.length
+        self._ctx.hist_plot(fname='stalk_len_selected', 
+                            title='Stalk Length Histogram (after selection)',
+                            ptitle='length',
+                            xlabel='length [mm]', 
+                            ylabel='number of stalks', 
+                            data=data)
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('peeler.cut',
+                  items_in =lambda self: len(self._selected),
+                  items_out=lambda self, ret: len(self._cut))
     def cut(self):
         '''
         we have to cut stalks to the peelers max length.
@@ -118,65 +132,78 @@ class Peeler(Thing):
         rep.info('cut %d stalks' % len(self._selected))
 
         max_len = self._cfg['max_len']
-        for stalk in self._selected:
-            length = flat(n=2, dmin=max_len * 0.99,  dmax=max_len * 1.01)
-            stalk.cut(length[0])
-            self._cut.append(stalk)
+        lengths = create_flat_array(n=len(self._selected),
+                                    dmin=max_len * 0.99, dmax=max_len * 1.01,
+                                    rng=self._rng)
+        cut = self._selected
+        cut.cut(lengths, self._ledger)
+        self._cut = StalkBatch.concat([self._cut, cut])
 
         # all selected stalks have been cut
-        self._selected = list()
+        self._selected = StalkBatch()
         rep.ok('>> ok\n')
 
-        data = list()
-        for stalk in self._cut:
-            data.append(stalk.dia)
+        data = cut.diameter
 
-        create_hist_plot(fname='stalk_dia_cut', 
-                         title='Stalk Diameter Histogram (after cutting)',
-                         ptitle='diameter',
-                         xlabel='diameter [mm]', 
-                         ylabel='number of stalks', 
-                         data=data)
+        self._ctx.hist_plot(fname='stalk_dia_cut', 
+                            title='Stalk Diameter Histogram (after cutting)',
+                            ptitle='diameter',
+                            xlabel='diameter [mm]', 
+                            ylabel='number of stalks', 
+                            data=data)
 
 
-        data = list()
-        for stalk in self._cut:
-            data.append(stalk.len)
-        create_hist_plot(fname='stalk_len_cut', 
-                         title='Stalk Length Histogram (after cutting)',
-                         ptitle='length',
-                         xlabel='length [mm]', 
-                         ylabel='number of stalks', 
-                         data=data)
+        data = cut.length
+        self._ctx.hist_plot(fname='stalk_len_cut', 
+                            title='Stalk Length Histogram (after cutting)',
+                            ptitle='length',
+                            xlabel='length [mm]', 
+                            ylabel='number of stalks', 
+                            data=data)
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('peeler.peel',
+                  items_in =lambda self: len(self._cut),
+                  items_out=lambda self, ret: len(ret))
     def peel(self):
+        '''
+        Peel all cut stalks, and return the peeled bast as `BastBatch`.
+        '''
 
         assert(self.state == ON)
 
         rep.info('peeling %d stalks' % len(self._cut))
 
-        bast = list()
-        for stalk in self._cut:
-
-            # we randomly fail on some stalks
-            if (random.random()*100) > self._cfg['prep_efficiency']:
-                stalk.scrap()
-                self._scrapped.append(stalk)
-                continue
-
-            bast.extend(stalk.peel(self._cfg))
-            self._scrapped.append(stalk)  # scrap remains
-            rep.progress('V')
+        bast = self._cut.peel(self._cfg, rng=self._rng, ledger=self._ledger)
 
-        self._cut = list()
+        # the remains are accounted for in the ledger
+        self._cut = StalkBatch()
 
         rep.ok('>> ok\n')
         return bast
 
 
+    # --------------------------------------------------------------------------
+    #
+    def stream(self, chunks):
+        '''
+        Select, cut and peel stalks which arrive in chunks (an iterable of
+        `StalkBatch`es, like `Farmer.stream()`), and yield the bast of each
+        chunk as `BastBatch`.  The random stream is consumed chunk by chunk, so
+        the bast differs from peeling all stalks at once.
+        '''
+
+        for stalks in chunks:
+
+            self.feed(stalks)
+            self.select()
+            self.cut()
+
+            yield self.peel()
+
+
     # --------------------------------------------------------------------------
     #
     def turn_off(self):
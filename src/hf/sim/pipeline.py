@@ -0,0 +1,373 @@
+
+import os
+import Queue
+import traceback
+import multiprocessing as mp
+
+import radical.utils as ru
+
+from .context  import Context, get_context
+from .config   import validate_cfg
+from .farmer   import Farmer
+from .peeler   import Peeler
+from .stitcher import Stitcher
+from .stalk    import StalkBatch
+from .bast     import BastBatch
+from .bht      import BHT
+
+from .checkpoint import STALKS, BAST, SPLICED, SEWN, unpack
+
+rep = ru.LogReporter(name='hf.sim')
+
+# number of chunks which can be queued between two concurrent stages
+QUEUE_SIZE = 4
+
+# seconds to wait for a chunk before checking the stage processes
+POLL = 1.0
+
+
+# ------------------------------------------------------------------------------
+#
+def grow_stalks(cfg, ctx):
+    '''
+    the grow stage: plant, harvest and dry the fields of `cfg['farmer']`, and
+    return the dried stalks (`StalkBatch`)
+    '''
+
+    farmer = Farmer(cfg['farmer'], ctx=ctx)
+    farmer.plant(areas=cfg['farmer']['areas'])
+    farmer.harvest()
+    farmer.dry()
+
+    return farmer.get()
+
+
+# ------------------------------------------------------------------------------
+#
+def peel_stalks(cfg, ctx, stalks):
+    '''
+    the peel stage: select, cut and peel the stalks, and return the bast
+    (`BastBatch`)
+    '''
+
+    peeler = Peeler(cfg['peeler'], ctx=ctx)
+    peeler.feed(stalks)
+    peeler.select()
+    peeler.cut()
+
+    return peeler.peel()
+
+
+# ------------------------------------------------------------------------------
+#
+def splice_bast(cfg, ctx, bast):
+    '''
+    the splice stage: cut and splice the bast, and return the `Stitcher`,
+    ready to `sew()`
+    '''
+
+    stitcher = Stitcher(cfg['stitcher'], ctx=ctx)
+    stitcher.feed(bast)
+    stitcher.cut()
+    stitcher.splice()
+
+    return stitcher
+
+
+# ------------------------------------------------------------------------------
+#
+def run_pipeline(cfg, ctx=None, cache=None, checkpoint=None, export=None):
+    '''
+    Run the full production chain for the given configuration (see
+    `config.DEFAULT_CFG`, checked by `validate_cfg()` before anything runs):
+    plant, harvest and dry the fields of `cfg['farmer']['areas']`, peel the
+    stalks, and sew the bast into BHT.  All stages use the given context
+    (default: the default context).  Returns the `BHT` instance.
+
+    If a `StageCache` is given and the context is seeded, the stalks and the
+    bast are looked up in the cache (keyed by the upstream cfg sections and the
+    seed) before being produced, and stored there otherwise.  As each stage
+    draws from its own random stream, a run with cached stages results in the
+    same BHT as a full run - but the stage statistics of skipped stages are
+    not collected.
+
+    If a `Checkpoint` is given, the output of each stage is stored there, and
+    a run with an existing checkpoint resumes after the latest completed
+    stage.  With a seeded context, a resumed run results in the same BHT as an
+    uninterrupted one.
+
+    If an `Exporter` is given, the stalks, bast, spliced bast and BHT tables
+    are exported as columnar files - all which are available in this run: the
+    tables of stages which were skipped because their output was restored
+    from a checkpoint or cache are not exported.
+    '''
+
+    validate_cfg(cfg)
+
+    if not ctx:
+        ctx = get_context()
+
+    if ctx.seed is None:
+        cache = None
+
+    done = None
+    if checkpoint:
+        checkpoint.open(cfg, ctx.seed)
+        done = checkpoint.latest()
+        if done:
+            rep.info('resume after stage %s\n' % done)
+
+    if export:
+        export.open(cfg, ctx.seed)
+
+    def save(stage, arrays):
+        if checkpoint:
+            checkpoint.save(stage, arrays)
+
+    def table(stage, arrays):
+        if export:
+            export.write(stage, arrays)
+
+    def result(bht):
+        if export:
+            export.write_bht(bht)
+        return bht
+
+    if done == SEWN:
+        return result(BHT.from_arrays(checkpoint.load(SEWN), ctx=ctx))
+
+    if done == SPLICED:
+        stitcher = Stitcher(cfg['stitcher'], ctx=ctx)
+        stitcher.restore(checkpoint.load(SPLICED))
+
+    else:
+        bast = None
+
+        if done == BAST:
+            bast = BastBatch.from_arrays(checkpoint.load(BAST))
+
+        elif cache:
+            bast_key = cache.key('bast', cfg['farmer'], cfg['peeler'], ctx.seed)
+            arrays   = cache.get(bast_key)
+            if arrays is not None:
+                rep.info('bast from cache\n')
+                bast = BastBatch.from_arrays(arrays)
+
+        if bast is None:
+
+            if done == STALKS:
+                stalks = StalkBatch.from_arrays(checkpoint.load(STALKS))
+
+            else:
+                arrays = None
+                if cache:
+                    stalk_key = cache.key('stalks', cfg['farmer'], ctx.seed)
+                    arrays    = cache.get(stalk_key)
+
+                if arrays is not None:
+                    rep.info('stalks from cache\n')
+                    stalks = StalkBatch.from_arrays(arrays)
+                else:
+                    stalks = grow_stalks(cfg, ctx)
+                    if cache:
+                        cache.put(stalk_key, stalks.to_arrays())
+
+                save(STALKS, stalks.to_arrays())
+
+            table(STALKS, stalks.to_arrays())
+
+            bast = peel_stalks(cfg, ctx, stalks)
+            if cache:
+                cache.put(bast_key, bast.to_arrays())
+
+        if done != BAST:
+            save(BAST, bast.to_arrays())
+
+        table(BAST, bast.to_arrays())
+
+        stitcher = splice_bast(cfg, ctx, bast)
+        save(SPLICED, stitcher.checkpoint())
+
+    table(SPLICED, unpack('spliced', stitcher.checkpoint()))
+
+    bht = stitcher.sew()
+    save(SEWN, bht.to_arrays())
+
+    return result(bht)
+
+
+# ------------------------------------------------------------------------------
+#
+def stream_pipeline(cfg, ctx=None, queue_size=QUEUE_SIZE, quiet=True):
+    '''
+    Run the production chain on a stream of chunks: the fields are grown tile
+    by tile, and the stalks of each tile are peeled, and the bast is cut,
+    spliced and sewn, chunk by chunk (see `Farmer.stream()`, `Peeler.stream()`
+    and `Stitcher.stream()`).  The memory used depends on the tile size, not
+    on the farm size - only the BHT itself grows.  Returns the `BHT` instance.
+
+    The stitcher cfg key `mode` selects how the stages run:
+
+      sequential : as a chain of generators in this process - each tile passes
+                   all stages before the next tile is grown
+      continuous : as concurrent processes, connected by queues of at most
+                   `queue_size` chunks: one grows and peels, one cuts and
+                   splices, and this process sews.  All stages work on
+                   different chunks at the same time.  The stage reports of
+                   the other processes are silenced if `quiet` is set, their
+                   statistics, scrap and stage records are merged into `ctx`.
+
+    Both modes result in the same BHT.  The stalks are the same as in
+    `run_pipeline()`, but the peeler consumes its random stream chunk by
+    chunk, so the BHT differs from that of a full run with the same seed (it
+    is reproducible though).  Streamed runs use neither stage cache nor
+    checkpoints.
+    '''
+
+    validate_cfg(cfg)
+
+    if not ctx:
+        ctx = get_context()
+
+    mode = cfg['stitcher'].get('mode', 'sequential')
+
+    if mode == 'continuous':
+        return _continuous(cfg, ctx, queue_size, quiet)
+
+    if mode != 'sequential':
+        raise ValueError('unknown stitcher mode %s' % mode)
+
+    farmer   = Farmer  (cfg['farmer'],   ctx=ctx)
+    peeler   = Peeler  (cfg['peeler'],   ctx=ctx)
+    stitcher = Stitcher(cfg['stitcher'], ctx=ctx)
+
+    stalks   = farmer.stream(cfg['farmer']['areas'])
+    bast     = peeler.stream(stalks)
+
+    return stitcher.stream(bast)
+
+
+# ------------------------------------------------------------------------------
+#
+def _receive(queue, reports, procs=None):
+    '''
+    Yield the chunks an upstream stage puts into the queue, until it is done.
+    The stage reports it sends when done are appended to `reports`.
+
+    If the stage processes are given (the producing stage last), they are
+    checked while no chunk arrives: a process which was killed never reports
+    an error, so fail if any of them died, or if the producing stage is gone
+    without being done.
+    '''
+
+    while True:
+
+        try:
+            msg, data = queue.get(timeout=POLL)
+
+        except Queue.Empty:
+
+            if not procs:
+                continue
+
+            for proc in procs:
+                if proc.exitcode:
+                    raise RuntimeError('stage %s died (exit code %s)'
+                                      % (proc.name, proc.exitcode))
+
+            if procs[-1].is_alive():
+                continue
+
+            # the stage may have sent its last message just before exiting
+            try:
+                msg, data = queue.get(timeout=POLL)
+            except Queue.Empty:
+                raise RuntimeError('stage %s exited without being done'
+                                  % procs[-1].name)
+
+        if   msg == 'chunk': yield data
+        elif msg == 'done' : reports.extend(data); return
+        else               : raise RuntimeError('stage failed: %s' % data)
+
+
+# ------------------------------------------------------------------------------
+#
+def _stage(name, cfg, seed, inp, out, quiet):
+    '''
+    Run one concurrent stage in a separate process: `peel` grows and peels the
+    fields, `splice` cuts and splices the chunks from the `inp` queue.  Chunks
+    go to the `out` queue, followed by the stage reports (statistics, scrap
+    and stage records) of this and all upstream stages.
+    '''
+
+    if quiet:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    try:
+        # the stage random streams are derived from the seed, so they are the
+        # same as in a single process
+        ctx     = Context(plot=False, seed=seed, progress=0)
+        reports = list()
+
+        if name == 'peel':
+            farmer = Farmer(cfg['farmer'], ctx=ctx)
+            peeler = Peeler(cfg['peeler'], ctx=ctx)
+            chunks = peeler.stream(farmer.stream(cfg['farmer']['areas']))
+
+        else:
+            stitcher = Stitcher(cfg['stitcher'], ctx=ctx)
+            chunks   = stitcher.splice_stream(_receive(inp, reports))
+
+        for chunk in chunks:
+            out.put(['chunk', chunk])
+
+        reports.append({'stats'  : ctx.stats,
+                        'labels' : ctx.labels,
+                        'ledger' : ctx.ledger,
+                        'records': ctx.instrument.records})
+        out.put(['done', reports])
+
+    except Exception:
+        out.put(['error', traceback.format_exc()])
+
+
+# ------------------------------------------------------------------------------
+#
+def _continuous(cfg, ctx, queue_size, quiet):
+    '''
+    run the streamed pipeline as concurrent stages (see `stream_pipeline()`)
+    '''
+
+    bast    = mp.Queue(queue_size)
+    spliced = mp.Queue(queue_size)
+    procs   = [mp.Process(target=_stage, name='peel',
+                          args=['peel',   cfg, ctx.seed, None, bast,    quiet]),
+               mp.Process(target=_stage, name='splice',
+                          args=['splice', cfg, ctx.seed, bast, spliced, quiet])]
+    for proc in procs:
+        proc.start()
+
+    try:
+        reports  = list()
+        stitcher = Stitcher(cfg['stitcher'], ctx=ctx)
+        bht      = stitcher.sew_stream(_receive(spliced, reports, procs))
+
+    except:
+        for proc in procs:
+            proc.terminate()
+        raise
+
+    finally:
+        for proc in procs:
+            proc.join()
+
+    for report in reports:
+        ctx.merge(report['stats'], report['labels'])
+        ctx.ledger.merge(report['ledger'])
+        ctx.instrument.merge(report['records'])
+
+    return bht
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,215 @@
+
+import os
+import sys
+import Queue
+import threading
+import subprocess as sp
+
+from distutils.spawn import find_executable
+
+import numpy as np
+
+import radical.utils as ru
+
+rep = ru.LogReporter(name='hf.sim')
+
+# number of gnuplot processes to run concurrently
+WORKERS = 2
+
+
+# ------------------------------------------------------------------------------
+#
+class Renderer(object):
+    '''
+    Plots are rendered off the simulation's critical path: `submit()` only
+    queues a render job, and a pool of background threads writes the data
+    files and runs gnuplot on the plot scripts.  Call `flush()` to wait for all
+    queued plots to be rendered (at the latest at the end of the run), and
+    `close()` to also stop the threads.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, workers=WORKERS):
+
+        self._queue   = Queue.Queue()
+        self._workers = list()
+        self._gnuplot = find_executable('gnuplot')
+
+        if not self._gnuplot:
+            rep.warn('gnuplot not found - only writing plot data\n')
+
+        for n in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _work(self):
+
+        while True:
+
+            job = self._queue.get()
+
+            if job is None:
+                self._queue.task_done()
+                return
+
+            try:
+                self._render(*job)
+            except Exception as e:
+                rep.error('plot %s failed: %s\n' % (job[0], e))
+            finally:
+                self._queue.task_done()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _render(self, base, plot, data, fmt, header):
+
+        with open('%s.plot' % base, 'w') as f:
+            f.write(plot)
+
+        np.savetxt('%s.dat' % base, data, fmt=fmt, header=header)
+
+        if not self._gnuplot:
+            return
+
+        # the dumb terminal output goes into a text file, so that concurrent
+        # renders do not garble the terminal
+        with open('%s.txt' % base, 'w') as out:
+            sp.call([self._gnuplot, '%s.plot' % base],
+                    stdout=out, stderr=sp.STDOUT)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def submit(self, base, plot, data, fmt, header=''):
+        '''
+        Queue a plot for rendering: the plot script `plot` is stored as
+        `<base>.plot`, `data` as `<base>.dat` (with the optional `header` as
+        comment).  `data` is copied, so the caller can continue to modify it.
+        '''
+
+        data = np.array(data, dtype=float).reshape(len(data), -1)
+
+        self._queue.put([base, plot, data, fmt, header])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def flush(self):
+        '''
+        wait until all queued plots are rendered
+        '''
+
+        self._queue.join()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+        '''
+        render all queued plots and stop the worker threads
+        '''
+
+        for worker in self._workers:
+            self._queue.put(None)
+
+        for worker in self._workers:
+            worker.join()
+
+        self._workers = list()
+
+
+# ------------------------------------------------------------------------------
+#
+def line_script(base, title, ptitle, xlabel, ylabel):
+    '''
+    return a gnuplot script for a line plot of the data in `<base>.dat`
+    '''
+
+    return '''#!/usr/bin/env gnuplot
+
+fname = "%(base)s.dat"
+stats fname using 1 nooutput
+set   terminal dumb
+
+set autoscale                          # scale axes automatically
+set xtic auto                          # set xtics automatically
+set ytic auto                          # set ytics automatically
+set title  "%(title)s"
+set xlabel "%(xlabel)s"
+set ylabel "%(ylabel)s"
+
+set yrange [0:]
+
+# define reasonably sized boxes for the hist plot in range 0..1.  Those boxes
+# get scaled to the actual data range later on, in `hist()`.
+n     = 100              # number of intervals
+min   = STATS_min        # min value
+max   = STATS_max        # max value
+width = (max - min) / n  # interval width
+
+# function used to map a value to the intervals
+hist(x,width) = width * floor(x / width) + width / 2.0
+
+# count and plot
+set  boxwidth width * 1.0
+# plot fname u (hist($1,width)):(1.0) title '%(ptitle)s' smooth freq w boxes lc rgb"green"
+plot fname u 1:2 title 'thickness' with lines lc rgb"green"
+
+set terminal png
+set output '%(base)s.png'
+replot
+
+    ''' % { 'title'  : title ,
+            'ptitle' : ptitle,
+            'xlabel' : xlabel,
+            'ylabel' : ylabel,
+            'base'   : base }
+
+
+# ------------------------------------------------------------------------------
+#
+def hist_script(base, title, ptitle, xlabel, ylabel, width):
+    '''
+    return a gnuplot script for a histogram of the binned data in `<base>.dat`
+    (bin centers and counts, bins of the given width)
+    '''
+
+    return '''#!/usr/bin/env gnuplot
+
+fname = "%(base)s.dat"
+set   terminal dumb
+
+set autoscale                          # scale axes automatically
+set xtic auto                          # set xtics automatically
+set ytic auto                          # set ytics automatically
+set title  "%(title)s"
+set xlabel "%(xlabel)s"
+set ylabel "%(ylabel)s"
+
+set yrange [0:]
+
+# the data are binned already: plot bin counts as boxes
+set  boxwidth %(width)f
+plot fname u 1:2 title '%(ptitle)s' w boxes lc rgb"green"
+
+set terminal png
+set output '%(base)s.png'
+replot
+
+    ''' % { 'title'  : title ,
+            'ptitle' : ptitle,
+            'xlabel' : xlabel,
+            'ylabel' : ylabel,
+            'width'  : width,
+            'base'   : base }
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,176 @@
+
+import os
+import sys
+import time
+
+# environment variable for the progress interval (seconds, `0` disables
+# progress reports)
+PROGRESS_ENV = 'HF_SIM_PROGRESS'
+
+# default interval between two progress reports (seconds)
+INTERVAL = 1.0
+
+
+# ------------------------------------------------------------------------------
+#
+def get_interval(interval=None):
+    '''
+    Return the progress interval to use: the given one, the one from
+    `$HF_SIM_PROGRESS`, or `INTERVAL` if stdout is a terminal.  Batch runs
+    (stdout redirected to a file or pipe) report no progress by default.
+    '''
+
+    if interval is None:
+        interval = os.environ.get(PROGRESS_ENV)
+
+    if interval is None:
+        if hasattr(sys.stdout, 'isatty') and sys.stdout.isatty():
+            return INTERVAL
+        return 0.0
+
+    return float(interval)
+
+
+# ------------------------------------------------------------------------------
+#
+class Progress(object):
+    '''
+    Progress of a stage which works through `total` items (or an unknown
+    number of items, for `total=None`).  The stage counts items via
+    `update(n)` or `set(count)`, and the progress line (count, rate and ETA)
+    is rendered at most once per `interval` seconds, overwriting itself.  With
+    `interval=0` nothing is rendered.
+
+    Counting is cheap enough for hot loops: the clock is only read after
+    a number of items (`stride`) which adapts so that it is read a few times
+    per interval - on all other calls, `update()` is an addition and
+    a comparison.
+    '''
+
+    __slots__ = ['_name', '_total', '_interval', '_count', '_stride', '_due',
+                 '_start', '_last', '_shown', '_stream']
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, name, total=None, interval=None, stream=None):
+
+        self._name     = name
+        self._total    = total
+        self._interval = get_interval(interval)
+        self._stream   = stream or sys.stdout
+        self._count    = 0
+        self._stride   = 1
+        self._start    = time.time()
+        self._last     = self._start
+        self._shown    = False
+
+        # count at which the clock is read next
+        if self._interval: self._due = 1
+        else             : self._due = float('inf')
+
+
+    @property
+    def count(self):   return self._count
+    @property
+    def elapsed(self): return time.time() - self._start
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def rate(self):
+
+        elapsed = self.elapsed
+
+        if not elapsed:
+            return None
+
+        return self._count / elapsed
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, n=1):
+        '''
+        `n` more items are done
+        '''
+
+        self._count += n
+
+        if self._count >= self._due:
+            self._tick()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def set(self, count):
+        '''
+        `count` items are done in total
+        '''
+
+        self._count = count
+
+        if count >= self._due:
+            self._tick()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _tick(self):
+
+        now = time.time()
+
+        if now - self._last >= self._interval:
+            self._last = now
+            self._render(now)
+
+        elif now - self._last < self._interval / 10:
+            # clock read too often - read it after more items next time
+            self._stride *= 2
+
+        self._due = self._count + self._stride
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _render(self, now, final=False):
+
+        elapsed = now - self._start
+        rate    = self._count / elapsed if elapsed else 0.0
+
+        if self._total:
+            line = '%s: %d / %d (%3.0f%%)' % (self._name, self._count,
+                                              self._total,
+                                              100.0 * self._count / self._total)
+        else:
+            line = '%s: %d' % (self._name, self._count)
+
+        line += '  %.0f/s' % rate
+
+        if final:
+            line += '  %.1f s' % elapsed
+        elif self._total and rate:
+            line += '  ETA %.0f s' % ((self._total - self._count) / rate)
+
+        self._stream.write('\r%-79s' % line)
+        self._stream.flush()
+        self._shown = True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+        '''
+        The stage is done: complete the progress line (if one was rendered).
+        '''
+
+        if self._shown:
+            self._render(time.time(), final=True)
+            self._stream.write('\n')
+            self._stream.flush()
+
+        self._due = float('inf')
+
+
+# ------------------------------------------------------------------------------
+
@@ -1,17 +1,21 @@
 
 import sys
-import random
+
+import numpy as np
 
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
+from .distribution import beta_sampler, flat_sampler
+from .distribution import create_beta_array, create_flat_array
+from .distribution import beta_distribution
 
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
-
-from .thing import Thing
-from .bast  import Bast
+from .thing  import Thing
+from .bast   import Bast, BastBatch
+from .ledger import STALK, WOOD, FIBRE
+from .ledger import TOO_THIN, TOO_THICK, TOO_SHORT, CUT_OFF
+from .ledger import PREP_FAILURE, PEEL_FAILURE, PEEL_LOSS, PEEL_REMAINS
 
 PI  = 3.1415926
 rep = ru.LogReporter(name='hf.sim')
@@ -23,33 +27,370 @@ SELECTED  = 'selected'
 CUT       = 'cut'
 PEELED    = 'peeled'
 
+# the stalk state model - a `StalkBatch` stores the index of a stalk's state in
+# this list as state code
+STALK_MODEL = [FRESH, DRIED, SELECTED, CUT, PEELED]
+
+
+# ------------------------------------------------------------------------------
+#
+def success_distribution(cfg):
+    '''
+    the distribution of the successfully peeled length (in % of the stalk
+    length), from the peeler cfg
+    '''
+
+    return beta_distribution(dmin=cfg['success_min'],
+                             dmax=cfg['success_max'],
+                             dmean=cfg['success_mean'],
+                             dvar=cfg['success_var'],
+                             accuracy=cfg.get('accuracy'))
+
+
+# ------------------------------------------------------------------------------
+#
+class StalkBatch(object):
+    '''
+    A set of stalks, stored as columns (length, diameter, state code and scrap
+    length) instead of one `Stalk` object per plant.  The stage operations
+    (`dry()`, `select()`, `cut()`, `scrap()`) work on all stalks of the batch at
+    once.  Indexing a batch with an integer returns a `Stalk` view on that
+    stalk, indexing with a slice or boolean mask returns a new batch.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, length=None, diameter=None, state=None,
+                       scrap_len=None):
+        '''
+        length   : stalk lengths   (mm)
+        diameter : stalk diameters (mm)
+        state    : state codes (index into `STALK_MODEL`, default: FRESH)
+        scrap_len: scrapped stalk length so far (mm, default: 0)
+        '''
+
+        if length   is None: length   = list()
+        if diameter is None: diameter = list()
+
+        self.length   = np.array(length,   dtype=float)
+        self.diameter = np.array(diameter, dtype=float)
+
+        assert(len(self.length) == len(self.diameter))
+
+        n = len(self.length)
+
+        if state is None: self.state = np.zeros(n, dtype=np.uint8)
+        else            : self.state = np.array(state, dtype=np.uint8)
+
+        if scrap_len is None: self.scrap_len = np.zeros(n, dtype=float)
+        else                : self.scrap_len = np.array(scrap_len, dtype=float)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def concat(cls, batches):
+        '''
+        merge a list of batches into one batch
+        '''
+
+        batches = [b for b in batches if len(b)]
+
+        if not batches:
+            return cls()
+
+        return cls(length   =np.concatenate([b.length    for b in batches]),
+                   diameter =np.concatenate([b.diameter  for b in batches]),
+                   state    =np.concatenate([b.state     for b in batches]),
+                   scrap_len=np.concatenate([b.scrap_len for b in batches]))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_stalks(cls, stalks):
+        '''
+        create a batch from a list of `Stalk` instances
+        '''
+
+        if isinstance(stalks, StalkBatch):
+            return stalks
+
+        return cls(length   =[s.len   for s in stalks],
+                   diameter =[s.dia   for s in stalks],
+                   state    =[STALK_MODEL.index(s.state) for s in stalks],
+                   scrap_len=[s.scrap_len for s in stalks])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        Create a batch from a dict of columns (see `to_arrays()`).  The
+        columns are used as they are, not copied (they can be memory maps).
+        '''
+
+        ret           = cls()
+        ret.length    = np.asarray(arrays['length'],    dtype=float)
+        ret.diameter  = np.asarray(arrays['diameter'],  dtype=float)
+        ret.state     = np.asarray(arrays['state'],     dtype=np.uint8)
+        ret.scrap_len = np.asarray(arrays['scrap_len'], dtype=float)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def to_arrays(self):
+        '''
+        return the batch columns as dict of numpy arrays
+        '''
+
+        return {'length'   : self.length,
+                'diameter' : self.diameter,
+                'state'    : self.state,
+                'scrap_len': self.scrap_len}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self.length)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __getitem__(self, idx):
+
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if idx < 0 or idx >= len(self):
+                raise IndexError('stalk index out of range')
+            return Stalk(batch=self, idx=idx)
+
+        return StalkBatch(length   =self.length   [idx],
+                          diameter =self.diameter [idx],
+                          state    =self.state    [idx],
+                          scrap_len=self.scrap_len[idx])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __iter__(self):
+
+        for idx in range(len(self)):
+            yield Stalk(batch=self, idx=idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _check_state(self, state):
+
+        assert(np.all(self.state == STALK_MODEL.index(state)))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def dry(self):
+
+        self._check_state(FRESH)
+        self.state[:] = STALK_MODEL.index(DRIED)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def select(self, cfg, ledger=None):
+        '''
+        Before peeling the stalks, select wrt. peeler configuration constrains.
+        This returns two batches: the selected stalks and the scrapped ones.
+        The scrapped stalks are added to the `ledger` (if given), by reason.
+        '''
+
+        self._check_state(DRIED)
+
+        thin  = self.diameter < cfg['min_dia']
+        thick = self.diameter > cfg['max_dia']
+        short = self.length   < cfg['min_len']
+        keep  = ~(thin | thick | short)
+
+        if ledger:
+            # reasons are checked in that order, like in `Stalk.select()`
+            ledger.add(STALK, TOO_THIN,  self.length[thin])
+            ledger.add(STALK, TOO_THICK, self.length[thick & ~thin])
+            ledger.add(STALK, TOO_SHORT, self.length[short & ~thin & ~thick])
+
+        selected = self[keep]
+        scrapped = self[~keep]
+
+        selected.state[:]   = STALK_MODEL.index(SELECTED)
+        scrapped.scrap_len += scrapped.length
+        scrapped.length[:]  = 0
+
+        # FIXME: advance to scrapped
+
+        return selected, scrapped
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cut(self, length, ledger=None):
+        '''
+        cut the stalks to the given length (scalar or array with one length per
+        stalk).  The cut off pieces are added to the `ledger` (if given).
+        '''
+
+        self._check_state(SELECTED)
+
+        # FIXME: this is a dumb cut: we always cut from the thin end, event if
+        #        that is not advantegious.
+
+        new_len         = np.minimum(self.length, length)
+        cut_off         = self.length - new_len
+        self.scrap_len += cut_off
+        self.length     = new_len
+
+        if ledger:
+            ledger.add(STALK, CUT_OFF, cut_off[cut_off > 0])
+
+        self.state[:] = STALK_MODEL.index(CUT)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def scrap(self):
+        '''
+        the stalks will not be used further
+        '''
+
+        self.scrap_len += self.length
+        self.length[:]  = 0.0
+
+
+    # --------------------------------------------------------------------------
+    #
+    def peel(self, cfg, rng=None, ledger=None):
+        '''
+        Peel all stalks at once, and return the peeled bast as `BastBatch`.
+        This is the batched form of `Stalk.peel()`: the stalk preparation
+        fails for some stalks (those are scrapped), the others result in 0, 1
+        or 2 pieces of bast, each of which retains a fraction of the stalk
+        length.  All random values are drawn in one array draw each.
+
+        If a `ledger` is given, the waste is added to it: the scrapped stalks,
+        the wood of all peeled stalks, and the lost fibre - one stalk length for
+        each of the two bast pieces which failed to peel, and the unpeeled rest
+        of each piece which did peel.
+        '''
+
+        self._check_state(CUT)
+
+        n = len(self)
+
+        # we randomly fail on some stalks
+        failed = create_flat_array(n, 0.0, 1.0, rng=rng) * 100 \
+               > cfg['prep_efficiency']
+
+        if ledger:
+            ledger.add(STALK, PREP_FAILURE, self.length[failed])
+
+        self.scrap_len[failed] += self.length[failed]
+        self.length   [failed]  = 0.0
+
+        # number of bast pieces: failure, partial failure, full success
+        chance   = create_flat_array(n, 0.0, 1.0, rng=rng)
+        bast_num = np.where(chance < 0.1, 0, np.where(chance < 0.5, 1, 2))
+        bast_num[failed] = 0
+
+        # successfully peeled length in % of the stalk length, per bast
+        origin  = np.repeat(np.arange(n), bast_num)
+        success = success_distribution(cfg).sample(len(origin), rng=rng)
+
+        self.state[~failed] = STALK_MODEL.index(PEELED)
+
+        if ledger:
+            peeled = ~failed
+            ledger.add(WOOD,  PEEL_REMAINS, self.length[peeled])
+            ledger.add(FIBRE, PEEL_FAILURE, np.repeat(self.length[peeled],
+                                                      2 - bast_num[peeled]))
+            ledger.add(FIBRE, PEEL_LOSS,    self.length[origin]
+                                            * (1 - success / 100))
+
+        return BastBatch.from_peel(length=self.length[origin] * success / 100,
+                                   width=self.diameter[origin] * PI / 2,
+                                   rng=rng)
+
 
 # ------------------------------------------------------------------------------
 #
 class Stalk(Thing):
+    '''
+    A single stalk.  The stalk geometry and state live in a `StalkBatch` - this
+    class is a view on one entry of such a batch.  A stalk created on its own
+    gets its own batch of size one.
+    '''
+
+    __slots__ = ['_batch', '_idx']
+
+    MODEL     = STALK_MODEL
 
     # --------------------------------------------------------------------------
     #
-    def __init__(self, length, diameter):
+    def __init__(self, length=None, diameter=None, batch=None, idx=0,
+                       state=None):
         '''
-        create a stalk of given geometry (values in mm).
-        We assume constant width over whole length.  
+        create a stalk of given geometry (values in mm), optionally in the
+        given state.  We assume constant width over whole length.
         '''
 
-        self._len   = length
-        self._dia   = diameter
-        self._vol   = PI * self._dia**2 * self._len
-        self._scrap = {'stalk' : 0, 
-                       'wood'  : 0, 
-                       'fibres': 0}
+        if batch is None:
+            if state: code = STALK_MODEL.index(state)
+            else    : code = STALK_MODEL.index(FRESH)
+            batch = StalkBatch(length=[length], diameter=[diameter],
+                               state=[code])
+
+        self._batch = batch
+        self._idx   = idx
 
-        model = [FRESH, DRIED, SELECTED, CUT, PEELED]
-        super(Stalk, self).__init__(model)
+        super(Stalk, self).__init__()
 
     @property
-    def dia(self): return self._dia
+    def dia(self): return float(self._batch.diameter[self._idx])
+    @property
+    def len(self): return float(self._batch.length[self._idx])
+    @property
+    def state(self): return STALK_MODEL[self._batch.state[self._idx]]
+    @property
+    def state_code(self): return int(self._batch.state[self._idx])
     @property
-    def len(self): return self._len
+    def scrap_len(self): return float(self._batch.scrap_len[self._idx])
+
+    def _set_len(self, length):
+        self._batch.length[self._idx] = length
+
+    def _add_scrap(self, length):
+        self._batch.scrap_len[self._idx] += length
+
+
+    # --------------------------------------------------------------------------
+    #
+    def advance(self, state=None):
+        '''
+        Transision to the next state in the state model, or to the given later
+        state.
+        '''
+
+        if state is None:
+            assert(self._batch.state[self._idx] < (len(STALK_MODEL)-1))
+            self._batch.state[self._idx] += 1
+
+        else:
+            code = STALK_MODEL.index(state)
+            assert(code > self._batch.state[self._idx])
+            self._batch.state[self._idx] = code
+
 
     # --------------------------------------------------------------------------
     #
@@ -69,23 +410,20 @@ class Stalk(Thing):
         assert(self.state == DRIED)
 
         if self.dia < cfg['min_dia']:
-            self._scrap['stalk'] += self._len
-            self._len = 0
-            rep.progress('o')
+            self._add_scrap(self.len)
+            self._set_len(0)
             # FIXME: advance to scrapped
             return False
 
         if self.dia > cfg['max_dia']:
-            self._scrap['stalk'] += self._len
-            self._len = 0
-            rep.progress('O')
+            self._add_scrap(self.len)
+            self._set_len(0)
             # FIXME: advance to scrapped
             return False
 
         if self.len < cfg['min_len']:
-            self._scrap['stalk'] += self._len
-            self._len = 0
-            rep.progress('_')
+            self._add_scrap(self.len)
+            self._set_len(0)
             # FIXME: advance to scrapped
             return False
 
@@ -105,8 +443,8 @@ class Stalk(Thing):
         #        that is not advantegious.
 
         if length < self.len:
-            self._scrap['stalk'] += self.len - length
-            self._len = length
+            self._add_scrap(self.len - length)
+            self._set_len(length)
         else:
             # nothing to cut
             pass
@@ -122,16 +460,18 @@ class Stalk(Thing):
         '''
         # FIXME: state check and transition
 
-        self._scrap['stalk'] += self.len
-        self._len = 0.0
+        self._add_scrap(self.len)
+        self._set_len(0.0)
 
 
     # --------------------------------------------------------------------------
     #
-    def peel(self, cfg):
+    def peel(self, cfg, rng=None):
         '''
         peel the stalk, ie. produce 0, 1 or two pieces of fresh bast.  This also
-        produces some waste, mostly wood and some bast fibers.
+        produces some waste, mostly wood and some bast fibers.  Random values
+        are drawn from `rng` if given, and from the shared default samplers
+        otherwise.
         '''
 
         assert(self.state == CUT)
@@ -142,7 +482,10 @@ class Stalk(Thing):
 
         basts       = list()
         bast_num    = 0
-        bast_chance = random.random()
+        if rng is None:
+            bast_chance = flat_sampler(0.0, 1.0).get()
+        else:
+            bast_chance = float(create_flat_array(1, 0.0, 1.0, rng=rng)[0])
         if   bast_chance < 0.1: bast_num = 0   # failure
         elif bast_chance < 0.5: bast_num = 1   # partial failure
         else                  : bast_num = 2   # full success
@@ -159,11 +502,16 @@ class Stalk(Thing):
             success_max   = cfg['success_max']
             success_mean  = cfg['success_mean']
             success_var   = cfg['success_var']
-            success = beta(n=1,  dmin=success_min, dmax=success_max,  
-                                 dmean=success_mean, dvar=success_var)[0]
-            length  = self._len * success / 100
+            if rng is None:
+                success = beta_sampler(dmin=success_min,  dmax=success_max,
+                                       dmean=success_mean, dvar=success_var,
+                                       accuracy=cfg.get('accuracy')).get()
+            else:
+                success = float(success_distribution(cfg).sample(1, rng)[0])
+            length  = self.len * success / 100
           # print success, '\t', length
-            basts.append(Bast(length=length, width=self.dia*PI/2, cfg=cfg))
+            basts.append(Bast(length=length, width=self.dia*PI/2, cfg=cfg,
+                              rng=rng))
 
         self.advance()
 
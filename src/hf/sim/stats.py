@@ -0,0 +1,432 @@
+
+import math
+
+import numpy as np
+
+
+# ------------------------------------------------------------------------------
+#
+# Online accumulators for stage statistics.  All accumulators are updated with
+# arrays of values (one call per batch or chunk of items flowing through
+# a stage), and accumulators of the same kind can be merged, so that
+# statistics from parallel workers can be combined.
+#
+
+
+# ------------------------------------------------------------------------------
+#
+class Histogram(object):
+    '''
+    A histogram with a fixed number of bins which adapts its range to the data.
+    Bin widths are powers of two and bin edges are multiples of the bin width,
+    so when the range needs to grow, pairs of neighboring bins are merged
+    exactly, and any two histograms can be brought onto the same bins (which
+    is what `merge()` does).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nbins=100):
+
+        self.nbins  = nbins
+        self.width  = None     # bin width, set on first update
+        self.offset = 0        # index of the first bin (in units of `width`)
+        self.counts = np.zeros(nbins, dtype=np.int64)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def edges(self):
+        '''
+        the `nbins + 1` bin edges
+        '''
+
+        if self.width is None:
+            return np.zeros(0)
+
+        return (np.arange(self.nbins + 1) + self.offset) * self.width
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def centers(self):
+        '''
+        the `nbins` bin centers
+        '''
+
+        if self.width is None:
+            return np.zeros(0)
+
+        return (np.arange(self.nbins) + self.offset + 0.5) * self.width
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _coarsen(self):
+        '''
+        double the bin width by merging pairs of bins
+        '''
+
+        idx          = np.arange(self.nbins) + self.offset
+        offset       = self.offset // 2
+        self.counts  = np.bincount(idx // 2 - offset, weights=self.counts,
+                                   minlength=self.nbins).astype(np.int64)
+        self.offset  = offset
+        self.width  *= 2
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _occupied(self):
+        '''
+        return the first and last non-empty bin index, or None if empty
+        '''
+
+        nz = np.nonzero(self.counts)[0]
+
+        if not len(nz):
+            return None
+
+        return self.offset + int(nz[0]), self.offset + int(nz[-1])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _fit(self, vmin, vmax):
+        '''
+        make sure the range [vmin, vmax] is covered by the bins, without
+        losing any counts
+        '''
+
+        if self.width is None:
+            span = float(vmax - vmin) / self.nbins
+            if not span:
+                span = abs(vmax) / self.nbins or 1.0
+            self.width  = 2.0 ** math.ceil(math.log(span, 2))
+            self.offset = int(math.floor(vmin / self.width))
+
+        while True:
+            lo  = int(math.floor(vmin / self.width))
+            hi  = int(math.floor(vmax / self.width))
+            occ = self._occupied()
+            if occ:
+                lo = min(lo, occ[0])
+                hi = max(hi, occ[1])
+            if hi - lo < self.nbins:
+                break
+            self._coarsen()
+
+        if   lo < self.offset                : offset = lo
+        elif hi >= self.offset + self.nbins  : offset = hi - self.nbins + 1
+        else                                 : return
+
+        # shift the bins to start at the new offset
+        counts = np.zeros(self.nbins, dtype=np.int64)
+        if occ:
+            src = np.arange(occ[0], occ[1] + 1)
+            counts[src - offset] = self.counts[src - self.offset]
+        self.counts = counts
+        self.offset = offset
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, values):
+
+        values = np.asarray(values, dtype=float).ravel()
+
+        if not len(values):
+            return
+
+        self._fit(values.min(), values.max())
+
+        idx = np.floor(values / self.width).astype(np.int64) - self.offset
+        self.counts += np.bincount(idx, minlength=self.nbins)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+
+        occ = other._occupied()
+        if not occ:
+            return
+
+        other = other.copy()
+        if self.width is None:
+            self.width  = other.width
+            self.offset = other.offset
+
+        # fitting the range of `other` can coarsen `self` again, so align the
+        # widths until they are stable
+        while True:
+            while other.width < self.width: other._coarsen()
+            while self.width < other.width: self._coarsen()
+
+            lo, hi = other._occupied()
+            self._fit(lo * self.width, (hi + 0.5) * self.width)
+
+            if self.width == other.width:
+                break
+
+        src = np.arange(lo, hi + 1)
+        self.counts[src - self.offset] += other.counts[src - other.offset]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def copy(self):
+
+        ret        = Histogram(self.nbins)
+        ret.width  = self.width
+        ret.offset = self.offset
+        ret.counts = self.counts.copy()
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class Moments(object):
+    '''
+    Count, mean, variance, min and max, updated with Welford's algorithm (in
+    the batched / parallel form by Chan et al., which is also used to merge).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self):
+
+        self.n    = 0
+        self.mean = 0.0
+        self.m2   = 0.0
+        self.min  = None
+        self.max  = None
+
+
+    @property
+    def variance(self): return self.m2 / self.n if self.n else 0.0
+    @property
+    def std(self):      return math.sqrt(self.variance)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _combine(self, n, mean, m2, vmin, vmax):
+
+        if not n:
+            return
+
+        tot        = self.n + n
+        delta      = mean - self.mean
+        self.mean += delta * n / tot
+        self.m2   += m2 + delta ** 2 * self.n * n / tot
+        self.n     = tot
+
+        if self.min is None or vmin < self.min: self.min = vmin
+        if self.max is None or vmax > self.max: self.max = vmax
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, values):
+
+        values = np.asarray(values, dtype=float).ravel()
+
+        if not len(values):
+            return
+
+        mean = values.mean()
+        m2   = ((values - mean) ** 2).sum()
+
+        self._combine(len(values), float(mean), float(m2),
+                      float(values.min()), float(values.max()))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+
+        self._combine(other.n, other.mean, other.m2, other.min, other.max)
+
+
+# ------------------------------------------------------------------------------
+#
+class QuantileSketch(object):
+    '''
+    A mergeable quantile sketch with relative accuracy `alpha` (the DDSketch
+    scheme): values are counted in logarithmically sized buckets of their
+    magnitude, so that any quantile is reported within a relative error of
+    `alpha`.  Positive and negative values are counted in separate (mirrored)
+    buckets, zeros are counted separately.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, alpha=0.01):
+
+        self.alpha     = alpha
+        self.gamma     = (1 + alpha) / (1 - alpha)
+        self.lgamma    = math.log(self.gamma)
+        self.zeros     = 0
+        self.buckets   = dict()    # positive values
+        self.negatives = dict()    # negative values, by magnitude
+
+
+    @property
+    def n(self): return self.zeros + sum(self.buckets.values()) \
+                                   + sum(self.negatives.values())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _count(self, buckets, values):
+
+        if not len(values):
+            return
+
+        keys = np.ceil(np.log(values) / self.lgamma).astype(np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _value(self, key):
+
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, values):
+
+        values = np.asarray(values, dtype=float).ravel()
+        pos    = values[values > 0]
+        neg    = values[values < 0]
+
+        self.zeros += len(values) - len(pos) - len(neg)
+
+        self._count(self.buckets,    pos)
+        self._count(self.negatives, -neg)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+
+        assert(other.alpha == self.alpha)
+
+        self.zeros += other.zeros
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        for key, count in other.negatives.items():
+            self.negatives[key] = self.negatives.get(key, 0) + count
+
+
+    # --------------------------------------------------------------------------
+    #
+    def quantile(self, q):
+        '''
+        return the `q` quantile (0 <= q <= 1)
+        '''
+
+        n = self.n
+        if not n:
+            return None
+
+        rank = q * (n - 1)
+
+        # in ascending order: negative values by decreasing magnitude, zeros,
+        # positive values
+        seen = 0
+        for key in sorted(self.negatives, reverse=True):
+            seen += self.negatives[key]
+            if seen > rank:
+                return -self._value(key)
+
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return self._value(key)
+
+        if self.buckets: return  self._value(max(self.buckets))
+        if self.zeros  : return  0.0
+        return                  -self._value(min(self.negatives))
+
+
+# ------------------------------------------------------------------------------
+#
+class Accumulator(object):
+    '''
+    Histogram, moments and quantile sketch over one stream of values.
+    '''
+
+    QUANTILES = [0.01, 0.05, 0.25, 0.50, 0.75, 0.95, 0.99]
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nbins=100, alpha=0.01):
+
+        self.hist    = Histogram(nbins)
+        self.moments = Moments()
+        self.sketch  = QuantileSketch(alpha)
+
+
+    @property
+    def n(self): return self.moments.n
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, values):
+
+        values = np.asarray(values, dtype=float).ravel()
+
+        self.hist   .update(values)
+        self.moments.update(values)
+        self.sketch .update(values)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+
+        self.hist   .merge(other.hist)
+        self.moments.merge(other.moments)
+        self.sketch .merge(other.sketch)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def result(self):
+        '''
+        return the accumulated statistics as dict
+        '''
+
+        ret = {'n'       : self.moments.n,
+               'mean'    : self.moments.mean,
+               'variance': self.moments.variance,
+               'std'     : self.moments.std,
+               'min'     : self.moments.min,
+               'max'     : self.moments.max,
+               'bins'    : self.hist.centers,
+               'counts'  : self.hist.counts.copy(),
+               'quantiles': dict()}
+
+        for q in self.QUANTILES:
+            ret['quantiles'][q] = self.sketch.quantile(q)
+
+        return ret
+
+
+# ------------------------------------------------------------------------------
+
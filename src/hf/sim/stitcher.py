@@ -1,16 +1,25 @@
 
+import os
 import sys
+import math
+import array
+import heapq
+import collections
 
 import radical.utils as ru
 
 from .distribution import create_beta_distribution as beta
 from .distribution import create_flat_distribution as flat
 
-from .distribution import create_line_plot
-from .distribution import create_hist_plot
-
-from .thing import Thing
+from .thing   import Thing
+from .context import get_context
+from .bast  import BastBatch
 from .bht   import BHT
+from .store import BHTStore
+
+from .checkpoint import pack, unpack
+
+from .instrument import instrumented
 
 PI  = 3.1415926
 rep = ru.LogReporter(name='hf.sim')
@@ -23,139 +32,211 @@ OFF = 'off'
 #
 class Stitcher(Thing):
 
+    __slots__ = ['_cfg', '_ctx', '_input', '_cut', '_spliced']
+
+    MODEL     = [ON, OFF]
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, cfg):
+    def __init__(self, cfg, ctx=None):
+
+        if not ctx:
+            ctx = get_context()
 
         self._cfg     = cfg
-        self._input   = list()
-        self._cut     = list()
-        self._spliced = list()
+        self._ctx     = ctx
+        self._input   = BastBatch()
+        self._cut     = BastBatch()
+        self._spliced = BastBatch()
 
-        model = [ON, OFF]
-        super(Stitcher, self).__init__(model, 'stitcher')
+        super(Stitcher, self).__init__('stitcher')
 
 
     # --------------------------------------------------------------------------
     #
     def feed(self, bast):
-        
-        self._input.extend(bast)
+        '''
+        Bast is given to the stitcher (as `BastBatch` or as list of `Bast`
+        instances)
+        '''
 
-        data = list()
-        for bast in self._input:
-            data.append(bast.width[0])
-        create_hist_plot(fname='bast_width_peel', 
-                         title='Bast Width Histogram (after peeling)',
-                         ptitle='width',
-                         xlabel='width [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+        bast        = BastBatch.from_basts(bast)
+        self._input = BastBatch.concat([self._input, bast])
 
+        # only the new bast is added to the stage statistics
+        data = bast.w0
+        self._ctx.hist_plot(fname='bast_width_peel', 
+                            title='Bast Width Histogram (after peeling)',
+                            ptitle='width',
+                            xlabel='width [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
 
-        data = list()
-        for bast in self._input:
-            data.append(bast.length)
-        create_hist_plot(fname='bast_len_peel', 
-                         title='Bast Length Histogram (after peeling)',
-                         ptitle='length',
-                         xlabel='length [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+
+        data = bast.length
+        self._ctx.hist_plot(fname='bast_len_peel', 
+                            title='Bast Length Histogram (after peeling)',
+                            ptitle='length',
+                            xlabel='length [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('stitcher.cut',
+                  items_in =lambda self: len(self._input),
+                  items_out=lambda self, ret: len(self._cut))
     def cut(self):
         
         print 'input  : %d' % len(self._input )
-        for bast in self._input:
-            self._cut.extend(bast.cut(length=self._cfg['seg_length']))
-        self._input = list()
+        segments    = self._input.cut(length=self._cfg['seg_length'])
+        self._cut   = BastBatch.concat([self._cut, segments])
+        self._input = BastBatch()
 
 
-        data = list()
-        for bast in self._cut:
-            data.append(bast.width[0])
-        create_hist_plot(fname='bast_width_cut', 
-                         title='Bast Width Histogram (after cutting)',
-                         ptitle='width',
-                         xlabel='width [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+        data = segments.w0
+        self._ctx.hist_plot(fname='bast_width_cut', 
+                            title='Bast Width Histogram (after cutting)',
+                            ptitle='width',
+                            xlabel='width [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
 
-        data = list()
-        for bast in self._cut:
-            data.append(bast.length)
-        create_hist_plot(fname='bast_len_cut', 
-                         title='Bast Length Histogram (after cutting)',
-                         ptitle='length',
-                         xlabel='length [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+        data = segments.length
+        self._ctx.hist_plot(fname='bast_len_cut', 
+                            title='Bast Length Histogram (after cutting)',
+                            ptitle='length',
+                            xlabel='length [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
 
 
     # --------------------------------------------------------------------------
     #
+    @instrumented('stitcher.splice',
+                  items_in =lambda self: len(self._cut),
+                  items_out=lambda self, ret: len(self._spliced))
     def splice(self):
 
         print 'cut    : %d' % len(self._cut   )
-        for bast in self._cut:
-            self._spliced.extend(bast.splice(width=self._cfg['splice_width']))
-        self._cut = list()
+        splices       = self._cut.splice(width=self._cfg['splice_width'])
+        self._spliced = BastBatch.concat([self._spliced, splices])
+        self._cut     = BastBatch()
+
+        data = splices.w0
+        self._ctx.hist_plot(fname='bast_width_spliced', 
+                            title='Bast Width Histogram (after splicing)',
+                            ptitle='width',
+                            xlabel='width [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
+
+        data = splices.length
+        self._ctx.hist_plot(fname='bast_len_spliced', 
+                            title='Bast Length Histogram (after splicing)',
+                            ptitle='length',
+                            xlabel='length [mm]', 
+                            ylabel='number of basts', 
+                            data=data)
+
 
-        data = list()
-        for bast in self._spliced:
-            data.append(bast.width[0])
-        create_hist_plot(fname='bast_width_spliced', 
-                         title='Bast Width Histogram (after splicing)',
-                         ptitle='width',
-                         xlabel='width [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+    # --------------------------------------------------------------------------
+    #
+    def checkpoint(self):
+        '''
+        return the stitcher inventory (input, cut and spliced bast) as dict of
+        arrays (see `checkpoint.Checkpoint`)
+        '''
 
-        data = list()
-        for bast in self._spliced:
-            data.append(bast.length)
-        create_hist_plot(fname='bast_len_spliced', 
-                         title='Bast Length Histogram (after splicing)',
-                         ptitle='length',
-                         xlabel='length [mm]', 
-                         ylabel='number of basts', 
-                         data=data)
+        ret = dict()
+        ret.update(pack('input',   self._input  .to_arrays()))
+        ret.update(pack('cut',     self._cut    .to_arrays()))
+        ret.update(pack('spliced', self._spliced.to_arrays()))
+        return ret
 
 
     # --------------------------------------------------------------------------
     #
+    def restore(self, arrays):
+        '''
+        restore the stitcher inventory from a `checkpoint()`
+        '''
+
+        self._input   = BastBatch.from_arrays(unpack('input',   arrays))
+        self._cut     = BastBatch.from_arrays(unpack('cut',     arrays))
+        self._spliced = BastBatch.from_arrays(unpack('spliced', arrays))
+
+
+    # --------------------------------------------------------------------------
+    #
+    @instrumented('stitcher.sew',
+                  items_in =lambda self: len(self._spliced))
     def sew(self):
+        '''
+        Sew the spliced bast into BHT.  The stitcher cfg key `engine` selects
+        the algorithm: `step` (default) advances along the seam in steps of
+        `resolution`, `event` jumps from one join event to the next (see
+        `_sew_event()`).  Both produce the same BHT.
+
+        If the cfg key `store` names a directory, the BHT rows are written to
+        a `BHTStore` there (the step engine writes the rows while sewing), and
+        can be reopened with `BHT.load()`.  A relative directory is taken
+        relative to the run's output directory (see `store_path()`).
+        '''
 
         print 'spliced: %d' % len(self._spliced)
 
+        engine = self._cfg.get('engine', 'step')
+
+        if   engine == 'step' : return self._sew_step()
+        elif engine == 'event': return self._sew_event()
+        else: raise ValueError('unknown sew engine %s' % engine)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _sew_step(self):
+
         res  = self._cfg['resolution']   # len resolution
         segw = self._cfg['seg_width']    # minmimal tot width
-        bht  = list()
         cur  = list()
         idx  = 0
+        row  = 0
+
+        # we work on plain lists of the bast geometry, which is faster than
+        # going through bast views for every step
+        w0s  = self._spliced.w0.tolist()
+        grds = self._spliced.grad.tolist()
+        lens = self._spliced.length.tolist()
+        prog = self._ctx.progress('sew', total=len(lens))
+
+        # rows and joins go into typed (and possibly spilled) buffers
+        bht  = BHTStore(res, segw, path=store_path(self._cfg, self._ctx))
 
         # TODO: also add to cur if basts are near their end
 
-        while idx < len(self._spliced):
+        while idx < len(lens):
             tot  = 0
             keep = list()
-            # what is stitched currently:
-            for bast, pos in cur:
-                pos += res
-                w    = bast.width_at(pos)
+            # what is stitched currently (bast index and row of insertion):
+            for bast, start in cur:
+                pos = (row - start) * res
+                if pos > lens[bast]:
+                    continue
+                w   = w0s[bast] - grds[bast] * pos
                 if w:
                     tot += w
-                    keep.append([bast, pos])
+                    keep.append([bast, start])
             cur = keep
-            while tot < segw:
-                bast = self._spliced[idx]; idx += 1
-                pos  = 0
-                tot += bast.width_at(pos)
-                cur.append([bast, pos])
-            bht.append([tot, len(cur)])
+            while tot < segw and idx < len(lens):
+                bast = idx; idx += 1
+                tot += w0s[bast]
+                cur.append([bast, row])
+                bht.add_join(row)
+            bht.append(tot, len(cur))
+            row += 1
+            prog.set(idx)
 
           # w = len(cur)
           # if   w == 1: print '-',
@@ -163,7 +244,297 @@ class Stitcher(Thing):
           # elif w == 3: print '#',
           # else       : print '?',
 
-        return BHT(res=res, segw=segw, bht=bht)
+        prog.close()
+        bht.close()
+
+        return BHT(res=res, segw=segw, store=bht, ctx=self._ctx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _sew_event(self):
+        '''
+        sew all spliced bast at once with the event driven engine (see `Sewer`)
+        '''
+
+        sewer = Sewer(self._cfg, ctx=self._ctx,
+                      progress=self._ctx.progress('sew', len(self._spliced)))
+        sewer.feed(self._spliced)
+
+        return sewer.finish()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stream(self, chunks):
+        '''
+        Cut, splice and sew bast which arrives in chunks (an iterable of
+        `BastBatch`es, like `Peeler.stream()`), and return the BHT.  Each chunk
+        is sewn as soon as it is spliced, so only one chunk of bast is held at
+        any time.  This needs the `event` engine.
+        '''
+
+        return self.sew_stream(self.splice_stream(chunks))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def splice_stream(self, chunks):
+        '''
+        cut and splice bast which arrives in chunks, and yield the spliced bast
+        of each chunk
+        '''
+
+        for bast in chunks:
+
+            self.feed(bast)
+            self.cut()
+            self.splice()
+
+            spliced, self._spliced = self._spliced, BastBatch()
+
+            yield spliced
+
+
+    # --------------------------------------------------------------------------
+    #
+    def sew_stream(self, chunks):
+        '''
+        sew spliced bast which arrives in chunks, and return the BHT (this
+        needs the `event` engine)
+        '''
+
+        if self._cfg.get('engine', 'step') != 'event':
+            raise ValueError('streaming needs the event sew engine')
+
+        sewer = Sewer(self._cfg, ctx=self._ctx,
+                      progress=self._ctx.progress('sew'))
+
+        for spliced in chunks:
+            with self._ctx.stage('stitcher.sew') as rec:
+                rec.items_in = len(spliced)
+                sewer.feed(spliced)
+
+        return sewer.finish()
+
+
+# ------------------------------------------------------------------------------
+#
+def store_path(cfg, ctx):
+    '''
+    Return the directory of the BHT store named by the stitcher cfg key
+    `store`, or None.  A relative directory is resolved below the output
+    directory of the run (`ctx.path`), so that concurrent runs which share
+    a cfg (like ensemble replicates or sweep points) do not write into the
+    same store.
+    '''
+
+    path = cfg.get('store')
+
+    if not path or os.path.isabs(path):
+        return path
+
+    return '%s/%s' % (ctx.path, path)
+
+
+# ------------------------------------------------------------------------------
+#
+class Sewer(object):
+    '''
+    The event driven sew engine, which can be fed with spliced bast in chunks.
+
+    Bast width is linear over length, so the total width of the seam is linear
+    between two events: a bast ending, or new bast being inserted because the
+    total width dropped below `seg_width`.  We keep a heap of the rows where
+    the basts in the seam end, solve for the row where the total width drops
+    below `seg_width`, and jump to whichever comes first.  Each event starts
+    a new piecewise linear BHT segment.
+
+    Rows are the positions at which the step engine samples the seam (every
+    `resolution` mm), and all decisions are made on the exact same sums as the
+    step engine makes them, so both engines result in the same layer counts -
+    the widths within a segment are interpolated and can differ in the last
+    digits.
+
+    The engine runs as generator which pauses whenever it needs more bast than
+    it was fed so far, and resumes on the next `feed()`.  Only the basts in the
+    seam are kept, so the memory used does not depend on the amount of bast
+    sewn - except for the BHT segments themselves.  Feeding bast in chunks
+    results in the same BHT as feeding it all at once.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg, ctx=None, progress=None):
+
+        if not ctx:
+            ctx = get_context()
+
+        self._cfg      = cfg
+        self._ctx      = ctx
+        self._progress = progress
+        self._chunks   = collections.deque()   # [w0s, grds, lens] not sewn yet
+        self._final    = False                 # no more bast will be fed
+        self._count    = 0                     # basts inserted so far
+        self._joins    = array.array('l')      # rows at which bast is inserted
+
+        # BHT segments: start row, number of rows, layers, width at start row,
+        # width change per row - stored as typed arrays, as those grow with the
+        # BHT length
+        self._segments = [array.array('l'), array.array('l'), array.array('l'),
+                          array.array('d'), array.array('d')]
+
+        self._engine   = self._run()
+        next(self._engine)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def feed(self, bast):
+        '''
+        sew the given spliced bast (`BastBatch`) as far as possible
+        '''
+
+        assert(not self._final)
+
+        if not len(bast):
+            return
+
+        self._chunks.append([bast.w0.tolist(), bast.grad.tolist(),
+                             bast.length.tolist()])
+        next(self._engine)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finish(self):
+        '''
+        no more bast: complete the seam and return the BHT
+        '''
+
+        self._final = True
+
+        for _ in self._engine:
+            pass
+
+        if self._progress:
+            self._progress.close()
+
+        bht = BHT(res=self._cfg['resolution'], segw=self._cfg['seg_width'],
+                  segments=self._segments, joins=self._joins, ctx=self._ctx)
+
+        if self._cfg.get('store'):
+            bht.save(store_path(self._cfg, self._ctx))
+
+        return bht
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run(self):
+
+        res   = self._cfg['resolution']   # len resolution
+        segw  = self._cfg['seg_width']    # minmimal tot width
+        cur   = list()                    # [seq, start row, w0, grad] in
+                                          # insertion order
+        ends  = list()                    # heap of [end row, seq]
+        joins = self._joins
+        prog  = self._progress
+        row   = 0
+
+        seg_start, seg_rows, seg_layers, seg_width, seg_slope = self._segments
+
+        # the chunk currently consumed, and the index of the next bast in it
+        w0s  = grds = lens = list()
+        idx  = 0
+
+        def total(row):
+            # total seam width at that row, summed like the step engine does
+            tot = 0
+            for _, start, w0, grd in cur:
+                tot += w0 - grd * ((row - start) * res)
+            return tot
+
+        def last_row(w0, grd, length, start):
+            # last row at which the bast is still part of the seam
+            n = int(length / res)
+            while (n + 1) * res <= length:
+                n += 1
+            while n > 0 and n * res > length:
+                n -= 1
+            while n > 0 and not w0 - grd * (n * res):
+                n -= 1
+            return start + n
+
+        # wait for the first bast
+        yield
+        if not self._chunks:
+            return
+
+        while True:
+
+            # remove basts which ended before this row
+            if ends and ends[0][0] < row:
+                while ends and ends[0][0] < row:
+                    heapq.heappop(ends)
+                alive = set([seq for _, seq in ends])
+                cur   = [entry for entry in cur if entry[0] in alive]
+
+            # insert new basts as needed
+            tot = total(row)
+            while tot < segw:
+
+                if idx >= len(lens):
+                    # current chunk is used up - wait for the next one
+                    while not self._chunks and not self._final:
+                        yield
+                    if not self._chunks:
+                        break
+                    w0s, grds, lens = self._chunks.popleft()
+                    idx = 0
+
+                w0, grd, length = w0s[idx], grds[idx], lens[idx]
+                idx += 1
+                tot += w0
+                cur.append([self._count, row, w0, grd])
+                joins.append(row)
+                heapq.heappush(ends, [last_row(w0, grd, length, row),
+                                      self._count])
+                self._count += 1
+
+            if prog:
+                prog.set(self._count)
+
+            slope = -sum([grd for _, _, _, grd in cur]) * res
+
+            seg_start .append(row)
+            seg_rows  .append(1)
+            seg_layers.append(len(cur))
+            seg_width .append(tot)
+            seg_slope .append(slope)
+
+            if idx >= len(lens):
+                # all bast fed so far is used up - stop if no more is coming
+                while not self._chunks and not self._final:
+                    yield
+                if not self._chunks:
+                    break
+
+            # the next bast to end defines the next event, unless the seam
+            # gets too thin before that
+            nxt = ends[0][0] + 1
+
+            if slope < 0:
+                drop = row + 1 + int(math.floor((tot - segw) / -slope))
+                drop = max(row + 1, min(nxt, drop))
+                while drop > row + 1 and total(drop - 1) < segw:
+                    drop -= 1
+                while drop < nxt and total(drop) >= segw:
+                    drop += 1
+                nxt = drop
+
+            seg_rows[-1] = nxt - row
+            row = nxt
 
 
 # ------------------------------------------------------------------------------
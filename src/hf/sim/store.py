@@ -0,0 +1,337 @@
+
+import os
+import json
+import array
+import shutil
+import tempfile
+
+import numpy as np
+
+import radical.utils as ru
+
+rep = ru.LogReporter(name='hf.sim')
+
+# the row columns of a store: name, numpy dtype, array typecode
+COLUMNS = [['width',  np.float32, 'f'],    # total bast width [mm]
+           ['layers', np.uint8,   'B']]    # number of layers
+JOINS   =  ['joins',  np.int64,   'l']     # rows at which bast is inserted
+
+# number of rows buffered in memory before they are spilled to disk
+BLOCK = 1024 * 1024
+
+META = 'meta.json'
+
+
+# ------------------------------------------------------------------------------
+#
+class BHTStore(object):
+    '''
+    The rows of a BHT (total width and number of layers per `res` mm) and its
+    join rows, as typed columns: `float32` width, `uint8` layers and `int64`
+    joins - 5 bytes per row instead of a python list per row.
+
+    Rows are appended to growing typed buffers.  A store with a `path` spills
+    those buffers into one raw file per column whenever `block` rows are
+    buffered, so the rows do not need to fit into memory.  The files are
+    written into a temporary directory next to `path`: `close()` writes the
+    remaining rows and the meta data (`meta.json`) there, and then replaces
+    `path` by that directory - so `path` never holds meta data which does not
+    match its columns, and an existing store in `path` stays intact until
+    then.  `BHTStore.open(path)` maps the columns back into memory without
+    parsing anything.  `read(a, b)` only touches the rows in `[a, b)`.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, res, segw, path=None, block=BLOCK):
+
+        self._res    = res
+        self._segw   = segw
+        self._path   = path
+        self._dir    = path        # where the column files are written
+        self._block  = block
+        self._spilt  = dict([[name, 0] for name, _, _ in COLUMNS + [JOINS]])
+        self._maps   = dict()
+        self._closed = False
+        self._buf    = dict([[name, array.array(code)]
+                             for name, _, code in COLUMNS + [JOINS]])
+
+        if path:
+            path   = os.path.abspath(path)
+            parent = os.path.dirname(path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            self._dir = tempfile.mkdtemp(dir=parent, prefix='%s.tmp.'
+                                         % os.path.basename(path))
+            for name, _, _ in COLUMNS + [JOINS]:
+                open(self._fname(name), 'wb').close()
+
+
+    @property
+    def res(self):  return self._res
+    @property
+    def segw(self): return self._segw
+    @property
+    def path(self): return self._path
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def open(cls, path):
+        '''
+        open a closed store in `path`, with the columns memory mapped read-only
+        '''
+
+        with open('%s/%s' % (path, META), 'r') as fin:
+            meta = json.load(fin)
+
+        store = cls(meta['res'], meta['segw'])
+
+        store._path   = path
+        store._dir    = path
+        store._closed = True
+        store._spilt  = dict([[name, meta['rows'][name]]
+                              for name, _, _ in COLUMNS + [JOINS]])
+
+        return store
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_arrays(cls, res, segw, width, layers, joins=None):
+        '''
+        create a closed store over the given column arrays (which can be memory
+        maps, like those loaded from a `Checkpoint`), without copying them
+        '''
+
+        if joins is None:
+            joins = np.zeros(0, dtype=np.int64)
+
+        store = cls(res, segw)
+
+        store._closed = True
+        store._maps   = {'width' : np.asarray(width,  dtype=np.float32),
+                         'layers': np.asarray(layers, dtype=np.uint8),
+                         'joins' : np.asarray(joins,  dtype=np.int64)}
+        store._spilt  = dict([[name, len(arr)]
+                              for name, arr in store._maps.items()])
+
+        assert(store._spilt['width'] == store._spilt['layers'])
+
+        return store
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _fname(self, name):
+
+        return '%s/%s.bin' % (self._dir, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return self._spilt['width'] + len(self._buf['width'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def append(self, width, layers):
+        '''
+        append one row
+        '''
+
+        if layers > 255:
+            raise ValueError('too many layers for the store (%d)' % layers)
+
+        self._buf['width'].append(width)
+        self._buf['layers'].append(layers)
+
+        if len(self._buf['width']) >= self._block:
+            self._spill()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def extend(self, width, layers):
+        '''
+        append rows, given as arrays of widths and layers
+        '''
+
+        width  = np.asarray(width,  dtype=np.float32)
+        layers = np.asarray(layers)
+
+        assert(len(width) == len(layers))
+
+        if len(layers) and layers.max() > 255:
+            raise ValueError('too many layers for the store (%d)'
+                            % layers.max())
+
+        self._buf['width'] .extend(width.tolist())
+        self._buf['layers'].extend(layers.astype(np.uint8).tolist())
+
+        if len(self._buf['width']) >= self._block:
+            self._spill()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add_join(self, row):
+
+        self._buf['joins'].append(row)
+
+
+    def add_joins(self, rows):
+
+        self._buf['joins'].extend(np.asarray(rows, dtype=np.int64).tolist())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _spill(self):
+        '''
+        append the buffered rows to the column files (if the store has a path)
+        '''
+
+        if not self._path or self._closed:
+            return
+
+        for name, _, _ in COLUMNS + [JOINS]:
+            buf = self._buf[name]
+            if not len(buf):
+                continue
+            with open(self._fname(name), 'ab') as fout:
+                buf.tofile(fout)
+            self._spilt[name] += len(buf)
+            del buf[:]
+
+        self._maps = dict()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+        '''
+        No more rows: write the remaining rows and the meta data (for stores
+        with a path).  Stores without a path stay in memory.
+        '''
+
+        if self._closed or not self._path:
+            return
+
+        self._spill()
+        self._closed = True
+
+        meta = {'res'   : self._res,
+                'segw'  : self._segw,
+                'rows'  : self._spilt,
+                'dtypes': dict([[name, np.dtype(dtype).str]
+                                for name, dtype, _ in COLUMNS + [JOINS]])}
+
+        with open('%s/%s' % (self._dir, META), 'w') as fout:
+            json.dump(meta, fout, indent=2, sort_keys=True)
+
+        # a directory cannot be renamed onto a non-empty one: move an old
+        # store aside first (columns mapped from it stay valid)
+        old = None
+        if os.path.exists(self._path):
+            old = '%s.old' % self._dir
+            os.rename(self._path, old)
+
+        os.rename(self._dir, self._path)
+        self._dir = self._path
+
+        if old:
+            shutil.rmtree(old)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _column(self, name, dtype, a, b):
+        '''
+        rows `[a, b)` of a column, from the mapped file and / or the buffer
+        '''
+
+        spilt = self._spilt[name]
+        parts = list()
+
+        if a < spilt:
+            if name not in self._maps:
+                self._maps[name] = np.memmap(self._fname(name), dtype=dtype,
+                                             mode='r', shape=(spilt,))
+            parts.append(self._maps[name][a:min(b, spilt)])
+
+        if b > spilt:
+            buf = self._buf[name]
+            # copy: the buffer may be reallocated when it grows
+            if len(buf):
+                parts.append(np.frombuffer(buf, dtype=dtype)
+                                           [max(0, a - spilt):b - spilt].copy())
+
+        if not parts:
+            return np.zeros(0, dtype=dtype)
+
+        if len(parts) == 1:
+            return parts[0]
+
+        return np.concatenate(parts)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def read(self, a=0, b=None):
+        '''
+        return the widths and layers of the rows `[a, b)` (default: up to the
+        last row) as numpy arrays.  Rows on disk are returned as memory mapped
+        slices, so only the pages which are actually used are read.
+        '''
+
+        n = len(self)
+
+        if b is None:
+            b = n
+
+        a = max(0, min(n, int(a)))
+        b = max(a, min(n, int(b)))
+
+        return [self._column(name, dtype, a, b) for name, dtype, _ in COLUMNS]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def blocks(self, size=BLOCK):
+        '''
+        iterate over the rows in blocks of `size` rows, yielding the start row,
+        widths and layers of each block
+        '''
+
+        for start in range(0, len(self), size):
+            width, layers = self.read(start, start + size)
+            yield start, width, layers
+
+
+    # --------------------------------------------------------------------------
+    #
+    def joins(self, a=0, b=None):
+        '''
+        return the join rows in `[a, b)` (default: all)
+        '''
+
+        name, dtype, _ = JOINS
+        joins = self._column(name, dtype, 0,
+                             self._spilt[name] + len(self._buf[name]))
+
+        if a == 0 and b is None:
+            return joins
+
+        lo = np.searchsorted(joins, a)
+        hi = np.searchsorted(joins, b) if b is not None else len(joins)
+
+        return joins[lo:hi]
+
+
+# ------------------------------------------------------------------------------
+
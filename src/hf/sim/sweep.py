@@ -0,0 +1,404 @@
+
+import os
+import copy
+import json
+import binascii
+import itertools
+import multiprocessing as mp
+
+import numpy as np
+
+import radical.utils as ru
+
+from .context      import Context
+from .distribution import create_rng, derive_seed
+from .pipeline     import run_pipeline
+from .ensemble     import summarize, get_cache, _init_worker, TIMEOUT
+from .cache        import MAX_SIZE
+from .progress     import Progress
+
+rep = ru.LogReporter(name='hf.sim')
+
+# supported sweep designs
+GRID   = 'grid'
+RANDOM = 'random'
+LHS    = 'lhs'
+DESIGNS = [GRID, RANDOM, LHS]
+
+
+# ------------------------------------------------------------------------------
+#
+def get_path(cfg, path):
+    '''
+    return the value at the dotted `path` (like `peeler.max_dia`) in `cfg`
+    '''
+
+    for key in path.split('.'):
+        cfg = cfg[key]
+
+    return cfg
+
+
+# ------------------------------------------------------------------------------
+#
+def set_path(cfg, path, value):
+    '''
+    set the value at the dotted `path` (like `peeler.max_dia`) in `cfg` - the
+    path must exist, so that typos in sweep axes do not go unnoticed
+    '''
+
+    keys = path.split('.')
+    for key in keys[:-1]:
+        cfg = cfg[key]
+
+    if keys[-1] not in cfg:
+        raise KeyError('no cfg entry %s' % path)
+
+    cfg[keys[-1]] = value
+
+
+# ------------------------------------------------------------------------------
+#
+class Axis(object):
+    '''
+    One sweep dimension: a dotted cfg path, and either a list of discrete
+    `values`, or a range `[low, high]`.  Grid designs use the values, or `num`
+    evenly spaced points of the range.  Random and Latin hypercube designs draw
+    from the range, or pick from the values.  Values drawn from a range with
+    integer bounds are rounded to integers.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, path, values=None, low=None, high=None, num=5):
+
+        if values is None and (low is None or high is None):
+            raise ValueError('axis %s needs values or a range' % path)
+
+        self.path   = path
+        self.values = list(values) if values is not None else None
+        self.low    = low
+        self.high   = high
+        self.num    = num
+
+
+    # --------------------------------------------------------------------------
+    #
+    def as_dict(self):
+
+        return {'path'  : self.path,
+                'values': self.values,
+                'low'   : self.low,
+                'high'  : self.high,
+                'num'   : self.num}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _cast(self, vals):
+
+        if isinstance(self.low, int) and isinstance(self.high, int):
+            return [int(v) for v in np.round(vals)]
+
+        return [float(v) for v in vals]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def grid(self):
+        '''
+        return the axis values for a grid design
+        '''
+
+        if self.values is not None:
+            return list(self.values)
+
+        return self._cast(np.linspace(self.low, self.high, self.num))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def scale(self, u):
+        '''
+        map an array of numbers in [0, 1) onto the axis
+        '''
+
+        if self.values is not None:
+            idx = (np.asarray(u) * len(self.values)).astype(int)
+            return [self.values[i] for i in idx]
+
+        return self._cast(self.low + np.asarray(u) * (self.high - self.low))
+
+
+# ------------------------------------------------------------------------------
+#
+def design_points(axes, design=GRID, n=None, seed=0):
+    '''
+    Return the list of sweep points as dicts `{path: value}`:
+
+      grid  : the cartesian product of all axis grids (`n` is ignored)
+      random: `n` points, each axis sampled uniformly
+      lhs   : `n` points of a Latin hypercube: each axis range is split into
+              `n` strata, and each stratum is used by exactly one point
+
+    The points only depend on the arguments, so that a sweep can be resumed.
+    '''
+
+    if design not in DESIGNS:
+        raise ValueError('unknown sweep design %s' % design)
+
+    if design == GRID:
+        grids = [axis.grid() for axis in axes]
+        return [dict(zip([axis.path for axis in axes], vals))
+                for vals in itertools.product(*grids)]
+
+    if not n:
+        raise ValueError('design %s needs the number of points' % design)
+
+    rng  = create_rng(derive_seed(seed, 'design', design))
+    cols = list()
+    for axis in axes:
+        if design == RANDOM:
+            u = rng.uniform(0.0, 1.0, size=n)
+        else:
+            u = (rng.permutation(n) + rng.uniform(0.0, 1.0, size=n)) / n
+        cols.append(axis.scale(u))
+
+    return [dict(zip([axis.path for axis in axes], vals))
+            for vals in zip(*cols)]
+
+
+# ------------------------------------------------------------------------------
+#
+def _run_point(args):
+    '''
+    run all replicates of one sweep point, return its result row (with the
+    summarized metrics, and the wall time per stage over all replicates)
+    '''
+
+    idx, cfg, params, seeds, cache = args
+
+    row = {'point' : idx,
+           'params': params,
+           'seeds' : seeds}
+
+    try:
+        cfg = copy.deepcopy(cfg)
+        for path, value in params.items():
+            set_path(cfg, path, value)
+
+        metrics = list()
+        timings = dict()
+        for seed in seeds:
+            ctx = Context(plot=False, seed=seed)
+            try:
+                bht = run_pipeline(cfg, ctx=ctx, cache=get_cache(cache))
+            finally:
+                ctx.close()
+            metrics.append(bht.metrics())
+
+            for name, t in ctx.instrument.totals().items():
+                timings[name] = timings.get(name, 0.0) + t
+
+        row['metrics'] = summarize(metrics)
+        row['timings'] = timings
+
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+
+    return row
+
+
+# ------------------------------------------------------------------------------
+#
+class Sweep(object):
+    '''
+    A parameter sweep over a set of `Axis` instances.  Each sweep point runs
+    `replicates` headless replicates of the full production chain (see
+    `run_pipeline()`) and results in one row with the summarized BHT metrics
+    (see `summarize()`).
+
+    Rows are appended to the json-lines file `output` as soon as a point
+    completes, and the first line of that file describes the sweep.  Running
+    a sweep with an existing output file resumes it: the design is restored
+    from that first line (and must match), and only points which have no
+    result yet (or which failed) are run.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg, axes, output, design=GRID, n=None, seed=None,
+                       replicates=1, workers=None, quiet=True, cache=None,
+                       cache_size=MAX_SIZE):
+        '''
+        cfg       : base configuration (see `config.DEFAULT_CFG`)
+        axes      : list of `Axis` instances
+        output    : json-lines result file
+        design    : `grid`, `random` or `lhs`
+        n         : number of points (random and lhs designs)
+        seed      : root seed for design and replicates (default: random)
+        replicates: number of replicates per point
+        workers   : number of worker processes (default: number of cores)
+        quiet     : suppress the stage reports of the worker processes
+        cache     : directory of a `StageCache` for the upstream stage outputs
+                    (default: no caching)
+        cache_size: size limit of that cache (bytes)
+        '''
+
+        # the seed of a resumed sweep is restored from the output file
+        check = ['cfg', 'design', 'n', 'replicates', 'axes']
+        if seed is None:
+            seed = int(binascii.hexlify(os.urandom(4)), 16)
+        else:
+            check.append('seed')
+
+        self._cfg     = cfg
+        self._axes    = axes
+        self._output  = output
+        self._workers = workers or mp.cpu_count()
+        self._quiet   = quiet
+        self._cache   = [cache, cache_size] if cache else None
+        self._meta    = {'cfg'       : cfg,
+                         'design'    : design,
+                         'n'         : n,
+                         'seed'      : seed,
+                         'replicates': replicates,
+                         'axes'      : [axis.as_dict() for axis in axes]}
+
+        rows = self._read()
+        if rows:
+            self._meta = self._check(rows[0], check)
+
+        self._points = design_points(axes, design=self._meta['design'],
+                                     n=self._meta['n'], seed=self._meta['seed'])
+
+
+    @property
+    def seed(self):   return self._meta['seed']
+    @property
+    def points(self): return list(self._points)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _read(self):
+        '''
+        Read all rows of the output file.  A trailing incomplete line (the
+        sweep was interrupted while writing) is ignored.
+        '''
+
+        rows = list()
+
+        if not os.path.isfile(self._output):
+            return rows
+
+        with open(self._output, 'r') as fin:
+            for line in fin:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass
+
+        return rows
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _check(self, head, keys):
+
+        meta = head.get('sweep')
+        if not meta:
+            raise ValueError('%s is not a sweep result file' % self._output)
+
+        for key in keys:
+            if json.loads(json.dumps(self._meta[key])) != meta[key]:
+                raise ValueError('cannot resume %s: %s differs'
+                                % (self._output, key))
+
+        return meta
+
+
+    # --------------------------------------------------------------------------
+    #
+    def results(self):
+        '''
+        return the result rows of all completed points, in point order
+        '''
+
+        rows = dict()
+        for row in self._read()[1:]:
+            if 'error' not in row:
+                rows[row['point']] = row
+
+        return [rows[idx] for idx in sorted(rows)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self):
+        '''
+        run all sweep points which have no result yet, and return all result
+        rows (see `results()`)
+        '''
+
+        done = set([row['point'] for row in self.results()])
+        reps = self._meta['replicates']
+        seed = self._meta['seed']
+        # all points use the same replicate seeds (common random numbers):
+        # differences between points are then due to the parameters, not to
+        # sampling noise, and upstream stage outputs can be reused for points
+        # which only differ in downstream parameters (see `StageCache`)
+        seeds = [derive_seed(seed, 'replicate', r) for r in range(reps)]
+        todo  = [[idx, self._cfg, params, seeds, self._cache]
+                 for idx, params in enumerate(self._points) if idx not in done]
+
+        rep.header('Sweep: %d points (%d done), %d replicates, %d workers'
+                  % (len(self._points), len(done), reps, self._workers))
+
+        if not os.path.isfile(self._output):
+            with open(self._output, 'w') as fout:
+                fout.write(json.dumps({'sweep': self._meta}) + '\n')
+
+        else:
+            # drop an incomplete last line before appending new rows
+            with open(self._output, 'rb+') as fout:
+                data = fout.read()
+                fout.truncate(data.rfind(b'\n') + 1)
+
+        failed = 0
+        prog   = Progress('points', total=len(todo))
+
+        if todo:
+            pool = mp.Pool(min(self._workers, len(todo)),
+                           initializer=_init_worker, initargs=[self._quiet])
+            try:
+                with open(self._output, 'a') as fout:
+                    results = pool.imap_unordered(_run_point, todo, chunksize=1)
+                    for _ in todo:
+                        row = results.next(TIMEOUT)
+                        fout.write(json.dumps(row, sort_keys=True) + '\n')
+                        fout.flush()
+                        if 'error' in row:
+                            failed += 1
+                        prog.update()
+                pool.close()
+
+            except:
+                pool.terminate()
+                raise
+
+            finally:
+                pool.join()
+
+        prog.close()
+
+        if failed:
+            rep.warn('%d of %d points failed\n' % (failed, len(todo)))
+
+        rep.ok('>> ok\n')
+
+        return self.results()
+
+
+# ------------------------------------------------------------------------------
+
@@ -13,45 +13,57 @@ class Thing(object):
     Abstract base class for a stateful object.
 
     This class is really just a container for a state model and the respective
-    state model transitions (by calling `self.advance()`)
+    state model transitions (by calling `self.advance()`).  The state model is
+    defined once per class, as list of states in `MODEL` - an instance only
+    stores the index of its current state in that list (its state code).
     '''
 
+    __slots__ = ['_sidx', '_uid']
+
+    # the state model, defined by the subclasses
+    MODEL = list()
+
     # --------------------------------------------------------------------------
     #
-    def __init__(self, model, name=None):
+    def __init__(self, name=None, state=None):
         '''
-        Define the state model and set initial state.
+        Set the initial state (default: the first state of the model).  If
+        a name is given, a uid is generated from it.
         '''
 
-        self._model = model
-        self._sidx  = 0
-        self._state = model[0]
-        self._uid   = None
+        if state is None: self._sidx = 0
+        else            : self._sidx = self.MODEL.index(state)
 
-        if name:
-            self._uid = ru.generate_id(name)
+        if name: self._uid = ru.generate_id(name)
+        else   : self._uid = None
 
 
     # --------------------------------------------------------------------------
     #
     @property
-    def state(self): return self._state
+    def state(self):      return self.MODEL[self._sidx]
     @property
-    def uid(self)  : return self._uid
+    def state_code(self): return self._sidx
+    @property
+    def uid(self):        return self._uid
 
 
     # --------------------------------------------------------------------------
     #
-    def advance(self):
+    def advance(self, state=None):
         '''
-        Transision to the next state in the state model.
+        Transision to the next state in the state model, or to the given later
+        state.
         '''
-        
-        assert(self._state in self._model)
-        assert(self._sidx  < (len(self._model)-1))
 
-        self._sidx  += 1
-        self._state  = self._model[self._sidx]
+        if state is None:
+            assert(self._sidx < (len(self.MODEL)-1))
+            self._sidx += 1
+
+        else:
+            sidx = self.MODEL.index(state)
+            assert(sidx > self._sidx)
+            self._sidx = sidx
 
 
 # ------------------------------------------------------------------------------
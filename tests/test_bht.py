@@ -0,0 +1,127 @@
+
+import numpy as np
+
+import hf.sim as sim
+
+
+# ------------------------------------------------------------------------------
+#
+def _bht(seed=1):
+
+    cfg = sim.get_cfg()
+    cfg['farmer']['areas']    = [5]
+    cfg['stitcher']['engine'] = 'event'
+
+    return sim.run_pipeline(cfg, ctx=sim.Context(plot=False, seed=seed))
+
+
+# ------------------------------------------------------------------------------
+#
+def _brute(width, layers, joins, a, b):
+    '''
+    the metrics of `BHTIndex.query()` over the rows `[a, b)`, from the columns
+    '''
+
+    w   = width [a:b]
+    l   = layers[a:b]
+    ret = {'rows' : len(l),
+           'joins': int(((joins >= a) & (joins < b)).sum())}
+
+    if len(l):
+        ret.update({'thickness_mean': l.mean(), 'thickness_std': l.std(),
+                    'thickness_min' : l.min(),  'thickness_max': l.max(),
+                    'width_mean'    : w.mean(), 'width_std'    : w.std(),
+                    'width_min'     : w.min(),  'width_max'    : w.max()})
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+def _check(res, ref):
+
+    for key in ref:
+
+        if key.endswith('_std'):
+            # the variances are differences of prefix sums of squares over the
+            # whole BHT, so compare them with an absolute error relative to
+            # the squared mean
+            scale = ref[key.replace('_std', '_mean')] ** 2
+            assert(abs(res[key] ** 2 - ref[key] ** 2) <= 1e-9 * scale), key
+
+        else:
+            assert(np.isclose(res[key], ref[key], rtol=1e-9, atol=1e-9)), key
+
+
+# ------------------------------------------------------------------------------
+#
+def test_index_query():
+
+    bht           = _bht()
+    width, layers = bht.columns()
+    joins         = bht.to_arrays()['joins']
+    rows          = bht.rows
+
+    ranges = [[0, rows], [0, 1], [rows - 1, rows], [5, 5], [rows, rows + 10],
+              [-10, 10], [0, None]]
+
+    rng = np.random.RandomState(1)
+    for _ in range(100):
+        a, b = sorted(rng.randint(0, rows + 1, 2))
+        ranges.append([a, b])
+
+    for a, b in ranges:
+        ref = _brute(width, layers, joins, max(0, a),
+                     rows if b is None else min(rows, b))
+        _check(bht.index.query(a, b), ref)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_index_profile():
+
+    bht           = _bht(seed=2)
+    width, layers = bht.columns()
+    joins         = bht.to_arrays()['joins']
+    rows          = bht.rows
+
+    for window in [1, 7, 1000, rows - 1, rows, 2 * rows]:
+
+        prof = bht.index.profile(window)
+
+        assert(np.array_equal(prof['start'], np.arange(0, rows, window)))
+        for i, a in enumerate(prof['start']):
+            ref = _brute(width, layers, joins, a, min(rows, a + window))
+            _check(dict([[key, prof[key][i]] for key in ref]), ref)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_query_meters():
+
+    bht = _bht(seed=3)
+    res = float(bht.to_arrays()['res'])
+
+    for a, b in [[0.0, 1.0], [0.12, 3.456], [10.0, None]]:
+
+        ret = bht.query(a, b)
+        ref = bht.index.query(int(round(a * 1000 / res)),
+                              None if b is None else int(round(b * 1000 / res)))
+
+        for key in ref:
+            assert(ret[key] == ref[key])
+
+        assert(ret['length']      == ref['rows'] * res / 1000)
+        assert(ret['joins_per_m'] == ref['joins'] / ret['length'])
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_index_query()
+    test_index_profile()
+    test_query_meters()
+
+
+# ------------------------------------------------------------------------------
+
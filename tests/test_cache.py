@@ -0,0 +1,96 @@
+
+import shutil
+import tempfile
+
+import numpy as np
+
+import hf.sim as sim
+
+
+# ------------------------------------------------------------------------------
+#
+def _cfg():
+
+    cfg = sim.get_cfg()
+    cfg['farmer']['areas'] = [5]
+
+    return cfg
+
+
+# ------------------------------------------------------------------------------
+#
+def _equal(bht, ref):
+
+    arrays = bht.to_arrays()
+
+    assert(sorted(arrays) == sorted(ref))
+    for key in ref:
+        assert(np.array_equal(arrays[key], ref[key]))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cache_hit():
+
+    ref = sim.run_pipeline(_cfg(), ctx=sim.Context(plot=False, seed=1))
+    ref = ref.to_arrays()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        cache = sim.StageCache(tmp)
+
+        ctx = sim.Context(plot=False, seed=1)
+        _equal(sim.run_pipeline(_cfg(), ctx=ctx, cache=cache), ref)
+        assert('stalk_len' in ctx.results)
+
+        # stalks and bast are taken from the cache, nothing is grown or peeled
+        ctx = sim.Context(plot=False, seed=1)
+        _equal(sim.run_pipeline(_cfg(), ctx=ctx, cache=cache), ref)
+        assert('stalk_len'          not in ctx.results)
+        assert('stalk_len_selected' not in ctx.results)
+
+        # another seed is a miss
+        ctx = sim.Context(plot=False, seed=2)
+        sim.run_pipeline(_cfg(), ctx=ctx, cache=cache)
+        assert('stalk_len' in ctx.results)
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cache_stalks_only():
+
+    cfg = _cfg()
+    cfg['peeler']['min_len'] = 2 * sim.get_cfg()['peeler']['min_len']
+
+    ref = sim.run_pipeline(cfg, ctx=sim.Context(plot=False, seed=3))
+    ref = ref.to_arrays()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        cache = sim.StageCache(tmp)
+        sim.run_pipeline(_cfg(), ctx=sim.Context(plot=False, seed=3),
+                         cache=cache)
+
+        # a different peeler cfg reuses the stalks, but peels them again
+        ctx = sim.Context(plot=False, seed=3)
+        _equal(sim.run_pipeline(cfg, ctx=ctx, cache=cache), ref)
+        assert('stalk_len'          not in ctx.results)
+        assert('stalk_len_selected'     in ctx.results)
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_cache_hit()
+    test_cache_stalks_only()
+
+
+# ------------------------------------------------------------------------------
+
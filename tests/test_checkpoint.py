@@ -0,0 +1,108 @@
+
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+import hf.sim as sim
+
+from hf.sim.checkpoint import STAGES, MANIFEST
+
+
+# ------------------------------------------------------------------------------
+#
+def _cfg():
+
+    cfg = sim.get_cfg()
+    cfg['farmer']['areas'] = [5]
+
+    return cfg
+
+
+# ------------------------------------------------------------------------------
+#
+def _truncate(path, n):
+    '''
+    make the checkpoint at `path` look like a run which died after the first
+    `n` stages
+    '''
+
+    fname = '%s/%s' % (path, MANIFEST)
+    with open(fname, 'r') as fin:
+        manifest = json.load(fin)
+
+    manifest['stages'] = STAGES[:n]
+    manifest['arrays'] = dict([[stage, manifest['arrays'][stage]]
+                               for stage in STAGES[:n]])
+
+    with open(fname, 'w') as fout:
+        json.dump(manifest, fout)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_resume():
+
+    ref = sim.run_pipeline(_cfg(), ctx=sim.Context(plot=False, seed=1))
+    ref = ref.to_arrays()
+
+    for n in range(len(STAGES) + 1):
+
+        tmp = tempfile.mkdtemp()
+        try:
+            sim.run_pipeline(_cfg(), ctx=sim.Context(plot=False, seed=1),
+                             checkpoint=sim.Checkpoint(tmp))
+            _truncate(tmp, n)
+
+            checkpoint = sim.Checkpoint(tmp)
+            assert(checkpoint.stages == STAGES[:n])
+
+            ctx    = sim.Context(plot=False, seed=1)
+            bht    = sim.run_pipeline(_cfg(), ctx=ctx, checkpoint=checkpoint)
+            arrays = bht.to_arrays()
+
+            # the stalks are only grown if not checkpointed
+            assert(('stalk_len' in ctx.results) == (n == 0))
+
+            assert(checkpoint.stages == STAGES)
+            assert(sorted(arrays) == sorted(ref))
+            for key in ref:
+                assert(np.array_equal(arrays[key], ref[key]))
+
+        finally:
+            shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_other_run():
+
+    tmp = tempfile.mkdtemp()
+    try:
+        sim.run_pipeline(_cfg(), ctx=sim.Context(plot=False, seed=1),
+                         checkpoint=sim.Checkpoint(tmp))
+
+        for cfg, seed in [[_cfg(), 2], [sim.get_cfg(), 1]]:
+            try:
+                sim.run_pipeline(cfg, ctx=sim.Context(plot=False, seed=seed),
+                                 checkpoint=sim.Checkpoint(tmp))
+            except ValueError:
+                pass
+            else:
+                assert(False), 'resumed a different run'
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_resume()
+    test_other_run()
+
+
+# ------------------------------------------------------------------------------
+
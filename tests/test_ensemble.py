@@ -0,0 +1,46 @@
+
+import math
+
+import hf.sim as sim
+
+from hf.sim.ensemble import t_95
+
+
+# ------------------------------------------------------------------------------
+#
+def test_t_quantiles():
+
+    # reference values of the two-sided 95% Student t quantile
+    for df, t in [[1, 12.706], [4, 2.776], [19, 2.093], [30, 2.042],
+                  [40, 2.021], [60, 2.000], [120, 1.980]]:
+        assert(abs(t_95(df) - t) < 0.001)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_summarize_ci():
+
+    metrics = [{'length': float(v), 'layers': None} for v in range(1, 6)]
+    res     = sim.summarize(metrics)
+
+    assert('layers' not in res)
+
+    half = 2.776 * math.sqrt(2.5 / 5)
+    assert(res['length']['n'] == 5)
+    assert(abs(res['length']['ci'][0] - (3 - half)) < 1e-9)
+    assert(abs(res['length']['ci'][1] - (3 + half)) < 1e-9)
+
+    res = sim.summarize(metrics, z=1.96)
+    assert(abs(res['length']['ci'][1] - (3 + 1.96 * math.sqrt(0.5))) < 1e-9)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_t_quantiles()
+    test_summarize_ci()
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,101 @@
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess as sp
+
+import numpy as np
+
+import hf.sim as sim
+
+TOOL = '%s/../bin/hf_sim_sample_props.py' \
+     % os.path.dirname(os.path.abspath(__file__))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_merge_files():
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        rng   = np.random.RandomState(1)
+        data  = [np.c_[rng.uniform(  0, 100, 1000), rng.uniform(0, 1, 1000)],
+                 np.c_[rng.uniform(100, 200, 1000), rng.uniform(0, 1, 1000)]]
+        fnames = list()
+        for n, arr in enumerate(data):
+            fname = '%s/col.%d.dat' % (tmp, n)
+            np.savetxt(fname, arr)
+            fnames.append(fname)
+
+        out = sp.check_output([sys.executable, TOOL, '-m', '-q', '-w', '2',
+                               '-j', '-'] + fnames)
+        res = json.loads(out)
+
+        assert(len(res['all']) == 2)
+
+        for col in range(2):
+            vals = np.concatenate([arr[:,col] for arr in data])
+            merged = res['all'][col]
+            assert(merged['n'] == 2000)
+            assert(sum(merged['counts']) == 2000)
+            assert(np.isclose(merged['mean'], vals.mean()))
+            assert(np.isclose(merged['min'],  vals.min()))
+            assert(np.isclose(merged['max'],  vals.max()))
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_binned_files():
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        cfg    = sim.get_cfg()
+        ctx    = sim.Context(path=tmp, seed=1)
+        farmer = sim.Farmer(cfg['farmer'], ctx=ctx)
+        farmer.plant(areas=[2])
+        farmer.harvest()
+        ctx.close()
+
+        ref    = ctx.results['stalk_len']
+        fnames = [fname for fname in sorted(os.listdir(tmp))
+                        if fname.endswith('_stalk_len.dat')]
+        assert(len(fnames) == 1)
+
+        out = sp.check_output([sys.executable, TOOL, '-q', '-j', '-',
+                               '%s/%s' % (tmp, fnames[0])])
+        res = list(json.loads(out).values())[0]
+
+        assert(len(res) == 1)
+        assert(res[0]['n']           == ref['n'])
+        assert(sum(res[0]['counts']) == ref['n'])
+        assert(abs(res[0]['mean'] - ref['mean']) < 0.01)
+        assert(abs(res[0]['std']  - ref['std'])  < 0.01)
+        assert(np.isclose(res[0]['min'], ref['min']))
+        assert(np.isclose(res[0]['max'], ref['max']))
+
+        # the median is within the accuracy of the bins and the sketch
+        width = ref['bins'][1] - ref['bins'][0]
+        assert(abs(res[0]['quantiles']['0.5'] - ref['quantiles'][0.5])
+               < width + 0.02 * ref['mean'])
+
+    finally:
+        shutil.rmtree(tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_merge_files()
+    test_binned_files()
+
+
+# ------------------------------------------------------------------------------
+
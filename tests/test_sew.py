@@ -0,0 +1,84 @@
+
+import numpy as np
+
+import hf.sim as sim
+
+
+# ------------------------------------------------------------------------------
+#
+def _bht(engine, seed, area=5):
+
+    cfg = sim.get_cfg()
+    cfg['farmer']['areas']      = [area]
+    cfg['stitcher']['engine']   = engine
+
+    return sim.run_pipeline(cfg, ctx=sim.Context(plot=False, seed=seed))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_step_event_equal():
+
+    for seed in [1, 2, 3]:
+
+        step  = _bht('step',  seed)
+        event = _bht('event', seed)
+
+        assert(step.rows == event.rows)
+
+        step_width,  step_layers  = step .columns()
+        event_width, event_layers = event.columns()
+
+        # the same layer decisions, widths up to the float32 rows of the step
+        # engine and the interpolation of the event engine
+        assert(np.array_equal(step_layers, event_layers))
+        assert(np.allclose(step_width, event_width, rtol=1e-5, atol=1e-4))
+
+        assert(np.array_equal(step .to_arrays()['joins'],
+                              event.to_arrays()['joins']))
+
+        length = step.rows * float(step.to_arrays()['res']) / 1000
+        for a, b in [[0, length], [0, length / 3], [length / 2, length]]:
+            sq = step .query(a, b)
+            eq = event.query(a, b)
+            assert(sorted(sq) == sorted(eq))
+            for key in sq:
+                assert(np.allclose(sq[key], eq[key], rtol=1e-5, atol=1e-4))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_sewer_chunks():
+
+    cfg = sim.get_cfg()
+    cfg['farmer']['areas'] = [5]
+
+    ctx      = sim.Context(plot=False, seed=4)
+    bast     = sim.peel_stalks(cfg, ctx, sim.grow_stalks(cfg, ctx))
+    stitcher = sim.splice_bast(cfg, ctx, bast)
+    spliced  = sim.BastBatch.from_arrays(
+                          sim.checkpoint.unpack('spliced', stitcher.checkpoint()))
+
+    ref   = sim.Sewer(cfg['stitcher'], ctx=ctx)
+    ref.feed(spliced)
+    ref   = ref.finish()
+
+    sewer = sim.Sewer(cfg['stitcher'], ctx=ctx)
+    for start in range(0, len(spliced), 1000):
+        sewer.feed(spliced[start:start + 1000])
+    bht   = sewer.finish()
+
+    for key, arr in ref.to_arrays().items():
+        assert(np.array_equal(arr, bht.to_arrays()[key]))
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_step_event_equal()
+    test_sewer_chunks()
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,112 @@
+
+import hf.sim as sim
+
+
+# ------------------------------------------------------------------------------
+#
+def _items_out(ctx, name):
+
+    return [rec.items_out for rec in ctx.instrument.records
+                          if rec.name == name]
+
+
+# ------------------------------------------------------------------------------
+#
+def test_farmer_twice():
+
+    cfg = sim.get_cfg()
+
+    ctx    = sim.Context(plot=False, seed=1)
+    farmer = sim.Farmer(cfg['farmer'], ctx=ctx)
+    farmer.plant(areas=[2])
+    farmer.harvest()
+    farmer.plant(areas=[3])
+    farmer.harvest()
+    stalks = farmer.get()
+
+    once   = sim.Context(plot=False, seed=1)
+    farmer = sim.Farmer(cfg['farmer'], ctx=once)
+    farmer.plant(areas=[2, 3])
+    farmer.harvest()
+
+    res = ctx .results
+    ref = once.results
+
+    assert(res['stalk_len']['n']     == len(stalks))
+    assert(res['stalk_dia']['n']     == len(stalks))
+    assert(res['stalk_len']['n']     == ref['stalk_len']['n'])
+    assert(res['stalk_density']['n'] == ref['stalk_density']['n'])
+
+
+# ------------------------------------------------------------------------------
+#
+def test_peeler_twice():
+
+    cfg    = sim.get_cfg()
+    ctx    = sim.Context(plot=False, seed=2)
+    farmer = sim.Farmer(cfg['farmer'], ctx=ctx)
+    farmer.plant(areas=[2])
+    farmer.harvest()
+    farmer.dry()
+    stalks = farmer.get()
+    half   = len(stalks) // 2
+
+    peeler = sim.Peeler(cfg['peeler'], ctx=ctx)
+    peeler.feed(stalks[:half])
+    peeler.select()
+    peeler.feed(stalks[half:])
+    peeler.select()
+    peeler.cut()
+
+    # the selected stalks are kept until cut
+    selected = _items_out(ctx, 'peeler.select')[-1]
+    res      = ctx.results
+
+    assert(res['stalk_len_selected']['n'] == selected)
+    assert(res['stalk_dia_selected']['n'] == selected)
+    assert(res['stalk_len_cut']     ['n'] == selected)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_stitcher_twice():
+
+    cfg  = sim.get_cfg()
+    ctx  = sim.Context(plot=False, seed=3)
+    bast = sim.BastBatch(w0=[10, 11, 12, 13, 14, 15],
+                         w1=[ 5,  6,  7,  8,  9, 10],
+                         length=[1000, 1100, 1200, 1300, 1400, 1500])
+
+    stitcher = sim.Stitcher(cfg['stitcher'], ctx=ctx)
+    stitcher.feed(bast[:3])
+    stitcher.feed(bast[3:])
+    stitcher.cut()
+    stitcher.splice()
+    stitcher.feed(bast[:3])
+    stitcher.cut()
+    stitcher.splice()
+
+    res = ctx.results
+
+    assert(res['bast_width_peel']['n'] == 9)
+    assert(res['bast_len_peel']  ['n'] == 9)
+
+    # cut bast is dropped when spliced, spliced bast is kept
+    cut     = sum(_items_out(ctx, 'stitcher.cut'))
+    spliced = _items_out(ctx, 'stitcher.splice')[-1]
+
+    assert(res['bast_len_cut']    ['n'] == cut)
+    assert(res['bast_len_spliced']['n'] == spliced)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_farmer_twice()
+    test_peeler_twice()
+    test_stitcher_twice()
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,132 @@
+
+import numpy as np
+
+import hf.sim as sim
+
+
+# ------------------------------------------------------------------------------
+#
+def _bins(hist, width):
+    '''
+    return the non-empty bins of a histogram at the given (coarser) width, as
+    dict of bin index to count
+    '''
+
+    hist = hist.copy()
+    while hist.width < width:
+        hist._coarsen()
+
+    assert(hist.width == width)
+
+    return dict([[hist.offset + int(i), int(hist.counts[i])]
+                 for i in np.nonzero(hist.counts)[0]])
+
+
+# ------------------------------------------------------------------------------
+#
+def _check_merge(chunks, nbins=100):
+
+    parts = list()
+    for chunk in chunks:
+        hist = sim.Histogram(nbins)
+        hist.update(chunk)
+        parts.append(hist)
+
+    merged = sim.Histogram(nbins)
+    for hist in parts:
+        merged.merge(hist)
+
+    single = sim.Histogram(nbins)
+    single.update(np.concatenate(chunks))
+
+    total = sum([len(chunk) for chunk in chunks])
+    width = max(merged.width, single.width)
+
+    assert(merged.counts.sum() == total)
+    assert(_bins(merged, width) == _bins(single, width))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_histogram_merge_adjacent():
+
+    rng = np.random.RandomState(1)
+    _check_merge([rng.uniform(  0, 100, 1000),
+                  rng.uniform(100, 200, 1000)])
+    _check_merge([rng.uniform(100, 200, 1000),
+                  rng.uniform(  0, 100, 1000)])
+
+
+# ------------------------------------------------------------------------------
+#
+def test_histogram_merge_disjoint():
+
+    rng = np.random.RandomState(2)
+    _check_merge([rng.uniform(    0,     1, 1000),
+                  rng.uniform( 1000,  1100, 1000),
+                  rng.uniform(-5000, -4000, 1000)])
+    _check_merge([rng.uniform(    0,    10,  100),
+                  rng.uniform(    0,     1,  100)], nbins=7)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_accumulator_merge():
+
+    rng   = np.random.RandomState(3)
+    data  = [rng.uniform(0, 100, 500), rng.uniform(100, 200, 500)]
+    accs  = list()
+    for chunk in data:
+        acc = sim.Accumulator()
+        acc.update(chunk)
+        accs.append(acc)
+
+    merged = sim.Accumulator()
+    for acc in accs:
+        merged.merge(acc)
+
+    res = merged.result()
+    assert(res['n'] == 1000)
+    assert(res['counts'].sum() == 1000)
+    assert(np.isclose(res['mean'], np.concatenate(data).mean()))
+
+
+# ------------------------------------------------------------------------------
+#
+def test_quantiles_signed():
+
+    rng    = np.random.RandomState(4)
+    values = np.concatenate([rng.normal(0, 100, 10000), np.zeros(100)])
+    parts  = np.array_split(values, 3)
+
+    sketch = sim.QuantileSketch(alpha=0.01)
+    for part in parts:
+        other = sim.QuantileSketch(alpha=0.01)
+        other.update(part)
+        sketch.merge(other)
+
+    assert(sketch.n == len(values))
+
+    for q in [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]:
+        exact = np.percentile(values, q * 100, interpolation='lower')
+        assert(abs(sketch.quantile(q) - exact) <= 0.011 * abs(exact))
+
+    neg = sim.QuantileSketch()
+    neg.update(-np.arange(1, 101))
+
+    assert(neg.quantile(0.0) < -99)
+    assert(neg.quantile(1.0) > -1.02)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    test_histogram_merge_adjacent()
+    test_histogram_merge_disjoint()
+    test_accumulator_merge()
+    test_quantiles_signed()
+
+
+# ------------------------------------------------------------------------------
+